@@ -4,11 +4,10 @@
 Gestionnaire d'utilisateurs avancé avec système d'approbation et licences personnalisées
 """
 
-import json
-import os
 import hashlib
 from datetime import datetime, timedelta
 from typing import Dict, Tuple, Optional
+from store import store
 
 class AdvancedUserManager:
     """Gestionnaire avancé avec approbation admin et licences personnalisées"""
@@ -69,12 +68,9 @@ class AdvancedUserManager:
         }
     
     def load_users(self) -> Dict:
-        """Charge les utilisateurs depuis le fichier JSON"""
+        """Charge les utilisateurs depuis le stockage"""
         try:
-            if os.path.exists(self.users_file):
-                with open(self.users_file, 'r', encoding='utf-8') as f:
-                    return json.load(f)
-            return {}
+            return store.users.all()
         except Exception as e:
             print(f"Erreur lecture utilisateurs: {e}")
             return {}
@@ -82,8 +78,7 @@ class AdvancedUserManager:
     def save_users(self) -> bool:
         """Sauvegarde les utilisateurs"""
         try:
-            with open(self.users_file, 'w', encoding='utf-8') as f:
-                json.dump(self.users, f, indent=2, ensure_ascii=False)
+            store.users.save_all(self.users)
             return True
         except Exception as e:
             print(f"Erreur sauvegarde utilisateurs: {e}")
@@ -143,6 +143,11 @@ class BotHandlers:
                 else:
                     await event.reply("❌ Utilisateur non trouvé")
                 return
+            
+            # Avancement de la restauration des sessions TeleFeed
+            restore_progress = self.get_restore_progress()
+            if restore_progress:
+                await event.reply(restore_progress, parse_mode="markdown")
         
         # Statut de l'utilisateur courant
         user_info = self.user_manager.get_user_info(user_id)
@@ -163,6 +168,23 @@ class BotHandlers:
         
         await event.reply(message, parse_mode="markdown")
     
+    def get_restore_progress(self):
+        """Texte d'avancement de la restauration des sessions TeleFeed (admin)"""
+        try:
+            from telefeed_commands import telefeed_manager
+        except Exception:
+            return None
+        
+        report = telefeed_manager.last_restore_report
+        if report is None:
+            return "🔄 *Sessions TeleFeed*\nRestauration pas encore démarrée"
+        
+        message = f"🔄 *Sessions TeleFeed*\n{report.progress()}\n"
+        if report.finished:
+            message += f"{report.summary()}\n"
+        message += f"📡 Comptes connectés : *{len(telefeed_manager.clients)}*"
+        return message
+    
     async def help_handler(self, event):
         """Handler pour la commande /help"""
         user_id = str(event.sender_id)
@@ -368,7 +390,7 @@ class BotHandlers:
             f"📂 **Fichiers de données :**\n"
             f"• users.json : {'✅' if os.path.exists('users.json') else '❌'}\n"
             f"• telefeed_sessions.json : {'✅' if os.path.exists('telefeed_sessions.json') else '❌'}\n"
-            f"• telefeed_redirections.json : {'✅' if os.path.exists('telefeed_redirections.json') else '❌'}"
+            f"• telefeed_accounts/ (données par compte) : {'✅' if os.path.isdir('telefeed_accounts') else '❌'}"
         )
         
         await event.reply(config_info, parse_mode='markdown')
@@ -378,21 +400,81 @@ class BotHandlers:
         if event.sender_id != ADMIN_ID:
             return
         
+        # /delay <action> <redirection> [valeur] [on <numéro>]
+        args = event.raw_text.split()[1:]
+        phone_number = None
+        if len(args) >= 2 and args[-2] == 'on':
+            phone_number = args[-1]
+            args = args[:-2]
+        if len(args) >= 2 and args[0] in ('set', 'show', 'remove', 'spread'):
+            await self.apply_delay_command(event, args[0], args[1], args[2:], phone_number)
+            return
+        
         await event.reply(
             "⏱️ **CONFIGURATION DES DÉLAIS**\n\n"
             "🔧 **Commandes disponibles :**\n"
             "• `/delay set <redirection> <secondes>` - Définir délai\n"
             "• `/delay show <redirection>` - Voir délai actuel\n"
-            "• `/delay remove <redirection>` - Supprimer délai\n\n"
+            "• `/delay remove <redirection>` - Supprimer délai\n"
+            "• `/delay spread <redirection> on|off` - Mode étalé\n"
+            "• Ajoutez `on <numéro>` pour ne viser qu'un compte\n\n"
             "📋 **Exemples :**\n"
             "• `/delay set test 5` - 5 secondes de délai\n"
             "• `/delay show test` - Voir délai de 'test'\n"
-            "• `/delay remove test` - Supprimer délai\n\n"
+            "• `/delay remove test` - Supprimer délai\n"
+            "• `/delay spread test on` - Messages d'une rafale espacés de 5 s\n\n"
             "💡 **Usage :**\n"
             "Les délais permettent d'espacer l'envoi des messages\n"
-            "redirigés pour éviter les limitations Telegram."
+            "redirigés pour éviter les limitations Telegram.\n"
+            "Les messages en attente sont conservés au redémarrage."
         )
     
+    async def apply_delay_command(self, event, action, redirection_id, values, phone_number):
+        """Exécute /delay set|show|remove|spread sur les redirections de ce nom"""
+        from telefeed_commands import telefeed_manager
+        
+        if action == 'show':
+            phones = telefeed_manager.accounts_with_redirection(redirection_id, phone_number)
+            if not phones:
+                await event.reply(f"❌ Redirection `{redirection_id}` introuvable", parse_mode='markdown')
+                return
+            message = f"⏱️ **Délai de {redirection_id}**\n\n"
+            for phone in phones:
+                delay = telefeed_manager.redirection_delay(phone, redirection_id)
+                spread = telefeed_manager.settings.get(phone, {}).get(redirection_id, {}).get('delay_spread_mode')
+                message += f"• {phone} : {f'{delay:g} s' if delay else 'aucun'}{' (étalé)' if spread else ''}\n"
+            await event.reply(message, parse_mode='markdown')
+            return
+        
+        if action == 'set':
+            try:
+                seconds = float(values[0])
+            except (IndexError, ValueError):
+                await event.reply("❌ Usage: `/delay set <redirection> <secondes>`", parse_mode='markdown')
+                return
+            if seconds < 0:
+                await event.reply("❌ Le délai doit être positif")
+                return
+            phones = telefeed_manager.set_delay(redirection_id, seconds, phone_number)
+            done = f"✅ Délai de {seconds:g} s pour `{redirection_id}`"
+        elif action == 'remove':
+            phones = telefeed_manager.set_delay(redirection_id, 0, phone_number)
+            done = f"✅ Délai supprimé pour `{redirection_id}`"
+        else:
+            if not values or values[0] not in ('on', 'off'):
+                await event.reply("❌ Usage: `/delay spread <redirection> on|off`", parse_mode='markdown')
+                return
+            phones = telefeed_manager.set_spread_mode(redirection_id, values[0] == 'on', phone_number)
+            done = f"✅ Mode étalé {'activé' if values[0] == 'on' else 'désactivé'} pour `{redirection_id}`"
+        
+        if not phones:
+            await event.reply(f"❌ Redirection `{redirection_id}` introuvable", parse_mode='markdown')
+            return
+        # Les comptes gérés par un worker relisent la configuration
+        for phone in phones:
+            await telefeed_manager.dispatch(phone, 'refresh_account', phone)
+        await event.reply(f"{done} ({', '.join(phones)})", parse_mode='markdown')
+    
     async def settings_handler(self, event):
         """Handler pour la commande /settings (admin seulement)"""
         if event.sender_id != ADMIN_ID:
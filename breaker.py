@@ -0,0 +1,125 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Disjoncteur par (compte, destination) pour les envois TeleFeed
+Après BREAKER_THRESHOLD échecs définitifs consécutifs (destination supprimée, compte
+exclu, droit d'écriture retiré), la destination est ignorée : plus de get_entity ni
+d'envoi voué à l'échec. Passé un délai, un seul message est laissé passer comme
+sonde ; un succès referme le disjoncteur, un échec le rouvre pour un délai doublé.
+"""
+
+import os
+import time
+
+# Échecs définitifs consécutifs avant l'ouverture
+BREAKER_THRESHOLD = int(os.getenv('BREAKER_THRESHOLD', '3'))
+# Délai (secondes) avant la première sonde, doublé à chaque sonde en échec, plafonné
+BREAKER_PROBE_INTERVAL = float(os.getenv('BREAKER_PROBE_INTERVAL', '600'))
+BREAKER_MAX_PROBE_INTERVAL = float(os.getenv('BREAKER_MAX_PROBE_INTERVAL', '21600'))
+
+CLOSED = 'closed'
+OPEN = 'open'
+HALF_OPEN = 'half_open'
+
+class CircuitOpenError(Exception):
+    """Envoi refusé : destination en échec définitif (disjoncteur ouvert)"""
+
+class Breaker:
+    """État du disjoncteur d'une destination"""
+
+    def __init__(self):
+        self.state = CLOSED
+        self.failures = 0
+        self.interval = BREAKER_PROBE_INTERVAL
+        self.retry_at = 0.0
+        self.skipped = 0
+        self.last_error = None
+
+    def allow(self, now):
+        if self.state == CLOSED:
+            return True
+        if now >= self.retry_at:
+            # Une seule sonde par délai (une sonde sans réponse n'en bloque pas une suivante)
+            self.state = HALF_OPEN
+            self.retry_at = now + self.interval
+            return True
+        self.skipped += 1
+        return False
+
+    def as_dict(self):
+        return {
+            'state': self.state,
+            'failures': self.failures,
+            'skipped': self.skipped,
+            'probe_in': max(0, round(self.retry_at - time.time())),
+            'error': self.last_error,
+        }
+
+class BreakerBoard:
+    """Disjoncteurs par (compte, destination)
+
+    failure() et success() retournent le nouvel état quand il change (OPEN ou
+    CLOSED), pour prévenir le propriétaire de la redirection.
+    """
+
+    def __init__(self, threshold=BREAKER_THRESHOLD, interval=BREAKER_PROBE_INTERVAL,
+                 max_interval=BREAKER_MAX_PROBE_INTERVAL):
+        self.threshold = threshold
+        self.interval = interval
+        self.max_interval = max_interval
+        self.breakers = {}
+
+    def allow(self, phone_number, destination):
+        breaker = self.breakers.get((phone_number, str(destination)))
+        return breaker is None or breaker.allow(time.time())
+
+    def is_open(self, phone_number, destination):
+        """Destination suspendue (sans déclencher de sonde)"""
+        breaker = self.breakers.get((phone_number, str(destination)))
+        return breaker is not None and breaker.state != CLOSED
+
+    def failure(self, phone_number, destination, error):
+        key = (phone_number, str(destination))
+        breaker = self.breakers.get(key)
+        if breaker is None:
+            breaker = self.breakers[key] = Breaker()
+        breaker.failures += 1
+        breaker.last_error = str(error) or type(error).__name__
+
+        if breaker.state == HALF_OPEN:
+            # Sonde en échec : délai suivant doublé
+            breaker.interval = min(self.max_interval, breaker.interval * 2)
+        elif breaker.state == CLOSED and breaker.failures >= self.threshold:
+            breaker.interval = self.interval
+        else:
+            return None
+        was_closed = breaker.state == CLOSED
+        breaker.state = OPEN
+        breaker.retry_at = time.time() + breaker.interval
+        return OPEN if was_closed else None
+
+    def inconclusive(self, phone_number, destination):
+        """Sonde en échec transitoire : nouvelle sonde après le même délai"""
+        breaker = self.breakers.get((phone_number, str(destination)))
+        if breaker is not None and breaker.state == HALF_OPEN:
+            breaker.state = OPEN
+            breaker.retry_at = time.time() + breaker.interval
+
+    def success(self, phone_number, destination):
+        breaker = self.breakers.pop((phone_number, str(destination)), None)
+        if breaker is not None and breaker.state != CLOSED:
+            return CLOSED
+        return None
+
+    def forget(self, phone_number):
+        """Oublie les disjoncteurs d'un compte (compte libéré ou supprimé)"""
+        for key in [key for key in self.breakers if key[0] == phone_number]:
+            del self.breakers[key]
+
+    def snapshot(self):
+        """Destinations en échec, pour /status"""
+        return {
+            f"{phone}->{destination}": breaker.as_dict()
+            for (phone, destination), breaker in list(self.breakers.items())
+            if breaker.state != CLOSED
+        }
@@ -5,8 +5,14 @@ Basé sur les captures d'écran et la documentation fournie
 
 from telethon import Button, events
 from telethon.tl.types import KeyboardButtonCallback
+from datetime import datetime
 import json
 
+try:
+    from store import store
+except ImportError:
+    from bot.store import store
+
 class ButtonInterface:
     """Gestionnaire des interfaces à boutons pour TeleFeed"""
     
@@ -52,6 +58,8 @@ class ButtonInterface:
                 await self.show_select_users_menu(event)
             elif data == 'scheduler_menu':
                 await self.show_scheduler_menu(event)
+            elif data.startswith('scheduler_'):
+                await self.handle_scheduler_action(event, data)
             elif data == 'watermark_menu':
                 await self.show_watermark_menu(event)
             elif data == 'chats_menu':
@@ -306,15 +314,53 @@ class ButtonInterface:
         
         message = (
             "📅 **Scheduler Menu**\n\n"
-            "Schedule your redirections to work at specific times.\n\n"
+            "Schedule posts from your connected accounts, once or on a recurring basis.\n\n"
             "**Options:**\n"
             "• Set: Create new schedule\n"
             "• Show: View active schedules\n\n"
-            "💡 **Example**: Only redirect messages during business hours."
+            "💡 **Example**: Post a daily message every morning at 08:00."
         )
         
         await event.edit(message, buttons=buttons, parse_mode='markdown')
     
+    async def handle_scheduler_action(self, event, data):
+        """Gère les actions du programmateur (création, liste, annulation)"""
+        from telefeed_commands import telefeed_manager
+        
+        if data == 'scheduler_set':
+            message = (
+                "📅 **Programmer une publication**\n\n"
+                "**Syntaxe :**\n"
+                "`/schedule <numéro> <destination> <quand> [every <intervalle>] | <texte>`\n\n"
+                "**Quand :** `+30m`, `+2h`, `HH:MM` ou `AAAA-MM-JJ HH:MM`\n"
+                "**Intervalle :** `30m`, `6h`, `1d`...\n\n"
+                "**Exemples :**\n"
+                "`/schedule 33612345678 -1001234567 08:00 every 1d | Bonjour à tous !`\n"
+                "`/schedule 33612345678 -1001234567 +2h | Rappel : live ce soir`"
+            )
+            buttons = [[Button.inline("🔙 Retour", b"scheduler_menu")]]
+        else:
+            if data.startswith('scheduler_cancel_'):
+                post_id = data[len('scheduler_cancel_'):]
+                if telefeed_manager.posts.cancel(post_id, event.sender_id):
+                    await event.answer(f"✅ Publication {post_id} annulée")
+                else:
+                    await event.answer("❌ Publication non trouvée", alert=True)
+            
+            posts = telefeed_manager.posts.list(event.sender_id)
+            message = f"📋 **Publications programmées** ({len(posts)})\n\n"
+            buttons = []
+            for post in posts[:20]:
+                moment = datetime.fromtimestamp(post['due_at']).strftime('%d/%m %H:%M')
+                repeat = " 🔁" if post['every'] else ""
+                message += f"• `{post['id']}` {moment}{repeat} → `{post['dest_id']}` : {post['text'][:40]}\n"
+                buttons.append([Button.inline(f"❌ Annuler {post['id']}", f"scheduler_cancel_{post['id']}".encode())])
+            if not posts:
+                message += "Aucune publication programmée."
+            buttons.append([Button.inline("🔙 Retour", b"scheduler_menu")])
+        
+        await event.edit(message, buttons=buttons, parse_mode='markdown')
+    
     async def show_watermark_menu(self, event):
         """Affiche le menu du watermark"""
         buttons = [
@@ -434,14 +480,16 @@ class ButtonInterface:
         await event.edit(message, buttons=buttons, parse_mode='markdown')
     
     def get_connected_phones(self):
-        """Récupère la liste des numéros connectés"""
-        # Placeholder - à implémenter selon votre logique
+        """Récupère la liste des numéros connectés (stockage unifié, JSON ou SQLite)"""
         try:
-            with open('telefeed_sessions.json', 'r') as f:
-                sessions = json.load(f)
-                return list(sessions.keys())
-        except:
-            return ["2759205517", "15417543010"]  # Exemples
+            sessions = store.repository('telefeed_sessions').all()
+        except Exception as e:
+            print(f"⚠️ Sessions TeleFeed illisibles: {e}")
+            return []
+        return [
+            phone for phone, session_data in sessions.items()
+            if isinstance(session_data, dict) and session_data.get('connected')
+        ]
     
     async def handle_phone_selection(self, event, data):
         """Gère la sélection d'un numéro de téléphone"""
@@ -0,0 +1,161 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Superviseur des connexions Telegram
+Vérifie périodiquement l'état de tous les clients (bot et comptes TeleFeed),
+reconnecte avec un délai exponentiel + jitter et publie des compteurs par compte
+"""
+
+import asyncio
+import logging
+import os
+import random
+import time
+from datetime import datetime
+
+logger = logging.getLogger(__name__)
+
+# Intervalle (secondes) entre deux vérifications de l'état des clients
+SUPERVISOR_INTERVAL = float(os.getenv('SUPERVISOR_INTERVAL', '15'))
+# Délai de reconnexion : base * 2^(échecs - 1), plafonné, avec jitter
+RECONNECT_BASE_DELAY = float(os.getenv('RECONNECT_BASE_DELAY', '2'))
+RECONNECT_MAX_DELAY = float(os.getenv('RECONNECT_MAX_DELAY', '300'))
+# Délai maximal (secondes) d'une tentative de reconnexion
+RECONNECT_TIMEOUT = float(os.getenv('RECONNECT_TIMEOUT', '30'))
+
+class ConnectionStats:
+    """Compteurs de connexion d'un client"""
+
+    def __init__(self):
+        self.connected_since = None
+        self.reconnects = 0
+        self.failures = 0
+        self.last_error = None
+        self.last_check = None
+        self.next_attempt = 0.0
+
+    def uptime(self):
+        if self.connected_since is None:
+            return 0
+        return round(time.monotonic() - self.connected_since)
+
+    def as_dict(self):
+        return {
+            'connected': self.connected_since is not None,
+            'uptime': self.uptime(),
+            'reconnects': self.reconnects,
+            'failures': self.failures,
+            'last_error': self.last_error,
+            'last_check': self.last_check,
+        }
+
+class ConnectionSupervisor:
+    """Tâche unique qui surveille tous les clients sur un minuteur"""
+
+    def __init__(self, interval=SUPERVISOR_INTERVAL, base_delay=RECONNECT_BASE_DELAY,
+                 max_delay=RECONNECT_MAX_DELAY, connect_timeout=RECONNECT_TIMEOUT):
+        self.interval = interval
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.connect_timeout = connect_timeout
+        self._checking = False
+        # Groupes surveillés : (fonction -> {nom: client}, rappel après reconnexion)
+        self._groups = []
+        self.stats = {}
+        self._task = None
+        self.enabled = True
+
+    def watch(self, clients, on_reconnect=None):
+        """Ajoute un groupe de clients à surveiller
+
+        clients() retourne le dict {nom: client} courant (il peut changer entre deux
+        vérifications). on_reconnect(nom, client) est une coroutine appelée après une
+        reconnexion réussie, pour rattacher les gestionnaires.
+        """
+        self._groups.append((clients, on_reconnect))
+
+    def backoff(self, failures):
+        """Délai avant la prochaine tentative (exponentiel, plafonné, jitter complet)"""
+        delay = min(self.max_delay, self.base_delay * 2 ** max(0, failures - 1))
+        return random.uniform(delay / 2, delay)
+
+    async def check_all(self):
+        """Vérifie tous les clients surveillés une fois (les reconnexions sont parallèles)"""
+        if self._checking:
+            return
+        self._checking = True
+        try:
+            checks = {}
+            for clients, on_reconnect in self._groups:
+                try:
+                    current = dict(clients())
+                except Exception as e:
+                    logger.error(f"Erreur superviseur (liste des clients): {e}")
+                    continue
+                for name, client in current.items():
+                    if client is not None:
+                        checks[name] = self._check(name, client, on_reconnect)
+            await asyncio.gather(*checks.values())
+        finally:
+            self._checking = False
+        seen = set(checks)
+
+        # Les comptes retirés ne sont plus suivis
+        for name in list(self.stats):
+            if name not in seen:
+                del self.stats[name]
+
+    async def _check(self, name, client, on_reconnect):
+        stats = self.stats.setdefault(name, ConnectionStats())
+        stats.last_check = datetime.now().isoformat()
+
+        if client.is_connected():
+            if stats.connected_since is None:
+                stats.connected_since = time.monotonic()
+            return
+
+        stats.connected_since = None
+        if not self.enabled or time.monotonic() < stats.next_attempt:
+            return
+
+        try:
+            logger.warning(f"Connexion perdue ({name}) - tentative de reconnexion")
+            await asyncio.wait_for(client.connect(), self.connect_timeout)
+            stats.connected_since = time.monotonic()
+            stats.reconnects += 1
+            stats.failures = 0
+            stats.last_error = None
+            logger.info(f"Reconnecté ({name}), reconnexion #{stats.reconnects}")
+            if on_reconnect is not None:
+                await on_reconnect(name, client)
+        except (Exception, asyncio.TimeoutError) as e:
+            stats.failures += 1
+            stats.last_error = str(e) or type(e).__name__
+            delay = self.backoff(stats.failures)
+            stats.next_attempt = time.monotonic() + delay
+            logger.error(f"Échec reconnexion ({name}): {e} - nouvel essai dans {delay:.0f}s")
+
+    async def run(self):
+        """Boucle de supervision"""
+        logger.info(f"Superviseur de connexions démarré (intervalle {self.interval}s)")
+        while True:
+            await self.check_all()
+            await asyncio.sleep(self.interval)
+
+    def start(self):
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self.run())
+        return self._task
+
+    async def stop(self):
+        if self._task is not None and not self._task.done():
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+        self._task = None
+
+    def snapshot(self):
+        """Compteurs par compte, pour /status"""
+        return {name: stats.as_dict() for name, stats in list(self.stats.items())}
@@ -1,54 +1,50 @@
 import logging
-import json
 import os
+import sys
 from datetime import datetime
 
+try:
+    from bot.store import store
+except ImportError:
+    from store import store
+
 logger = logging.getLogger(__name__)
 
-# Simple file-based storage for demo purposes
-DATA_FILE = "user_data.json"
+# Sections of the historical user_data.json, each one a store keyed by user_id
+SECTIONS = [
+    "licenses",
+    "connections",
+    "redirections",
+    "transformations",
+    "whitelists",
+    "blacklists",
+    "chats",
+    "pending_redirections"
+]
 
 def load_data():
-    """Load user data from file"""
-    if os.path.exists(DATA_FILE):
-        try:
-            with open(DATA_FILE, 'r') as f:
-                data = json.load(f)
-                # Ensure all required keys exist
-                if "pending_redirections" not in data:
-                    data["pending_redirections"] = {}
-                    save_data(data)  # Save updated structure
-                return data
-        except Exception as e:
-            logger.error(f"Error loading data: {e}")
-    return {
-        "licenses": {},
-        "connections": {},
-        "redirections": {},
-        "transformations": {},
-        "whitelists": {},
-        "blacklists": {},
-        "chats": {},
-        "pending_redirections": {}
-    }
+    """Load all user data (cached by the storage backend)"""
+    return {section: store.repository(section).all() for section in SECTIONS}
 
 def save_data(data):
-    """Save user data to file"""
+    """Save all user data through the storage backend"""
     try:
-        with open(DATA_FILE, 'w') as f:
-            json.dump(data, f, indent=2)
+        for section in SECTIONS:
+            store.repository(section).save_all(data.get(section, {}))
     except Exception as e:
         logger.error(f"Error saving data: {e}")
 
+def invalidate_cache():
+    """Drop cached data so the next load_data() reads the backend again"""
+    store.backend.invalidate()
+
 async def store_license(user_id, license_code):
     """Store validated license"""
-    data = load_data()
-    data["licenses"][str(user_id)] = {
+    store.licenses.put(user_id, {
         "license": license_code,
         "validated_at": datetime.now().isoformat(),
         "active": True
-    }
-    save_data(data)
+    })
     logger.info(f"License stored for user {user_id}")
 
 async def is_user_licensed(user_id):
@@ -60,47 +56,39 @@ async def is_user_licensed(user_id):
         return True
     
     # Check regular license
-    data = load_data()
-    user_license = data["licenses"].get(str(user_id))
+    user_license = store.licenses.get(user_id)
     return user_license and user_license.get("active", False)
 
 async def store_connection(user_id, phone_number):
     """Store successful phone connection - automatically replaces existing connection for same phone"""
-    data = load_data()
-    if str(user_id) not in data["connections"]:
-        data["connections"][str(user_id)] = []
-    
     # Check if phone already exists and remove it (automatic replacement)
-    data["connections"][str(user_id)] = [
-        conn for conn in data["connections"][str(user_id)] 
+    connections = [
+        conn for conn in store.connections.get(user_id, [])
         if conn["phone"] != phone_number
     ]
     
     # Add new connection with current timestamp
-    data["connections"][str(user_id)].append({
+    connections.append({
         "phone": phone_number,
         "connected_at": datetime.now().isoformat(),
         "active": True,
         "replaced_at": datetime.now().strftime("%d/%m/%Y %H:%M:%S")
     })
-    save_data(data)
+    store.connections.put(user_id, connections)
     logger.info(f"Connection stored/replaced for user {user_id}: {phone_number}")
 
 async def get_user_connections(user_id):
     """Get user's phone connections"""
-    data = load_data()
-    return data["connections"].get(str(user_id), [])
+    return store.connections.get(user_id, [])
 
 async def store_redirection(user_id, name, phone_number, action, channel_name=None, source_id=None, destination_id=None):
     """Store redirection rule"""
-    data = load_data()
-    if str(user_id) not in data["redirections"]:
-        data["redirections"][str(user_id)] = {}
+    user_redirections = store.redirections.get(user_id, {})
     
     if action == "add":
         # Check if a redirection with same phone already exists and replace it
         existing_redirection = None
-        for redir_name, redir_data in data["redirections"][str(user_id)].items():
+        for redir_name, redir_data in user_redirections.items():
             if redir_data.get("phone") == phone_number:
                 existing_redirection = redir_name
                 break
@@ -109,9 +97,9 @@ async def store_redirection(user_id, name, phone_number, action, channel_name=No
         replaced_info = ""
         if existing_redirection:
             replaced_info = f" (remplacé: {existing_redirection})"
-            del data["redirections"][str(user_id)][existing_redirection]
+            del user_redirections[existing_redirection]
         
-        data["redirections"][str(user_id)][name] = {
+        user_redirections[name] = {
             "phone": phone_number,
             "name": name,
             "channel_name": channel_name or name,
@@ -123,23 +111,22 @@ async def store_redirection(user_id, name, phone_number, action, channel_name=No
             "replacement_info": replaced_info
         }
     elif action == "remove":
-        if name in data["redirections"][str(user_id)]:
-            del data["redirections"][str(user_id)][name]
+        if name in user_redirections:
+            del user_redirections[name]
     elif action == "change":
-        if name in data["redirections"][str(user_id)]:
-            data["redirections"][str(user_id)][name]["phone"] = phone_number
-            data["redirections"][str(user_id)][name]["channel_name"] = channel_name or name
-            data["redirections"][str(user_id)][name]["source_id"] = source_id
-            data["redirections"][str(user_id)][name]["destination_id"] = destination_id
-            data["redirections"][str(user_id)][name]["updated_at"] = datetime.now().isoformat()
+        if name in user_redirections:
+            user_redirections[name]["phone"] = phone_number
+            user_redirections[name]["channel_name"] = channel_name or name
+            user_redirections[name]["source_id"] = source_id
+            user_redirections[name]["destination_id"] = destination_id
+            user_redirections[name]["updated_at"] = datetime.now().isoformat()
     
-    save_data(data)
+    store.redirections.put(user_id, user_redirections)
     logger.info(f"Redirection {action} for user {user_id}: {name} -> {channel_name or name}")
 
 async def get_user_redirections(user_id, phone_number):
     """Get user redirections for a phone number"""
-    data = load_data()
-    user_redirections = data["redirections"].get(str(user_id), {})
+    user_redirections = store.redirections.get(user_id, {})
     phone_redirections = []
     
     for name, redir in user_redirections.items():
@@ -154,26 +141,21 @@ async def get_user_redirections(user_id, phone_number):
 
 async def store_pending_redirection(user_id, name, phone_number):
     """Store pending redirection waiting for channel IDs"""
-    data = load_data()
-    data["pending_redirections"][str(user_id)] = {
+    store.pending_redirections.put(user_id, {
         "name": name,
         "phone_number": phone_number,
         "created_at": datetime.now().isoformat()
-    }
-    save_data(data)
+    })
     logger.info(f"Pending redirection stored for user {user_id}: {name} on {phone_number}")
 
 async def get_pending_redirection(user_id):
     """Get pending redirection for user"""
-    data = load_data()
-    return data["pending_redirections"].get(str(user_id))
+    return store.pending_redirections.get(user_id)
 
 async def clear_pending_redirection(user_id):
     """Clear pending redirection for user"""
-    data = load_data()
-    if str(user_id) in data["pending_redirections"]:
-        del data["pending_redirections"][str(user_id)]
-        save_data(data)
+    if store.pending_redirections.get(user_id) is not None:
+        store.pending_redirections.delete(user_id)
         logger.info(f"Pending redirection cleared for user {user_id}")
 
 async def get_user_chats_data(user_id, phone_number, chat_type=None):
@@ -296,4 +278,84 @@ async def get_user_chats_data(user_id, phone_number, chat_type=None):
     
     if chat_type:
         return [chat for chat in sample_chats if chat["type"] == chat_type]
-    return sample_chats
\ No newline at end of file
+    return sample_chats
+
+def bench(users=10000, rounds=200):
+    """Time load_data() and a license check with and without the backend cache
+
+    Runs against generated data in a temporary directory: the bot's data is never opened.
+    Usage: python database.py bench [users]
+    """
+    import asyncio
+    import json
+    import random
+    import tempfile
+    import time
+    try:
+        from bot.store import JsonBackend, SQLiteBackend, Store
+        from bot.storage import storage
+    except ImportError:
+        from store import JsonBackend, SQLiteBackend, Store
+        from storage import storage
+    global store
+
+    document = {section: {} for section in SECTIONS}
+    for index in range(users):
+        user_id = str(100000000 + index)
+        document['licenses'][user_id] = {'license': f"LIC{index:08d}", 'validated_at': '2024-01-01T00:00:00', 'active': True}
+        document['connections'][user_id] = [{'phone': f"+3360000{index:05d}", 'connected_at': '2024-01-01T00:00:00', 'active': True}]
+        document['redirections'][user_id] = {'main': {'source_id': -1000 - index, 'destination_id': -2000 - index, 'active': True}}
+    user_ids = list(document['licenses'])
+
+    def timed(label, read, count):
+        started = time.perf_counter()
+        for _ in range(count):
+            read()
+        elapsed = (time.perf_counter() - started) / count * 1000
+        print(f"{label:<44} {elapsed:8.3f} ms")
+        return elapsed
+
+    async def command(user_id):
+        # What a typical command handler reads
+        await is_user_licensed(user_id)
+        await get_user_connections(user_id)
+        await get_pending_redirection(user_id)
+
+    bot_store = store
+    previous = os.getcwd()
+    loop = asyncio.new_event_loop()
+    with tempfile.TemporaryDirectory() as directory:
+        os.chdir(directory)
+        try:
+            with open('user_data.json', 'w', encoding='utf-8') as f:
+                json.dump(document, f, ensure_ascii=False)
+            print(f"{users} users, user_data.json: {os.path.getsize('user_data.json') / 1e6:.1f} MB")
+
+            def reread():
+                with open('user_data.json', 'r', encoding='utf-8') as f:
+                    json.load(f)
+            baseline = timed("load_data without cache (file parse)", reread, max(1, rounds // 10))
+
+            sqlite_backend = SQLiteBackend(os.path.join(directory, 'bench.db'))
+            for section in SECTIONS:
+                Store(sqlite_backend).repository(section).save_all(document[section])
+            for backend in (JsonBackend(), sqlite_backend):
+                store = Store(backend)
+                load_data()
+                cached = timed(f"load_data with cache ({backend.name})", load_data, rounds)
+                keys = iter(random.sample(user_ids, min(users, rounds)))
+                timed(f"licensed command ({backend.name})",
+                      lambda: loop.run_until_complete(command(next(keys))), min(users, rounds))
+                print(f"{'  cache speedup':<44} x{baseline / cached:.0f}")
+            sqlite_backend.conn.close()
+            storage.flush_sync()
+        finally:
+            store = bot_store
+            loop.close()
+            os.chdir(previous)
+
+if __name__ == "__main__":
+    if sys.argv[1:2] == ["bench"]:
+        bench(int(sys.argv[2]) if len(sys.argv) > 2 else 10000)
+    else:
+        print("Usage: python database.py bench [users]")
@@ -0,0 +1,111 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Échecs d'envoi TeleFeed : classification, délais de nouvel essai et lettres mortes
+Un échec transitoire ou de limitation de débit est replanifié dans l'outbox (un
+essai par échéance) ; un échec définitif, ou trop d'essais, part dans les lettres
+mortes, consultables et rejouables par l'admin (/deadletters).
+"""
+
+import asyncio
+import hashlib
+import os
+import random
+import time
+from datetime import datetime
+
+from telethon.errors import (
+    AuthKeyError, BadRequestError, FloodError, FloodWaitError, ForbiddenError,
+    InvalidDCError, NotFoundError, ServerError, SlowModeWaitError, TimedOutError,
+    UnauthorizedError,
+)
+
+try:
+    from breaker import CircuitOpenError
+    from rate_limit import DestinationPaused
+    from store import store
+except ImportError:
+    from bot.breaker import CircuitOpenError
+    from bot.rate_limit import DestinationPaused
+    from bot.store import store
+
+# Nombre maximal d'essais d'un envoi avant les lettres mortes
+DELIVERY_MAX_ATTEMPTS = int(os.getenv('DELIVERY_MAX_ATTEMPTS', '8'))
+# Délai entre deux essais : base * 2^(essais - 1), plafonné, avec jitter
+RETRY_BASE_DELAY = float(os.getenv('RETRY_BASE_DELAY', '10'))
+RETRY_MAX_DELAY = float(os.getenv('RETRY_MAX_DELAY', '3600'))
+
+# Classes d'échec
+TRANSIENT = 'transient'
+RATE_LIMIT = 'rate_limit'
+PERMANENT = 'permanent'
+
+DEAD_LETTERS_STORE = 'telefeed_dead_letters'
+
+def classify_error(error):
+    """Classe une erreur d'envoi : transitoire, limitation de débit ou définitive"""
+    if isinstance(error, (FloodWaitError, SlowModeWaitError, FloodError, DestinationPaused)):
+        return RATE_LIMIT
+    if isinstance(error, (ServerError, TimedOutError, InvalidDCError,
+                          ConnectionError, OSError, asyncio.TimeoutError)):
+        return TRANSIENT
+    if isinstance(error, (BadRequestError, UnauthorizedError, ForbiddenError, NotFoundError,
+                          AuthKeyError, CircuitOpenError, ValueError, TypeError)):
+        # Destination introuvable, droits insuffisants, message invalide...
+        return PERMANENT
+    return TRANSIENT
+
+def retry_delay(error, attempts):
+    """Délai avant le prochain essai (attente imposée par Telegram si elle est connue)"""
+    seconds = getattr(error, 'seconds', None)
+    if seconds:
+        return float(seconds)
+    delay = min(RETRY_MAX_DELAY, RETRY_BASE_DELAY * 2 ** max(0, attempts - 1))
+    return random.uniform(delay / 2, delay)
+
+class DeadLetters:
+    """Envois abandonnés, par identifiant court (dépôt telefeed_dead_letters)"""
+
+    def __init__(self):
+        self.repository = store.repository(DEAD_LETTERS_STORE)
+
+    @staticmethod
+    def letter_id(phone_number, key):
+        return hashlib.sha1(f"{phone_number}:{key}".encode()).hexdigest()[:8]
+
+    def add(self, phone_number, record, error, kind):
+        letter_id = self.letter_id(phone_number, record['key'])
+        self.repository.put(letter_id, {
+            'phone_number': phone_number,
+            'key': record['key'],
+            'source_key': record['source_key'],
+            'dest_id': record['dest_id'],
+            'text': record['text'],
+            'attempts': record.get('attempts', 0),
+            'kind': kind,
+            'error': str(error) or type(error).__name__,
+            'failed_at': datetime.now().isoformat(),
+        })
+        return letter_id
+
+    def all(self):
+        return dict(sorted(self.repository.all().items(), key=lambda item: item[1]['failed_at']))
+
+    def pop(self, letter_id):
+        letter = self.repository.get(letter_id)
+        if letter is not None:
+            self.repository.delete(letter_id)
+        return letter
+
+    def __len__(self):
+        return len(self.repository.all())
+
+def retry_record(letter):
+    """Enregistrement d'outbox pour rejouer une lettre morte immédiatement"""
+    return {
+        'source_key': letter['source_key'],
+        'dest_id': letter['dest_id'],
+        'text': letter['text'],
+        'attempts': 0,
+        'next_attempt': time.time(),
+    }
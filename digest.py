@@ -0,0 +1,17 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Empreinte du contenu publié dans une destination (texte et média)
+Une édition dont le résultat est identique au dernier contenu publié n'est pas
+envoyée. Module sans dépendance : importable sans Telethon ni magasin de données.
+"""
+
+import hashlib
+
+def content_digest(text, media=None):
+    """Empreinte courte du texte et de l'identifiant du média"""
+    media_key = ''
+    if media is not None:
+        item = getattr(media, 'photo', None) or getattr(media, 'document', None)
+        media_key = f"{type(media).__name__}:{getattr(item, 'id', '')}"
+    return hashlib.sha1(f"{text or ''}\x00{media_key}".encode('utf-8')).hexdigest()[:16]
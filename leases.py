@@ -0,0 +1,290 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Baux de propriété des comptes TeleFeed pour un déploiement sur plusieurs nœuds
+Chaque compte est possédé par un seul nœud, qui renouvelle son bail dans le
+stockage partagé. Un nœud arrêté cesse de renouveler : ses comptes sont repris
+par les autres dès l'expiration des baux (LEASE_TTL secondes).
+
+Activation : LEASE_BACKEND=sqlite (fichier STORAGE_DB_FILE partagé entre les nœuds
+d'une même machine ou d'un même volume) ou LEASE_BACKEND=postgres (DATABASE_URL).
+Dans les deux cas, les données (sessions, outbox, marques de rattrapage) restent dans
+la base SQLite STORAGE_DB_FILE : STORAGE_BACKEND=sqlite est requis et tous les nœuds
+doivent partager ce fichier (même machine ou même volume). Postgres ne sert qu'aux
+baux ; un nœud sur une autre machine sans ce volume ne pourrait pas restaurer les
+comptes qu'il reprend.
+"""
+
+import asyncio
+import logging
+import math
+import os
+import socket
+import sqlite3
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+# Stockage des baux : '' (désactivé, un seul nœud), 'sqlite' ou 'postgres'
+LEASE_BACKEND = os.getenv('LEASE_BACKEND', '').lower()
+# Durée (secondes) d'un bail : délai maximal avant la reprise des comptes d'un nœud arrêté
+LEASE_TTL = float(os.getenv('LEASE_TTL', '15'))
+# Intervalle (secondes) entre deux renouvellements / tentatives d'acquisition
+LEASE_RENEW_INTERVAL = float(os.getenv('LEASE_RENEW_INTERVAL', '5'))
+# Identifiant de ce nœud (unique dans le déploiement)
+NODE_ID = os.getenv('NODE_ID') or f"{socket.gethostname()}-{os.getpid()}"
+
+# Bail du bot de commandes : un seul nœud répond aux commandes
+BOT_LEASE = 'bot'
+# Préfixe des baux de présence des nœuds (calcul de la part de chaque nœud)
+NODE_LEASE_PREFIX = 'node:'
+
+def leases_enabled():
+    """Baux actifs : nécessite les données partagées du backend SQLite"""
+    if LEASE_BACKEND not in ('sqlite', 'postgres'):
+        return False
+    try:
+        from store import STORAGE_BACKEND
+    except ImportError:
+        from bot.store import STORAGE_BACKEND
+    if STORAGE_BACKEND != 'sqlite':
+        logger.warning("LEASE_BACKEND ignoré : STORAGE_BACKEND=sqlite est requis (données partagées par les nœuds)")
+        return False
+    return True
+
+class SQLiteLeaseStore:
+    """Baux dans la base SQLite partagée (table leases)"""
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS leases (
+            resource TEXT PRIMARY KEY,
+            owner TEXT NOT NULL,
+            expires_at REAL NOT NULL,
+            epoch INTEGER NOT NULL DEFAULT 1
+        )
+    """
+    PARAM = '?'
+
+    def __init__(self, path=None):
+        if path is None:
+            try:
+                from store import STORAGE_DB_FILE
+            except ImportError:
+                from bot.store import STORAGE_DB_FILE
+            path = STORAGE_DB_FILE
+        self._lock = threading.Lock()
+        self.conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None, timeout=10)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute(self.SCHEMA)
+
+    def _execute(self, query, params=()):
+        with self._lock:
+            cursor = self.conn.execute(query.replace('%s', self.PARAM), params)
+            return cursor.rowcount, cursor.fetchall()
+
+    def try_acquire(self, resource, owner, ttl):
+        """Prend (ou prolonge) le bail s'il est libre, expiré ou déjà à ce nœud"""
+        now = time.time()
+        count, _ = self._execute(
+            "INSERT INTO leases (resource, owner, expires_at, epoch) VALUES (%s, %s, %s, 1) "
+            "ON CONFLICT (resource) DO UPDATE SET owner = excluded.owner, expires_at = excluded.expires_at, "
+            "epoch = leases.epoch + CASE WHEN leases.owner = excluded.owner THEN 0 ELSE 1 END "
+            "WHERE leases.owner = excluded.owner OR leases.expires_at < %s",
+            (resource, owner, now + ttl, now)
+        )
+        return count == 1
+
+    def renew(self, owner, ttl):
+        """Prolonge tous les baux valides du nœud et retourne les ressources encore possédées"""
+        now = time.time()
+        self._execute(
+            "UPDATE leases SET expires_at = %s WHERE owner = %s AND expires_at >= %s",
+            (now + ttl, owner, now)
+        )
+        _, rows = self._execute(
+            "SELECT resource FROM leases WHERE owner = %s AND expires_at >= %s", (owner, now)
+        )
+        return {row[0] for row in rows}
+
+    def release(self, resource, owner):
+        self._execute("DELETE FROM leases WHERE resource = %s AND owner = %s", (resource, owner))
+
+    def holders(self):
+        """{ressource: (propriétaire, expiration)} des baux valides"""
+        _, rows = self._execute(
+            "SELECT resource, owner, expires_at FROM leases WHERE expires_at >= %s", (time.time(),)
+        )
+        return {resource: (owner, expires_at) for resource, owner, expires_at in rows}
+
+    def close(self):
+        self.conn.close()
+
+class PostgresLeaseStore(SQLiteLeaseStore):
+    """Baux dans la base Postgres (DATABASE_URL), pour des nœuds sur plusieurs machines"""
+
+    PARAM = '%s'
+
+    def __init__(self, dsn=None):
+        import psycopg2
+        self._lock = threading.Lock()
+        self.conn = psycopg2.connect(dsn or os.getenv('DATABASE_URL'))
+        self.conn.autocommit = True
+        with self.conn.cursor() as cursor:
+            cursor.execute(self.SCHEMA.replace('REAL', 'DOUBLE PRECISION'))
+
+    def _execute(self, query, params=()):
+        with self._lock:
+            with self.conn.cursor() as cursor:
+                cursor.execute(query, params)
+                rows = cursor.fetchall() if cursor.description else []
+                return cursor.rowcount, rows
+
+def open_lease_store(backend=LEASE_BACKEND):
+    if backend == 'postgres':
+        return PostgresLeaseStore()
+    return SQLiteLeaseStore()
+
+class LeaseKeeper:
+    """Acquiert, renouvelle et libère les baux de ce nœud sur un minuteur
+
+    Un bail n'est considéré comme détenu localement que jusqu'à l'échéance du dernier
+    renouvellement réussi : si le stockage devient injoignable, le nœud cesse de
+    rediriger avant que les autres ne reprennent ses comptes.
+    """
+
+    def __init__(self, lease_store, node_id=NODE_ID, ttl=LEASE_TTL, interval=LEASE_RENEW_INTERVAL):
+        self.lease_store = lease_store
+        self.node_id = node_id
+        self.ttl = ttl
+        self.interval = interval
+        # ressource -> échéance locale (time.monotonic)
+        self.owned = {}
+        self.nodes = 1
+        self.takeovers = 0
+        self._task = None
+
+    def owns(self, resource):
+        deadline = self.owned.get(resource)
+        return deadline is not None and time.monotonic() < deadline
+
+    def owned_accounts(self):
+        return [resource for resource in self.owned
+                if resource != BOT_LEASE and not resource.startswith(NODE_LEASE_PREFIX)]
+
+    async def _call(self, method, *args):
+        return await asyncio.get_running_loop().run_in_executor(None, method, *args)
+
+    async def acquire(self, resource):
+        started = time.monotonic()
+        if await self._call(self.lease_store.try_acquire, resource, self.node_id, self.ttl):
+            self.owned[resource] = started + self.ttl
+            return True
+        return False
+
+    async def release(self, resource):
+        self.owned.pop(resource, None)
+        try:
+            await self._call(self.lease_store.release, resource, self.node_id)
+        except Exception as e:
+            logger.error(f"Erreur libération du bail {resource}: {e}")
+
+    async def wait_for(self, resource):
+        """Attend d'obtenir le bail (nœud en réserve tant qu'un autre le détient)"""
+        announced = False
+        while not await self.acquire(resource):
+            if not announced:
+                logger.info(f"Bail {resource} détenu par un autre nœud - {self.node_id} en réserve")
+                announced = True
+            await asyncio.sleep(self.interval)
+        logger.info(f"Bail {resource} acquis par {self.node_id}")
+
+    async def renew(self):
+        """Renouvelle les baux détenus et retourne ceux qui ont été perdus"""
+        started = time.monotonic()
+        still_owned = await self._call(self.lease_store.renew, self.node_id, self.ttl)
+        lost = [resource for resource in self.owned if resource not in still_owned]
+        for resource in lost:
+            del self.owned[resource]
+        for resource in still_owned:
+            self.owned[resource] = started + self.ttl
+        return lost
+
+    def fair_share(self, total, holders):
+        """Nombre de comptes que ce nœud doit détenir (répartition égale entre nœuds vivants)"""
+        nodes = {resource[len(NODE_LEASE_PREFIX):] for resource in holders
+                 if resource.startswith(NODE_LEASE_PREFIX)}
+        nodes.add(self.node_id)
+        self.nodes = len(nodes)
+        return math.ceil(total / self.nodes) if total else 0
+
+    async def balance(self, accounts, on_acquired, on_lost):
+        """Un cycle : renouvellement, puis acquisition ou cession pour atteindre sa part"""
+        for resource in await self.renew():
+            logger.warning(f"Bail {resource} perdu par {self.node_id}")
+            await on_lost(resource)
+
+        await self.acquire(NODE_LEASE_PREFIX + self.node_id)
+        holders = await self._call(self.lease_store.holders)
+        accounts = list(accounts)
+        share = self.fair_share(len(accounts), holders)
+        mine = [phone for phone in accounts if self.owns(phone)]
+
+        # Trop de comptes (un nœud vient d'arriver) : en céder un par cycle
+        if len(mine) > share:
+            phone = mine[-1]
+            logger.info(f"Cession du compte {phone} ({len(mine)}/{share})")
+            await on_lost(phone)
+            await self.release(phone)
+            return
+
+        # Comptes libres ou dont le bail a expiré (nœud arrêté)
+        for phone in accounts:
+            if len(mine) >= share:
+                break
+            if self.owns(phone) or phone in holders:
+                continue
+            if await self.acquire(phone):
+                mine.append(phone)
+                self.takeovers += 1
+                logger.info(f"Bail du compte {phone} acquis par {self.node_id}")
+                await on_acquired(phone)
+
+    async def run(self, accounts, on_acquired, on_lost):
+        """Boucle des baux : accounts() retourne les comptes à répartir"""
+        logger.info(f"Baux de comptes actifs (nœud {self.node_id}, durée {self.ttl}s)")
+        while True:
+            try:
+                await self.balance(accounts(), on_acquired, on_lost)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Erreur baux de comptes: {e}")
+            await asyncio.sleep(self.interval)
+
+    def start(self, accounts, on_acquired, on_lost):
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self.run(accounts, on_acquired, on_lost))
+        return self._task
+
+    async def stop(self):
+        """Arrêt propre : les baux sont libérés pour une reprise immédiate par les autres nœuds"""
+        if self._task is not None and not self._task.done():
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+        self._task = None
+        for resource in list(self.owned):
+            await self.release(resource)
+
+    def snapshot(self):
+        """État des baux de ce nœud, pour /status"""
+        return {
+            'node_id': self.node_id,
+            'nodes': self.nodes,
+            'leader': self.owns(BOT_LEASE),
+            'accounts': sorted(self.owned_accounts()),
+            'takeovers': self.takeovers,
+        }
@@ -5,6 +5,10 @@ import os
 if __name__ == "__main__":
     load_env()
 
+    # Migrate stored data (SQLite import, per-account split) before anything reads it
+    from bot.store import prepare_store
+    prepare_store()
+
     # Log deployment success message
     print("🚀 bot déployé avec succès")
 
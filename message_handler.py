@@ -2,6 +2,8 @@ import logging
 from telethon import events
 from bot.database import load_data
 from bot.connection import active_connections
+from bot.timers import EditCoalescer
+from bot.digest import content_digest
 from datetime import datetime
 
 logger = logging.getLogger(__name__)
@@ -12,6 +14,9 @@ class MessageRedirector:
     def __init__(self):
         self.redirection_clients = {}
         self.message_mapping = {}  # Maps original message ID to redirected message ID
+        self.message_digests = {}  # Digest of the last content delivered to each redirected message
+        # Rapid edits of the same source message are coalesced (latest version per window)
+        self.edits = EditCoalescer(self._send_edit)
         
     async def setup_redirection_handlers(self):
         """Setup message handlers for all active connections"""
@@ -52,7 +57,7 @@ class MessageRedirector:
                         # Create handler for edited messages
                         @client.on(events.MessageEdited(chats=int(source_id)))
                         async def edit_handler(event, dest_id=destination_id, redirect_name=name):
-                            await self._handle_message_redirection(event, dest_id, redirect_name, user_id, is_edit=True)
+                            await self._queue_edit(event, dest_id, redirect_name, user_id)
                         
                         setup_count += 1
                         logger.info(f"✅ Redirection '{name}' configurée: {source_id} -> {destination_id}")
@@ -63,6 +68,17 @@ class MessageRedirector:
             logger.error(f"Error setting up client handlers: {e}")
             return setup_count
     
+    async def _queue_edit(self, event, destination_id, redirect_name, user_id):
+        """Hold an edit until the end of its coalescing window (immediate if disabled)"""
+        key = (event.chat_id, event.id, destination_id)
+        if not self.edits.submit(key, (event, redirect_name, user_id)):
+            await self._send_edit(key, (event, redirect_name, user_id))
+    
+    async def _send_edit(self, key, edit):
+        """Apply the latest version of an edited source message"""
+        event, redirect_name, user_id = edit
+        await self._handle_message_redirection(event, key[2], redirect_name, user_id, is_edit=True)
+    
     async def _handle_message_redirection(self, event, destination_id, redirect_name, user_id, is_edit=False):
         """Handle individual message redirection"""
         try:
@@ -76,6 +92,12 @@ class MessageRedirector:
             message = event.message
             original_msg_id = message.id
             mapping_key = f"{event.chat_id}_{original_msg_id}_{destination_id}"
+            digest = content_digest(message.text, message.media)
+            
+            # Edit that leaves the delivered content unchanged: nothing to send
+            if is_edit and mapping_key in self.message_mapping and self.message_digests.get(mapping_key) == digest:
+                logger.debug(f"Unchanged edit skipped for {mapping_key}")
+                return
             
             # Get source and destination channel names for logging only
             source_name = await self._get_channel_name(client, event.chat_id)
@@ -89,6 +111,7 @@ class MessageRedirector:
                         # Edit the existing message
                         if message.text:
                             await client.edit_message(int(destination_id), redirected_msg_id, message.text)
+                            self.message_digests[mapping_key] = digest
                             action = "edited and updated"
                             logger.info(f"Message {action} from {event.chat_id} ({source_name}) to {destination_id} ({dest_name}) via {redirect_name}")
                             return
@@ -104,6 +127,7 @@ class MessageRedirector:
                             try:
                                 await client.delete_messages(int(destination_id), redirected_msg_id)
                                 del self.message_mapping[mapping_key]
+                                self.message_digests.pop(mapping_key, None)
                                 logger.info(f"Message deleted from {event.chat_id} to {destination_id} via {redirect_name}")
                                 return
                             except Exception as delete_error:
@@ -112,6 +136,7 @@ class MessageRedirector:
                     except Exception as edit_error:
                         # Check if it's just a "content not modified" error
                         if "Content of the message was not modified" in str(edit_error):
+                            self.message_digests[mapping_key] = digest
                             logger.info(f"Message content unchanged for edit in {event.chat_id} to {destination_id} via {redirect_name}")
                             return  # Don't send duplicate message
                         else:
@@ -143,6 +168,8 @@ class MessageRedirector:
                     self.message_mapping[mapping_key] = sent_message.id
                 elif isinstance(sent_message, list) and len(sent_message) > 0:
                     self.message_mapping[mapping_key] = sent_message[0].id
+            if sent_message and mapping_key in self.message_mapping:
+                self.message_digests[mapping_key] = digest
             
             action = "edited and redirected" if is_edit else "redirected"
             logger.info(f"Message {action} from {event.chat_id} ({source_name}) to {destination_id} ({dest_name}) via {redirect_name}")
@@ -190,7 +217,7 @@ class MessageRedirector:
             # Create handler for edited messages
             @client.on(events.MessageEdited(chats=int(source_id)))
             async def edit_handler(event, dest_id=destination_id, redirect_name=name):
-                await self._handle_message_redirection(event, dest_id, redirect_name, user_id, is_edit=True)
+                await self._queue_edit(event, dest_id, redirect_name, user_id)
             
             logger.info(f"Added message and edit handlers for redirection {name}: {source_id} -> {destination_id}")
             return True
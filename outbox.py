@@ -0,0 +1,232 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Journal d'envoi TeleFeed (outbox)
+Chaque envoi est écrit avant d'être transmis à Telegram, puis acquitté avec l'id du
+message créé. Au démarrage, les envois non acquittés sont rejoués ; la clé
+d'idempotence (message source + destination) empêche un double envoi. Un envoi
+différé (/delay) ou en échec transitoire y reste avec l'échéance de son prochain
+essai (next_attempt, voir timers.py et delivery.py).
+
+Backend JSON : journal en ajout seul telefeed_accounts/<téléphone>/outbox.jsonl, écrit
+par lots sur le thread d'E/S du stockage (un fsync par lot) ; synced() attend que
+les lignes d'un compte soient sur disque avant l'envoi
+Backend SQLite : table outbox de la base partagée
+"""
+
+import asyncio
+import logging
+import os
+import time
+
+try:
+    from storage import storage, dumps_compact, loads
+    from store import store, TELEFEED_ACCOUNTS_DIR
+except ImportError:
+    from bot.storage import storage, dumps_compact, loads
+    from bot.store import store, TELEFEED_ACCOUNTS_DIR
+
+logger = logging.getLogger(__name__)
+
+# Nombre d'acquittements avant le compactage du journal d'un compte
+OUTBOX_COMPACT_AFTER = int(os.getenv('OUTBOX_COMPACT_AFTER', '500'))
+
+PENDING = 'pending'
+ACKED = 'acked'
+
+class JsonlOutbox:
+    """Journal en ajout seul, un fichier par compte (écrit et synchronisé sur disque par lots)"""
+
+    FILENAME = 'outbox.jsonl'
+
+    def __init__(self, root=TELEFEED_ACCOUNTS_DIR):
+        self.root = root
+        # téléphone -> {clé: enregistrement}, dans l'ordre d'écriture
+        self._entries = {}
+        # téléphone -> écriture de la dernière ligne ajoutée (concurrent.futures.Future)
+        self._written = {}
+
+    def _path(self, phone_number):
+        return os.path.join(self.root, phone_number, self.FILENAME)
+
+    def _load(self, phone_number):
+        entries = self._entries.get(phone_number)
+        if entries is not None:
+            return entries
+        entries = self._entries[phone_number] = {}
+        try:
+            with open(self._path(phone_number), 'r', encoding='utf-8') as f:
+                lines = f.readlines()
+        except OSError:
+            return entries
+        for line in lines:
+            try:
+                event = loads(line)
+            except ValueError:
+                # Dernière ligne tronquée par un arrêt brutal
+                continue
+            op, key = event.pop('op'), event.pop('key')
+            if op == 'enqueue':
+                entries[key] = dict(event, key=key, state=PENDING)
+            elif op == 'ack' and key in entries:
+                entries[key].update(state=ACKED, message_id=event['message_id'])
+            elif op == 'retry' and key in entries:
+                entries[key].update(event)
+            elif op == 'drop':
+                entries.pop(key, None)
+        return entries
+
+    def _append(self, phone_number, event):
+        # Écriture sur le thread d'E/S ; l'envoi attend synced() avant de partir
+        self._written[phone_number] = storage.append(self._path(phone_number), dumps_compact(event) + '\n')
+
+    async def synced(self, phone_number):
+        """Attend que les lignes déjà ajoutées au journal du compte soient sur disque"""
+        written = self._written.get(phone_number)
+        if written is not None and not written.done():
+            await asyncio.wrap_future(written)
+        elif written is not None:
+            written.result()
+
+    def get(self, phone_number, key):
+        return self._load(phone_number).get(key)
+
+    def enqueue(self, phone_number, key, record):
+        """Inscrit un envoi ; False si la clé est déjà connue (envoi en cours ou fait)"""
+        entries = self._load(phone_number)
+        if key in entries:
+            return False
+        record = dict(record, created_at=time.time())
+        self._append(phone_number, dict(record, op='enqueue', key=key))
+        entries[key] = dict(record, key=key, state=PENDING)
+        return True
+
+    def ack(self, phone_number, key, message_id):
+        entries = self._load(phone_number)
+        self._append(phone_number, {'op': 'ack', 'key': key, 'message_id': message_id})
+        if key in entries:
+            entries[key].update(state=ACKED, message_id=message_id)
+
+    def drop(self, phone_number, key, reason=None):
+        entries = self._load(phone_number)
+        if entries.pop(key, None) is not None:
+            self._append(phone_number, {'op': 'drop', 'key': key, 'reason': reason})
+
+    def reschedule(self, phone_number, key, attempts, next_attempt, error=None):
+        """Planifie le prochain essai d'un envoi en échec"""
+        entries = self._load(phone_number)
+        if key not in entries:
+            return
+        retry = {'attempts': attempts, 'next_attempt': next_attempt, 'last_error': error}
+        self._append(phone_number, dict(retry, op='retry', key=key))
+        entries[key].update(retry)
+
+    def pending(self, phone_number):
+        return [record for record in self._load(phone_number).values() if record['state'] == PENDING]
+
+    def scheduled(self, phone_number):
+        """Envois en attente d'un nouvel essai"""
+        return [record for record in self.pending(phone_number) if record.get('next_attempt') is not None]
+
+    def acked(self, phone_number):
+        return [record for record in self._load(phone_number).values() if record['state'] == ACKED]
+
+    def compact(self, phone_number):
+        """Réécrit le journal avec les seuls envois non acquittés (le mapping fait foi pour les autres)"""
+        entries = self._load(phone_number)
+        pending = {key: record for key, record in entries.items() if record['state'] == PENDING}
+        if phone_number not in self._written and not os.path.exists(self._path(phone_number)):
+            return
+        lines = []
+        for key, record in pending.items():
+            event = {k: v for k, v in record.items() if k not in ('key', 'state')}
+            lines.append(dumps_compact(dict(event, op='enqueue', key=key)) + '\n')
+        self._written[phone_number] = storage.rewrite(self._path(phone_number), ''.join(lines))
+        self._entries[phone_number] = pending
+
+class SQLiteOutbox:
+    """Outbox dans la base SQLite du stockage unifié (une ligne par envoi)"""
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS outbox (
+            phone TEXT NOT NULL,
+            key TEXT NOT NULL,
+            data TEXT NOT NULL,
+            state TEXT NOT NULL,
+            message_id INTEGER,
+            created_at REAL NOT NULL,
+            PRIMARY KEY (phone, key)
+        )
+    """
+
+    def __init__(self, backend):
+        self.backend = backend
+        with backend._lock:
+            backend.conn.execute(self.SCHEMA)
+
+    def _execute(self, query, params=()):
+        with self.backend._lock:
+            cursor = self.backend.conn.execute(query, params)
+            return cursor.rowcount, cursor.fetchall()
+
+    @staticmethod
+    def _record(key, data, state, message_id, created_at):
+        return dict(loads(data), key=key, state=state, message_id=message_id, created_at=created_at)
+
+    async def synced(self, phone_number):
+        """Écritures SQLite synchrones : rien à attendre"""
+
+    def get(self, phone_number, key):
+        _, rows = self._execute(
+            "SELECT key, data, state, message_id, created_at FROM outbox WHERE phone = ? AND key = ?",
+            (phone_number, key)
+        )
+        return self._record(*rows[0]) if rows else None
+
+    def enqueue(self, phone_number, key, record):
+        count, _ = self._execute(
+            "INSERT OR IGNORE INTO outbox (phone, key, data, state, created_at) VALUES (?, ?, ?, ?, ?)",
+            (phone_number, key, dumps_compact(record), PENDING, time.time())
+        )
+        return count == 1
+
+    def ack(self, phone_number, key, message_id):
+        self._execute(
+            "UPDATE outbox SET state = ?, message_id = ? WHERE phone = ? AND key = ?",
+            (ACKED, message_id, phone_number, key)
+        )
+
+    def drop(self, phone_number, key, reason=None):
+        self._execute("DELETE FROM outbox WHERE phone = ? AND key = ?", (phone_number, key))
+
+    def reschedule(self, phone_number, key, attempts, next_attempt, error=None):
+        self._execute(
+            "UPDATE outbox SET data = json_set(data, '$.attempts', ?, '$.next_attempt', ?, '$.last_error', ?) "
+            "WHERE phone = ? AND key = ?",
+            (attempts, next_attempt, error, phone_number, key)
+        )
+
+    def _with_state(self, phone_number, state):
+        _, rows = self._execute(
+            "SELECT key, data, state, message_id, created_at FROM outbox "
+            "WHERE phone = ? AND state = ? ORDER BY created_at", (phone_number, state)
+        )
+        return [self._record(*row) for row in rows]
+
+    def pending(self, phone_number):
+        return self._with_state(phone_number, PENDING)
+
+    def acked(self, phone_number):
+        return self._with_state(phone_number, ACKED)
+
+    def scheduled(self, phone_number):
+        return [record for record in self.pending(phone_number) if record.get('next_attempt') is not None]
+
+    def compact(self, phone_number):
+        self._execute("DELETE FROM outbox WHERE phone = ? AND state = ?", (phone_number, ACKED))
+
+def open_outbox():
+    """Outbox du backend de stockage configuré"""
+    if store.backend.name == 'sqlite':
+        return SQLiteOutbox(store.backend)
+    return JsonlOutbox()
@@ -0,0 +1,90 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Connexions TeleFeed en attente du code d'authentification
+Indexées par utilisateur du bot, avec expiration qui déconnecte le client abandonné
+"""
+
+import asyncio
+import logging
+import os
+import time
+
+logger = logging.getLogger(__name__)
+
+# Durée de validité (secondes) d'une connexion en attente du code
+PENDING_AUTH_TTL = int(os.getenv('PENDING_AUTH_TTL', '300'))
+# Nombre maximal de connexions en attente simultanées
+PENDING_AUTH_MAX = int(os.getenv('PENDING_AUTH_MAX', '100'))
+
+class PendingAuthRegistry:
+    """Registre des connexions en attente : une entrée par sender_id"""
+
+    def __init__(self, ttl=PENDING_AUTH_TTL, max_pending=PENDING_AUTH_MAX):
+        self.ttl = ttl
+        self.max_pending = max_pending
+        # sender_id -> {'phone_number', 'phone_code_hash', 'client', 'created_at', 'timer'}
+        self._pending = {}
+
+    def __len__(self):
+        return len(self._pending)
+
+    def add(self, sender_id, phone_number, phone_code_hash, client):
+        """Enregistre une connexion en attente (remplace la précédente du même utilisateur)"""
+        self._drop(sender_id, disconnect=True)
+
+        # Borne le nombre de clients ouverts : la plus ancienne attente est abandonnée
+        while len(self._pending) >= self.max_pending:
+            oldest = min(self._pending, key=lambda key: self._pending[key]['created_at'])
+            logger.warning(f"Trop de connexions en attente, abandon de celle de {oldest}")
+            self._drop(oldest, disconnect=True)
+
+        entry = {
+            'phone_number': phone_number,
+            'phone_code_hash': phone_code_hash,
+            'client': client,
+            'created_at': time.monotonic(),
+        }
+        entry['timer'] = asyncio.get_running_loop().call_later(self.ttl, self._expire, sender_id, entry)
+        self._pending[sender_id] = entry
+        return entry
+
+    def get(self, sender_id):
+        """Connexion en attente de cet utilisateur (None si absente ou expirée)"""
+        return self._pending.get(sender_id)
+
+    def pop(self, sender_id):
+        """Retire l'entrée sans déconnecter le client (connexion aboutie)"""
+        return self._drop(sender_id, disconnect=False)
+
+    def discard(self, sender_id):
+        """Abandonne la connexion en attente et déconnecte son client"""
+        return self._drop(sender_id, disconnect=True)
+
+    def _drop(self, sender_id, disconnect):
+        entry = self._pending.pop(sender_id, None)
+        if entry is None:
+            return None
+        entry['timer'].cancel()
+        if disconnect:
+            asyncio.ensure_future(self._disconnect(entry))
+        return entry
+
+    def _expire(self, sender_id, entry):
+        """Appelé par le minuteur : l'entrée n'a pas été utilisée à temps"""
+        if self._pending.get(sender_id) is not entry:
+            return
+        logger.info(f"Connexion en attente expirée pour {entry['phone_number']} (utilisateur {sender_id})")
+        self._drop(sender_id, disconnect=True)
+
+    @staticmethod
+    async def _disconnect(entry):
+        try:
+            await entry['client'].disconnect()
+        except Exception as e:
+            logger.error(f"Erreur déconnexion client en attente {entry['phone_number']}: {e}")
+
+    async def clear(self):
+        """Abandonne toutes les connexions en attente (arrêt du bot)"""
+        entries = [self._drop(sender_id, disconnect=False) for sender_id in list(self._pending)]
+        await asyncio.gather(*(self._disconnect(entry) for entry in entries))
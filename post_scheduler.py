@@ -0,0 +1,534 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Programmateur de publications TeleFeed (menu Scheduler)
+Publications ponctuelles ou récurrentes, publiées par un compte connecté dans une
+destination. Les échéances sont dans une table indexée (due_at) ; une seule tâche
+dort jusqu'à la plus proche et se réveille dès qu'une publication plus proche est
+ajoutée : aucune boucle de scrutation, quel que soit le nombre de publications.
+
+Backend SQLite : table scheduled_posts de la base partagée (index sur l'échéance)
+Backend JSON : magasin telefeed_posts, index des échéances en mémoire (tas), dernier
+identifiant attribué dans telefeed_post_ids
+
+Vérification sur horloge simulée : python post_scheduler.py check [nombre]
+"""
+
+import asyncio
+import heapq
+import logging
+import math
+import os
+import re
+import sys
+import threading
+import time
+from datetime import datetime, timedelta
+from types import SimpleNamespace
+
+logger = logging.getLogger(__name__)
+
+# Publications traitées par réveil (les suivantes au réveil immédiat suivant)
+POST_BATCH = int(os.getenv('POST_BATCH', '200'))
+# Une publication ponctuelle en cours d'envoi est réservée pour ce délai (reprise après un arrêt brutal)
+POST_CLAIM_TIMEOUT = float(os.getenv('POST_CLAIM_TIMEOUT', '300'))
+# Réveil de contrôle (secondes) : publications ajoutées par un autre processus, comptes repris
+POST_RECHECK_INTERVAL = float(os.getenv('POST_RECHECK_INTERVAL', '60'))
+# Nombre maximal de publications par utilisateur
+POST_MAX_PER_TENANT = int(os.getenv('POST_MAX_PER_TENANT', '500'))
+
+POSTS_STORE = 'telefeed_posts'
+POST_IDS_STORE = 'telefeed_post_ids'
+
+FIELDS = ('id', 'tenant', 'phone', 'dest_id', 'text', 'due_at', 'every', 'runs', 'attempts', 'last_error', 'created_at')
+
+_DURATION = re.compile(r'^(\d+)([smhd])$')
+_UNITS = {'s': 1, 'm': 60, 'h': 3600, 'd': 86400}
+
+def parse_duration(text):
+    """'30m', '2h', '1d' -> secondes (None si invalide)"""
+    match = _DURATION.match(text.strip().lower())
+    if not match:
+        return None
+    return int(match.group(1)) * _UNITS[match.group(2)]
+
+def parse_post_time(text, now=None):
+    """'+30m', 'HH:MM' (prochaine occurrence) ou 'AAAA-MM-JJ HH:MM' -> timestamp (None si invalide)"""
+    now = time.time() if now is None else now
+    text = text.strip()
+    if text.startswith('+'):
+        delay = parse_duration(text[1:])
+        return None if delay is None else now + delay
+    try:
+        if re.match(r'^\d{1,2}:\d{2}$', text):
+            hour, minute = map(int, text.split(':'))
+            moment = datetime.fromtimestamp(now).replace(hour=hour, minute=minute, second=0, microsecond=0)
+            if moment.timestamp() <= now:
+                moment += timedelta(days=1)
+            return moment.timestamp()
+        return datetime.strptime(text, '%Y-%m-%d %H:%M').timestamp()
+    except ValueError:
+        return None
+
+def next_occurrence(due_at, every, now):
+    """Prochaine échéance d'une publication récurrente (les occurrences manquées ne sont pas rattrapées)"""
+    due_at += every
+    if due_at <= now:
+        due_at += math.ceil((now - due_at) / every) * every
+        if due_at <= now:
+            due_at += every
+    return due_at
+
+class SQLitePostStore:
+    """Publications dans la base SQLite (une ligne par publication, index sur l'échéance)"""
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS scheduled_posts (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            tenant TEXT NOT NULL,
+            phone TEXT NOT NULL,
+            dest_id INTEGER NOT NULL,
+            text TEXT NOT NULL,
+            due_at REAL NOT NULL,
+            every REAL,
+            runs INTEGER NOT NULL DEFAULT 0,
+            attempts INTEGER NOT NULL DEFAULT 0,
+            last_error TEXT,
+            created_at REAL NOT NULL
+        );
+        CREATE INDEX IF NOT EXISTS idx_scheduled_posts_due ON scheduled_posts (due_at);
+        CREATE INDEX IF NOT EXISTS idx_scheduled_posts_phone_due ON scheduled_posts (phone, due_at);
+        CREATE INDEX IF NOT EXISTS idx_scheduled_posts_tenant ON scheduled_posts (tenant);
+    """
+
+    def __init__(self, backend):
+        self.backend = backend
+        with backend._lock:
+            backend.conn.executescript(self.SCHEMA)
+
+    def _execute(self, query, params=()):
+        with self.backend._lock:
+            cursor = self.backend.conn.execute(query, params)
+            return cursor.lastrowid, cursor.fetchall()
+
+    @staticmethod
+    def _phones_clause(phones):
+        if phones is None:
+            return '', ()
+        return f" AND phone IN ({','.join('?' * len(phones))})", tuple(phones)
+
+    def _posts(self, where, params):
+        _, rows = self._execute(f"SELECT {', '.join(FIELDS)} FROM scheduled_posts WHERE {where}", params)
+        return [dict(zip(FIELDS, row)) for row in rows]
+
+    def insert(self, post):
+        columns = [field for field in FIELDS if field != 'id']
+        post_id, _ = self._execute(
+            f"INSERT INTO scheduled_posts ({', '.join(columns)}) VALUES ({', '.join('?' * len(columns))})",
+            tuple(post.get(field) for field in columns)
+        )
+        return post_id
+
+    def get(self, post_id):
+        posts = self._posts("id = ?", (int(post_id),))
+        return posts[0] if posts else None
+
+    def update(self, post_id, **changes):
+        assignments = ', '.join(f"{field} = ?" for field in changes)
+        self._execute(f"UPDATE scheduled_posts SET {assignments} WHERE id = ?", (*changes.values(), int(post_id)))
+
+    def delete(self, post_id):
+        self._execute("DELETE FROM scheduled_posts WHERE id = ?", (int(post_id),))
+
+    def next_due(self, phones=None):
+        if phones is not None and not phones:
+            return None
+        clause, params = self._phones_clause(phones)
+        _, rows = self._execute(f"SELECT MIN(due_at) FROM scheduled_posts WHERE 1 = 1{clause}", params)
+        return rows[0][0]
+
+    def due(self, now, phones=None, limit=POST_BATCH):
+        if phones is not None and not phones:
+            return []
+        clause, params = self._phones_clause(phones)
+        return self._posts(f"due_at <= ?{clause} ORDER BY due_at LIMIT ?", (now, *params, limit))
+
+    def by_tenant(self, tenant):
+        return self._posts("tenant = ? ORDER BY due_at", (str(tenant),))
+
+    def count(self, tenant=None):
+        if tenant is None:
+            _, rows = self._execute("SELECT COUNT(*) FROM scheduled_posts")
+        else:
+            _, rows = self._execute("SELECT COUNT(*) FROM scheduled_posts WHERE tenant = ?", (str(tenant),))
+        return rows[0][0]
+
+class JsonPostStore:
+    """Publications dans le magasin telefeed_posts ; échéances indexées par un tas par compte
+
+    Les entrées périmées (publication supprimée ou replanifiée) sont retirées quand
+    elles arrivent en tête de leur tas : la taille des tas reste bornée. Le dernier
+    identifiant attribué est conservé dans ids : l'identifiant d'une publication
+    supprimée n'est jamais réattribué (boutons d'annulation encore affichés).
+    """
+
+    def __init__(self, repository, ids):
+        self.repository = repository
+        self.ids = ids
+        self._heaps = {}
+        last_id = 0
+        for post in self.repository.all().values():
+            self._push(post)
+            last_id = max(last_id, int(post['id']))
+        if last_id > self.ids.get('last', 0):
+            # Publications antérieures au compteur
+            self.ids.put('last', last_id)
+
+    def _push(self, post):
+        heapq.heappush(self._heaps.setdefault(post['phone'], []), (post['due_at'], int(post['id'])))
+
+    def _current(self, due_at, post_id):
+        # Entrée du tas encore valide (publication ni supprimée ni replanifiée)
+        post = self.repository.get(post_id)
+        return post if post is not None and post['due_at'] == due_at else None
+
+    def _head(self, phone):
+        """Première entrée valide du tas du compte (les entrées périmées sont retirées)"""
+        heap = self._heaps.get(phone)
+        while heap and self._current(*heap[0]) is None:
+            heapq.heappop(heap)
+        if not heap:
+            self._heaps.pop(phone, None)
+            return None
+        return heap[0]
+
+    def _heads(self, phones):
+        heads = []
+        for phone in list(self._heaps) if phones is None else phones:
+            head = self._head(phone)
+            if head is not None:
+                heads.append((head[0], phone))
+        return heads
+
+    def insert(self, post):
+        # Compteur écrit avant la publication (même thread d'E/S, dans l'ordre)
+        post_id = self.ids.get('last', 0) + 1
+        self.ids.put('last', post_id)
+        post = dict(post, id=post_id)
+        self.repository.put(post_id, post)
+        self._push(post)
+        return post_id
+
+    def get(self, post_id):
+        return self.repository.get(post_id)
+
+    def update(self, post_id, **changes):
+        post = self.repository.get(post_id)
+        if post is None:
+            return
+        post = dict(post, **changes)
+        self.repository.put(post_id, post)
+        if 'due_at' in changes:
+            self._push(post)
+
+    def delete(self, post_id):
+        self.repository.delete(post_id)
+
+    def next_due(self, phones=None):
+        return min(self._heads(phones), default=(None,))[0]
+
+    def due(self, now, phones=None, limit=POST_BATCH):
+        # Fusion des tas des comptes gérés, dans l'ordre des échéances
+        heads = self._heads(phones)
+        heapq.heapify(heads)
+        posts = []
+        while heads and heads[0][0] <= now and len(posts) < limit:
+            _, phone = heapq.heappop(heads)
+            due_at, post_id = heapq.heappop(self._heaps[phone])
+            posts.append(self._current(due_at, post_id))
+            head = self._head(phone)
+            if head is not None:
+                heapq.heappush(heads, (head[0], phone))
+        return posts
+
+    def by_tenant(self, tenant):
+        return sorted((post for post in self.repository.all().values() if post['tenant'] == str(tenant)),
+                      key=lambda post: post['due_at'])
+
+    def count(self, tenant=None):
+        if tenant is None:
+            return len(self.repository.all())
+        return len(self.by_tenant(tenant))
+
+def open_post_store():
+    """Stockage des publications du backend configuré"""
+    # Import tardif : la vérification (check) n'ouvre pas le stockage du bot
+    try:
+        from store import store
+    except ImportError:
+        from bot.store import store
+    if store.backend.name == 'sqlite':
+        return SQLitePostStore(store.backend)
+    return JsonPostStore(store.repository(POSTS_STORE), store.repository(POST_IDS_STORE))
+
+class PostScheduler:
+    """Déclenche les publications à leur échéance
+
+    publish(post) publie une publication (coroutine). retry_after(erreur, essais)
+    retourne le délai avant un nouvel essai d'une publication ponctuelle, ou None
+    pour l'abandonner ; dropped(post, erreur) est alors appelé. phones() retourne les comptes gérés par ce processus (None :
+    tous). clock est injectable (vérification sur horloge simulée).
+    """
+
+    def __init__(self, post_store, publish, phones=None, retry_after=None, dropped=None, clock=time.time):
+        self.store = post_store
+        self.publish = publish
+        self.phones = phones or (lambda: None)
+        self.retry_after = retry_after or (lambda error, attempts: None)
+        self.dropped = dropped
+        self.clock = clock
+        self.published = 0
+        self.failed = 0
+        self.max_lateness = 0.0
+        # Prochaine échéance vue par la boucle (lue par snapshot depuis d'autres threads)
+        self.next_due = None
+        self._tasks = set()
+        self._wakeup = None
+
+    def _event(self):
+        if self._wakeup is None:
+            self._wakeup = asyncio.Event()
+        return self._wakeup
+
+    def wake(self):
+        """Réveille la boucle (publication ajoutée, compte repris)"""
+        self._event().set()
+
+    def add(self, tenant, phone_number, dest_id, text, due_at, every=None):
+        """Programme une publication ; retourne son identifiant"""
+        post_id = self.store.insert({
+            'tenant': str(tenant),
+            'phone': str(phone_number),
+            'dest_id': int(dest_id),
+            'text': text,
+            'due_at': float(due_at),
+            'every': float(every) if every else None,
+            'runs': 0,
+            'attempts': 0,
+            'last_error': None,
+            'created_at': self.clock(),
+        })
+        self.wake()
+        return post_id
+
+    def cancel(self, post_id, tenant=None):
+        post = self.store.get(post_id)
+        if post is None or (tenant is not None and post['tenant'] != str(tenant)):
+            return False
+        self.store.delete(post_id)
+        return True
+
+    def list(self, tenant):
+        return self.store.by_tenant(tenant)
+
+    async def run_due(self):
+        """Déclenche les publications échues ; retourne la prochaine échéance (ou None)"""
+        phones = self.phones()
+        now = self.clock()
+        posts = self.store.due(now, phones)
+        for post in posts:
+            self.max_lateness = max(self.max_lateness, now - post['due_at'])
+            if post['every']:
+                # Récurrente : l'occurrence suivante est planifiée avant l'envoi
+                self.store.update(post['id'], due_at=next_occurrence(post['due_at'], post['every'], now),
+                                  runs=post['runs'] + 1)
+            else:
+                # Ponctuelle : réservée le temps de l'envoi, supprimée une fois publiée
+                self.store.update(post['id'], due_at=now + POST_CLAIM_TIMEOUT, attempts=post['attempts'] + 1)
+            task = asyncio.ensure_future(self._fire(post))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+        if len(posts) >= POST_BATCH:
+            return now
+        return self.store.next_due(phones)
+
+    async def _fire(self, post):
+        try:
+            await self.publish(post)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            self.failed += 1
+            logger.warning(f"Publication {post['id']} ({post['phone']} -> {post['dest_id']}) en échec: {e}")
+            if post['every']:
+                self.store.update(post['id'], last_error=str(e))
+                return
+            delay = self.retry_after(e, post['attempts'] + 1)
+            if delay is None:
+                self.store.delete(post['id'])
+                if self.dropped is not None:
+                    self.dropped(post, e)
+            else:
+                self.store.update(post['id'], due_at=self.clock() + delay, last_error=str(e))
+                self.wake()
+            return
+        self.published += 1
+        if not post['every']:
+            self.store.delete(post['id'])
+
+    async def drain(self):
+        """Attend les publications en cours d'envoi (vérification, arrêt)"""
+        while self._tasks:
+            await asyncio.gather(*list(self._tasks), return_exceptions=True)
+
+    async def run(self):
+        """Boucle unique : dort jusqu'à la prochaine échéance ou jusqu'à un réveil"""
+        wakeup = self._event()
+        while True:
+            wakeup.clear()
+            try:
+                next_due = await self.run_due()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Erreur du programmateur de publications: {e}")
+                next_due = None
+            self.next_due = next_due
+            timeout = POST_RECHECK_INTERVAL
+            if next_due is not None:
+                timeout = min(timeout, max(0.0, next_due - self.clock()))
+            try:
+                await asyncio.wait_for(wakeup.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+
+    async def stop(self):
+        for task in list(self._tasks):
+            task.cancel()
+        await asyncio.gather(*list(self._tasks), return_exceptions=True)
+
+    def snapshot(self):
+        """État pour /status ; ne touche pas aux tas (appelable depuis le thread Flask)"""
+        next_due = self.next_due
+        return {
+            'scheduled': self.store.count(),
+            'published': self.published,
+            'failed': self.failed,
+            'next_in': None if next_due is None else max(0, round(next_due - self.clock(), 3)),
+            'max_lateness': round(self.max_lateness, 3),
+        }
+
+class ManualClock:
+    """Horloge simulée pour la vérification"""
+
+    def __init__(self, now=1_700_000_000.0):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+def memory_backend():
+    """Base SQLite en mémoire (vérification)"""
+    import sqlite3
+    conn = sqlite3.connect(':memory:', check_same_thread=False, isolation_level=None)
+    return SimpleNamespace(conn=conn, _lock=threading.RLock())
+
+def memory_repository():
+    """Magasin en mémoire, même interface que store.Repository (vérification)"""
+    data = {}
+    return SimpleNamespace(
+        all=lambda: data,
+        get=lambda key, default=None: data.get(str(key), default),
+        put=lambda key, value: data.__setitem__(str(key), value),
+        delete=lambda key: data.pop(str(key), None),
+    )
+
+async def check(count=20000, tenants=200, horizon=86400.0):
+    """Vérifie les deux stockages sur horloge simulée, puis la précision réelle"""
+    import random
+
+    # Échecs simulés attendus
+    logger.setLevel(logging.ERROR)
+    for name, post_store in (('SQLite', SQLitePostStore(memory_backend())),
+                             ('JSON', JsonPostStore(memory_repository(), memory_repository()))):
+        await check_simulated(name, post_store, count, tenants, horizon)
+
+    # Précision en temps réel : une seule tâche, échéances dans les 2 prochaines secondes
+    real = PostScheduler(SQLitePostStore(memory_backend()), None)
+    lateness = []
+
+    async def publish_now(post):
+        lateness.append(time.time() - post['due_at'])
+
+    real.publish = publish_now
+    task = asyncio.ensure_future(real.run())
+    now = time.time()
+    for index in range(2000):
+        real.add('tenant', '33000000', -100, 'post', now + random.uniform(0.1, 2.0))
+    await asyncio.sleep(2.5)
+    task.cancel()
+    await real.stop()
+    print(f"Temps réel : {len(lateness)} publications, retard max {max(lateness) * 1000:.1f} ms, "
+          f"moyen {sum(lateness) / len(lateness) * 1000:.1f} ms")
+    assert len(lateness) == 2000 and max(lateness) < 1.0
+    print("✅ Programmateur vérifié")
+
+async def check_simulated(name, post_store, count, tenants, horizon):
+    """Ordre, exactitude, récurrence et identifiants non réattribués sur horloge simulée"""
+    import random
+
+    random.seed(1)
+    clock = ManualClock()
+    start = clock.now
+    fired = []
+
+    async def publish(post):
+        fired.append((clock(), post['id'], post['due_at']))
+        if post['text'] == 'fail':
+            raise RuntimeError("échec simulé")
+
+    scheduler = PostScheduler(post_store, publish,
+                              retry_after=lambda error, attempts: 30 if attempts < 3 else None, clock=clock)
+
+    expected = 0
+    for index in range(count):
+        due_at = start + random.uniform(0, horizon)
+        every = 3600 if index % 10 == 0 else None
+        text = 'fail' if index % 997 == 0 and not every else f"post {index}"
+        scheduler.add(f"tenant{index % tenants}", f"3300000{index % 50}", -100 - index % 300, text, due_at, every)
+        if every:
+            expected += int((start + horizon - due_at) // every) + 1
+        elif text == 'fail':
+            expected += 3
+        else:
+            expected += 1
+
+    began = time.perf_counter()
+    while True:
+        next_due = scheduler.store.next_due()
+        if next_due is None or next_due > start + horizon:
+            break
+        clock.now = max(clock.now, next_due)
+        await scheduler.run_due()
+        await scheduler.drain()
+    elapsed = time.perf_counter() - began
+
+    late = [fire - due for fire, _, due in fired if fire - due > 1e-6]
+    ordered = all(fired[i][0] <= fired[i + 1][0] for i in range(len(fired) - 1))
+    remaining = scheduler.store.count()
+    print(f"{name} - horloge simulée : {len(fired)} publications (attendu {expected}), "
+          f"{len(late)} en retard, ordre {'OK' if ordered else 'KO'}, "
+          f"{remaining} restantes (récurrentes), {elapsed:.2f}s de calcul")
+    assert len(fired) == expected and not late and ordered
+    assert remaining == sum(1 for index in range(count) if index % 10 == 0)
+
+    # L'identifiant de la dernière publication supprimée n'est pas réattribué
+    last_id = scheduler.add('tenant', '33000000', -100, 'post', clock() + 60)
+    scheduler.cancel(last_id)
+    assert scheduler.add('tenant', '33000000', -100, 'post', clock() + 60) > last_id
+
+if __name__ == '__main__':
+    if len(sys.argv) >= 2 and sys.argv[1] == 'check':
+        asyncio.run(check(int(sys.argv[2]) if len(sys.argv) > 2 else 20000))
+    else:
+        print("Usage: python post_scheduler.py check [nombre]")
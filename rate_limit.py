@@ -0,0 +1,194 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Limitation du débit d'envoi TeleFeed
+Un seau à jetons par compte et un par (compte, destination). Un FloodWait s'applique
+à tout le compte : le compte et la destination sont mis en pause pendant la durée
+imposée et leur débit appris est réduit (un SlowModeWait ne concerne que la
+destination). L'erreur est propagée sans attendre sur place : l'envoi est replanifié
+dans l'outbox (delivery.py) à la fin de la pause. Pendant la pause, les envois
+concernés échouent tout de suite (DestinationPaused) et sont replanifiés de même.
+Le débit remonte progressivement vers sa valeur de base à chaque envoi réussi.
+"""
+
+import asyncio
+import logging
+import os
+import time
+
+from telethon.errors import FloodWaitError, SlowModeWaitError
+
+logger = logging.getLogger(__name__)
+
+# Débit de base (messages/seconde) et rafale maximale par compte
+SEND_RATE_ACCOUNT = float(os.getenv('SEND_RATE_ACCOUNT', '1'))
+SEND_BURST_ACCOUNT = int(os.getenv('SEND_BURST_ACCOUNT', '5'))
+# Débit de base et rafale par destination (Telegram limite à ~20 messages/minute par groupe)
+SEND_RATE_DESTINATION = float(os.getenv('SEND_RATE_DESTINATION', '0.33'))
+SEND_BURST_DESTINATION = int(os.getenv('SEND_BURST_DESTINATION', '3'))
+# Apprentissage : division du débit à chaque FloodWait, remontée par envoi réussi,
+# débit minimal (fraction du débit de base)
+FLOOD_BACKOFF = 0.5
+RATE_RECOVERY = 0.05
+MIN_RATE_FACTOR = 0.05
+
+class DestinationPaused(Exception):
+    """Destination en pause après un FloodWait : envoi à replanifier dans `seconds` secondes"""
+
+    def __init__(self, seconds):
+        super().__init__(f"destination en pause pendant {seconds:.0f}s (FloodWait)")
+        self.seconds = seconds
+
+class TokenBucket:
+    """Seau à jetons dont le débit s'adapte aux FloodWait"""
+
+    def __init__(self, rate, burst):
+        self.base_rate = rate
+        self.rate = rate
+        self.burst = burst
+        self.tokens = float(burst)
+        self.updated = time.monotonic()
+        self.paused_until = 0.0
+        self.floods = 0
+        self._lock = None
+
+    def _refill(self, now):
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    async def acquire(self):
+        """Attend un jeton (les envois sont servis dans l'ordre d'arrivée)
+
+        Pendant une pause imposée par Telegram, DestinationPaused est levée au lieu d'attendre.
+        """
+        if self._lock is None:
+            self._lock = asyncio.Lock()
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                if now < self.paused_until:
+                    raise DestinationPaused(self.paused_until - now)
+                self._refill(now)
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+
+    def paused_for(self):
+        return max(0.0, self.paused_until - time.monotonic())
+
+    def pause(self, seconds):
+        """Attente imposée par Telegram : aucun envoi avant son expiration"""
+        self.paused_until = max(self.paused_until, time.monotonic() + seconds)
+        self.tokens = 0.0
+
+    def slow_down(self):
+        self.rate = max(self.base_rate * MIN_RATE_FACTOR, self.rate * FLOOD_BACKOFF)
+        self.floods += 1
+
+    def success(self):
+        if self.rate < self.base_rate:
+            self.rate = min(self.base_rate, self.rate + self.base_rate * RATE_RECOVERY)
+
+    def as_dict(self):
+        return {
+            'rate': round(self.rate, 3),
+            'base_rate': self.base_rate,
+            'floods': self.floods,
+            'paused_for': max(0, round(self.paused_until - time.monotonic())),
+        }
+
+class RateLimiter:
+    """Seaux par compte et par (compte, destination)"""
+
+    def __init__(self, account_rate=SEND_RATE_ACCOUNT, account_burst=SEND_BURST_ACCOUNT,
+                 destination_rate=SEND_RATE_DESTINATION, destination_burst=SEND_BURST_DESTINATION):
+        self.account_rate = account_rate
+        self.account_burst = account_burst
+        self.destination_rate = destination_rate
+        self.destination_burst = destination_burst
+        self.accounts = {}
+        self.destinations = {}
+        # Un envoi à la fois par destination (ordre des messages conservé)
+        self.turns = {}
+        # Envois refusés par un FloodWait ou pendant la pause qui suit (replanifiés par l'appelant)
+        self.deferred = 0
+
+    def account(self, phone_number):
+        bucket = self.accounts.get(phone_number)
+        if bucket is None:
+            bucket = self.accounts[phone_number] = TokenBucket(self.account_rate, self.account_burst)
+        return bucket
+
+    def destination(self, phone_number, destination):
+        key = (phone_number, str(destination))
+        bucket = self.destinations.get(key)
+        if bucket is None:
+            bucket = self.destinations[key] = TokenBucket(self.destination_rate, self.destination_burst)
+        return bucket
+
+    async def call(self, phone_number, destination, request):
+        """Exécute un envoi sous les deux limites
+
+        request() crée la coroutine d'envoi. Un FloodWait met le compte et la destination
+        en pause et est propagé ; pendant la pause, DestinationPaused est levée sans attendre.
+        Aucun verrou n'est gardé pendant une attente imposée par Telegram.
+        """
+        account = self.account(phone_number)
+        target = self.destination(phone_number, destination)
+        paused = max(account.paused_for(), target.paused_for())
+        if paused > 0:
+            self.deferred += 1
+            raise DestinationPaused(paused)
+        turn = self.turns.get((phone_number, str(destination)))
+        if turn is None:
+            turn = self.turns[(phone_number, str(destination))] = asyncio.Lock()
+
+        # L'ordre des messages vers une destination est conservé
+        async with turn:
+            try:
+                # Pause commencée pendant l'attente du tour ou d'un jeton : pas d'attente
+                # sous le verrou. Destination d'abord : un jeton du compte n'est pas
+                # bloqué par une destination lente
+                await target.acquire()
+                await account.acquire()
+            except DestinationPaused:
+                self.deferred += 1
+                raise
+            try:
+                result = await request()
+            except (FloodWaitError, SlowModeWaitError) as e:
+                self.deferred += 1
+                target.pause(e.seconds)
+                target.slow_down()
+                if isinstance(e, FloodWaitError):
+                    # Limite du compte : aucun envoi du compte avant la fin de l'attente
+                    account.pause(e.seconds)
+                    account.slow_down()
+                logger.warning(
+                    f"FloodWait {e.seconds}s pour {phone_number} -> {destination}, envoi replanifié "
+                    f"(débit {target.rate:.2f}/s)"
+                )
+                raise
+            target.success()
+            account.success()
+            return result
+
+    def forget(self, phone_number):
+        """Oublie les seaux d'un compte (compte libéré ou supprimé)"""
+        self.accounts.pop(phone_number, None)
+        for key in [key for key in self.destinations if key[0] == phone_number]:
+            del self.destinations[key]
+            self.turns.pop(key, None)
+
+    def snapshot(self):
+        """Débits appris, pour /status"""
+        return {
+            'deferred': self.deferred,
+            'accounts': {phone: bucket.as_dict() for phone, bucket in list(self.accounts.items())},
+            'throttled_destinations': {
+                f"{phone}->{destination}": bucket.as_dict()
+                for (phone, destination), bucket in list(self.destinations.items())
+                if bucket.floods or bucket.rate < bucket.base_rate
+            },
+        }
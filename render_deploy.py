@@ -30,6 +30,16 @@ API_HASH = os.getenv('API_HASH', 'a8639172fa8d35dbfd8ea46286d349ab')
 BOT_TOKEN = os.getenv('BOT_TOKEN', '7573497633:AAHk9K15yTCiJP-zruJrc9v8eK8I9XhjyH4')
 ADMIN_ID = int(os.getenv('ADMIN_ID', '1190237801'))
 PORT = int(os.getenv('PORT', '10000'))
+# Nombre de tentatives de la restauration des sessions en arrière-plan
+RESTORE_ATTEMPTS = int(os.getenv('RESTORE_ATTEMPTS', '3'))
+
+# Migrations des données avant l'import des modules qui les chargent (telefeed_manager)
+from store import prepare_store
+prepare_store()
+
+from connection_supervisor import ConnectionSupervisor
+from sharding import ShardRouter, sharding_enabled
+from leases import BOT_LEASE, LeaseKeeper, leases_enabled, open_lease_store
 
 # Import des modules locaux
 try:
@@ -66,6 +76,20 @@ class CompleteTelefootBot:
         self.telefeed_active = False
         self.reactivation_count = 0
         self.auto_reactivation_active = True
+        # Restauration des sessions TeleFeed en tâche de fond
+        self.restore_task = None
+        # Surveillance des connexions (bot + comptes TeleFeed)
+        self.supervisor = ConnectionSupervisor()
+        # Déconnexion des comptes TeleFeed inactifs
+        self.idle_task = None
+        # Envois TeleFeed différés (/delay) et nouveaux essais des envois en échec
+        self.send_task = None
+        # Workers TeleFeed (SHARD_WORKERS > 0) : les comptes sont gérés hors de ce processus
+        self.router = None
+        # Plusieurs nœuds (LEASE_BACKEND) : baux des comptes et du bot de commandes
+        self.leases = None
+        # Arrêt demandé par signal (SIGTERM lors d'un redéploiement)
+        self.stop_requested = asyncio.Event()
     
     async def initialize(self):
         """Initialise le bot avec tous les composants"""
@@ -94,11 +118,22 @@ class CompleteTelefootBot:
             except:
                 logger.warning("ButtonInterface non disponible")
             
-            # TeleFeed
+            # TeleFeed : les commandes répondent immédiatement, les sessions
+            # sont restaurées en arrière-plan (chaque compte redirige dès qu'il est prêt)
             try:
                 await register_all_handlers(self.client, ADMIN_ID, API_ID, API_HASH)
-                await self.restore_telefeed_sessions()
                 self.telefeed_active = True
+                if self.leases is not None:
+                    # Plusieurs nœuds : les comptes sont connectés au fil de l'acquisition de leurs baux
+                    logger.info("Comptes TeleFeed répartis par baux entre les nœuds")
+                elif sharding_enabled():
+                    # Chaque worker restaure, supervise et met en veille ses propres comptes
+                    self.router = ShardRouter()
+                    self.router.on_notify = telefeed_manager.notify
+                    telefeed_manager.router = self.router
+                    self.router.start()
+                else:
+                    self.start_session_restore()
                 logger.info("TeleFeed activé")
             except Exception as e:
                 logger.warning(f"TeleFeed non disponible: {e}")
@@ -113,45 +148,128 @@ class CompleteTelefootBot:
             return False
     
     async def restore_telefeed_sessions(self):
-        """Restaure les sessions TeleFeed"""
+        """Restaure les sessions TeleFeed (en parallèle, voir restore.py)"""
+        from telefeed_commands import telefeed_manager
+        
+        report = await telefeed_manager.restore_existing_sessions()
+        logger.info(report.summary())
+        
+        slowest = report.slowest(3)
+        if slowest:
+            logger.info("Comptes les plus lents: " + ", ".join(f"{phone} ({duration}s)" for phone, duration in slowest))
+        return report
+    
+    def start_session_restore(self):
+        """Lance la restauration des sessions en tâche de fond (une seule à la fois)"""
+        if self.restore_task is not None and not self.restore_task.done():
+            logger.info("Restauration des sessions déjà en cours")
+            return self.restore_task
+        
+        self.restore_task = asyncio.create_task(self.supervise_session_restore())
+        return self.restore_task
+    
+    async def supervise_session_restore(self):
+        """Supervise la restauration : relance avec attente croissante en cas d'échec"""
+        for attempt in range(1, RESTORE_ATTEMPTS + 1):
+            try:
+                await self.restore_telefeed_sessions()
+                return
+            except asyncio.CancelledError:
+                logger.info("Restauration des sessions annulée")
+                raise
+            except Exception as e:
+                logger.error(f"Erreur restauration TeleFeed (tentative {attempt}/{RESTORE_ATTEMPTS}): {e}")
+                if attempt < RESTORE_ATTEMPTS:
+                    await asyncio.sleep(min(60, 5 * 2 ** (attempt - 1)))
+        logger.error("Restauration des sessions abandonnée")
+    
+    def restore_status(self):
+        """Avancement de la restauration des sessions, pour /status"""
         try:
             from telefeed_commands import telefeed_manager
-            
-            restored_count = 0
-            total_sessions = len(telefeed_manager.sessions)
-            
-            for phone_number, session_data in telefeed_manager.sessions.items():
-                if isinstance(session_data, dict) and session_data.get('connected'):
-                    try:
-                        session_name = f"telefeed_{phone_number}"
-                        
-                        if os.path.exists(f"{session_name}.session"):
-                            client = TelegramClient(session_name, API_ID, API_HASH)
-                            await client.connect()
-                            
-                            if await client.is_user_authorized():
-                                telefeed_manager.clients[phone_number] = client
-                                await telefeed_manager.setup_redirection_handlers(client, phone_number)
-                                restored_count += 1
-                                logger.info(f"Session restaurée: {phone_number}")
-                            else:
-                                await client.disconnect()
-                    except Exception as e:
-                        logger.error(f"Erreur restauration {phone_number}: {e}")
-            
-            telefeed_manager.save_all_data()
-            logger.info(f"Sessions restaurées: {restored_count}/{total_sessions}")
-            
-        except Exception as e:
-            logger.error(f"Erreur restauration TeleFeed: {e}")
+            report = telefeed_manager.last_restore_report
+        except Exception:
+            report = None
+        
+        if report is None:
+            return {"state": "pending"}
+        
+        status = report.as_dict()
+        status.pop('accounts', None)
+        status["state"] = "finished" if report.finished else "running"
+        return status
+    
+    def start_leases(self):
+        """Plusieurs nœuds : ce nœud redirige les comptes dont il détient le bail"""
+        from telefeed_commands import telefeed_manager
+        
+        self.leases = LeaseKeeper(open_lease_store())
+        telefeed_manager.leases = self.leases
+        self.supervisor.watch(
+            lambda: telefeed_manager.clients,
+            on_reconnect=telefeed_manager.on_client_reconnected
+        )
+        self.supervisor.start()
+        self.idle_task = asyncio.create_task(telefeed_manager.run_idle_policy())
+        self.send_task = asyncio.create_task(telefeed_manager.run_send_scheduler())
+        # restorable_accounts relit les sessions à chaque cycle : un compte connecté sur
+        # un autre nœud est réparti (et repris si ce nœud s'arrête)
+        self.leases.start(telefeed_manager.restorable_accounts, self.on_lease_acquired, self.on_lease_lost)
+    
+    async def on_lease_acquired(self, phone_number):
+        """Compte attribué à ce nœud (nouveau ou repris d'un nœud arrêté)"""
+        from telefeed_commands import telefeed_manager
+        
+        if self.stop_requested.is_set():
+            return
+        # Publications programmées du compte : désormais déclenchées par ce nœud
+        telefeed_manager.wake_posts()
+        if telefeed_manager.has_active_redirections(phone_number):
+            await telefeed_manager.ensure_client(phone_number)
+    
+    async def on_lease_lost(self, resource):
+        """Bail perdu : le compte (ou le bot) est désormais servi par un autre nœud"""
+        if resource == BOT_LEASE:
+            # Un autre nœud répond aux commandes : arrêt, le redémarrage repassera en réserve
+            logger.error("Bail du bot perdu - arrêt de ce nœud")
+            self.running = False
+            return
+        
+        from telefeed_commands import telefeed_manager
+        await telefeed_manager.release_account(resource)
+    
+    def request_stop(self):
+        """SIGTERM (redéploiement) : la boucle principale se termine par un arrêt propre"""
+        logger.info("Arrêt demandé par signal")
+        self.running = False
+        self.stop_requested.set()
     
     async def start(self):
         """Démarre le bot"""
+        loop = asyncio.get_running_loop()
+        try:
+            loop.add_signal_handler(signal.SIGTERM, self.request_stop)
+        except (NotImplementedError, RuntimeError):
+            # Hors du thread principal (redémarrage via /restart) ou plateforme sans signaux
+            pass
+        
+        if leases_enabled():
+            # Les comptes sont répartis dès maintenant ; les commandes attendent le bail du bot
+            self.start_leases()
+            standby = asyncio.create_task(self.leases.wait_for(BOT_LEASE))
+            stopping = asyncio.create_task(self.stop_requested.wait())
+            await asyncio.wait({standby, stopping}, return_when=asyncio.FIRST_COMPLETED)
+            stopping.cancel()
+            if not standby.done():
+                standby.cancel()
+                await self.stop()
+                return True
+        
         if not await self.initialize():
             logger.error("Échec d'initialisation")
             return False
         
-        self.running = True
+        self.running = not self.stop_requested.is_set()
         logger.info("Bot démarré")
         
         # Boucle principale
@@ -166,11 +284,53 @@ class CompleteTelefootBot:
         return True
     
     async def stop(self):
-        """Arrête le bot"""
+        """Arrête le bot proprement
+        
+        Ordre : plus de nouvelles connexions ni de nouveaux messages, fin des envois en
+        cours (DRAIN_TIMEOUT), sauvegarde et vidage du stockage, puis déconnexion.
+        Les messages non traités sont repris au démarrage suivant (rattrapage).
+        """
         self.running = False
         
+        await self.supervisor.stop()
+        
+        if self.idle_task is not None:
+            self.idle_task.cancel()
+        if self.send_task is not None:
+            self.send_task.cancel()
+        
+        if self.restore_task is not None and not self.restore_task.done():
+            self.restore_task.cancel()
+            try:
+                await self.restore_task
+            except (asyncio.CancelledError, Exception):
+                pass
+        
+        # Les workers terminent leurs propres envois avant de s'arrêter
+        if self.router is not None:
+            try:
+                await self.router.stop()
+            except Exception as e:
+                logger.error(f"Erreur arrêt des workers: {e}")
+        
         try:
-            if self.telefeed_active:
+            from telefeed_commands import telefeed_manager
+            # Connexions en attente du code : clients à fermer
+            await telefeed_manager.pending_auth.clear()
+            if self.telefeed_active or self.leases is not None:
+                await telefeed_manager.drain()
+        except Exception as e:
+            logger.error(f"Erreur arrêt du routage TeleFeed: {e}")
+        
+        # Écritures (mapping, marques des sources) terminées avant la déconnexion
+        try:
+            from storage import storage
+            await storage.flush()
+        except Exception as e:
+            logger.error(f"Erreur vidage stockage: {e}")
+        
+        try:
+            if self.telefeed_active or self.leases is not None:
                 from telefeed_commands import telefeed_manager
                 for client in telefeed_manager.clients.values():
                     try:
@@ -180,6 +340,10 @@ class CompleteTelefootBot:
         except:
             pass
         
+        # Clients fermés : les baux peuvent être repris immédiatement par les autres nœuds
+        if self.leases is not None:
+            await self.leases.stop()
+
         if self.client:
             try:
                 await self.client.disconnect()
@@ -196,10 +360,17 @@ class CompleteTelefootBot:
             async def reactivation_handler(event):
                 await self.handle_reactivation_message(event)
             
-            # Handler pour surveiller les déconnexions
-            @self.client.on(events.Raw)
-            async def connection_handler(event):
-                await self.monitor_connection_status()
+            # Superviseur : vérifie les connexions sur un minuteur (et non à chaque mise à jour)
+            self.supervisor.watch(lambda: {'bot': self.client})
+            if self.telefeed_active and self.router is None and self.leases is None:
+                from telefeed_commands import telefeed_manager
+                self.supervisor.watch(
+                    lambda: telefeed_manager.clients,
+                    on_reconnect=telefeed_manager.on_client_reconnected
+                )
+                self.idle_task = asyncio.create_task(telefeed_manager.run_idle_policy())
+                self.send_task = asyncio.create_task(telefeed_manager.run_send_scheduler())
+            self.supervisor.start()
             
             logger.info("Système de réactivation automatique configuré")
             
@@ -229,13 +400,12 @@ class CompleteTelefootBot:
         try:
             logger.info("Redémarrage des composants...")
             
-            # Restaurer les sessions TeleFeed
-            if self.telefeed_active:
-                await self.restore_telefeed_sessions()
+            # Restaurer les sessions TeleFeed (en arrière-plan ; les workers restaurent les leurs)
+            if self.telefeed_active and self.router is None and self.leases is None:
+                self.start_session_restore()
             
-            # Vérifier la connexion
-            if not self.client.is_connected():
-                await self.client.connect()
+            # Vérifier toutes les connexions
+            await self.monitor_connection_status()
                 
             logger.info("Composants redémarrés avec succès")
             
@@ -259,11 +429,10 @@ class CompleteTelefootBot:
             logger.error(f"Erreur notification admin: {e}")
     
     async def monitor_connection_status(self):
-        """Surveille l'état de la connexion"""
+        """Vérifie immédiatement l'état de toutes les connexions (voir ConnectionSupervisor)"""
         try:
-            if not self.client.is_connected() and self.auto_reactivation_active:
-                logger.warning("Connexion perdue - Tentative de reconnexion...")
-                await self.client.connect()
+            self.supervisor.enabled = self.auto_reactivation_active
+            await self.supervisor.check_all()
                 
         except Exception as e:
             logger.error(f"Erreur surveillance connexion: {e}")
@@ -298,6 +467,16 @@ def bot_status():
         "telefeed_active": bot_instance.telefeed_active,
         "reactivation_count": bot_instance.reactivation_count,
         "auto_reactivation_active": bot_instance.auto_reactivation_active,
+        "session_restore": bot_instance.restore_status(),
+        "connections": bot_instance.supervisor.snapshot(),
+        "shards": bot_instance.router.status() if bot_instance.router else None,
+        "leases": bot_instance.leases.snapshot() if bot_instance.leases else None,
+        "rate_limits": telefeed_manager.limiter.snapshot() if bot_instance.telefeed_active else None,
+        "dead_letters": len(telefeed_manager.dead_letters) if bot_instance.telefeed_active else None,
+        "open_breakers": telefeed_manager.breakers.snapshot() if bot_instance.telefeed_active else None,
+        "send_queue": telefeed_manager.timers.snapshot() if bot_instance.telefeed_active else None,
+        "edit_coalescing": telefeed_manager.edits.snapshot() if bot_instance.telefeed_active else None,
+        "scheduled_posts": telefeed_manager.posts.snapshot() if bot_instance.telefeed_active else None,
         "components": {
             "user_manager": bot_instance.user_manager is not None,
             "advanced_user_manager": bot_instance.advanced_user_manager is not None,
@@ -0,0 +1,143 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Restauration concurrente des sessions Telegram
+Les comptes sont reconnectés en parallèle sous un sémaphore, avec un délai maximal par compte
+"""
+
+import asyncio
+import logging
+import os
+import time
+from datetime import datetime
+
+logger = logging.getLogger(__name__)
+
+# Nombre de comptes restaurés simultanément
+RESTORE_CONCURRENCY = int(os.getenv('RESTORE_CONCURRENCY', '10'))
+# Délai maximal (secondes) pour restaurer un compte
+RESTORE_TIMEOUT = float(os.getenv('RESTORE_TIMEOUT', '30'))
+
+# Statuts de restauration
+RESTORED = 'restored'
+EXPIRED = 'expired'
+MISSING = 'missing'
+FAILED = 'failed'
+ERROR = 'error'
+TIMEOUT = 'timeout'
+# Compte non connecté au démarrage (aucune redirection active), activé à la demande
+DEFERRED = 'deferred'
+
+STATUS_LABELS = {
+    RESTORED: 'restaurées',
+    EXPIRED: 'expirées',
+    MISSING: 'fichiers manquants',
+    FAILED: 'échecs',
+    ERROR: 'erreurs',
+    TIMEOUT: 'délais dépassés',
+    DEFERRED: 'différées',
+}
+
+class RestoreReport:
+    """Résultat d'une restauration : statut, durée et erreur éventuelle par compte"""
+
+    def __init__(self, total=0):
+        self.total = total
+        self.started_at = datetime.now()
+        self.duration = None
+        # compte -> {'status': ..., 'duration': ..., 'error': ...}
+        self.accounts = {}
+
+    @property
+    def finished(self):
+        return self.duration is not None
+
+    def record(self, label, status, duration, error=None):
+        self.accounts[label] = {'status': status, 'duration': round(duration, 2), 'error': error}
+
+    def with_status(self, status):
+        return [label for label, result in list(self.accounts.items()) if result['status'] == status]
+
+    @property
+    def restored(self):
+        return self.with_status(RESTORED)
+
+    def counts(self):
+        counts = {}
+        for result in list(self.accounts.values()):
+            counts[result['status']] = counts.get(result['status'], 0) + 1
+        return counts
+
+    def slowest(self, limit=5):
+        """Comptes les plus lents (ce sont eux qui bornent la durée totale)"""
+        ranked = sorted(list(self.accounts.items()), key=lambda item: item[1]['duration'], reverse=True)
+        return [(label, result['duration']) for label, result in ranked[:limit]]
+
+    def progress(self):
+        """Avancement d'une restauration en cours (ou terminée)"""
+        state = "terminée" if self.finished else "en cours"
+        return (f"Restauration {state}: {len(self.accounts)}/{self.total} comptes traités, "
+                f"{len(self.restored)} restaurés")
+
+    def summary(self):
+        counts = self.counts()
+        details = ", ".join(
+            f"{STATUS_LABELS.get(status, status)}: {count}"
+            for status, count in counts.items() if status != RESTORED
+        )
+        text = f"Sessions restaurées: {counts.get(RESTORED, 0)}/{self.total}"
+        if details:
+            text += f" ({details})"
+        if self.duration is not None:
+            text += f" en {self.duration:.1f}s"
+        return text
+
+    def as_dict(self):
+        """Vue sérialisable (lisible depuis le thread Flask pendant la restauration)"""
+        return {
+            'started_at': self.started_at.isoformat(),
+            'finished': self.finished,
+            'done': len(self.accounts),
+            'duration': self.duration,
+            'total': self.total,
+            'counts': self.counts(),
+            'slowest': self.slowest(),
+            'accounts': dict(self.accounts),
+        }
+
+async def restore_concurrently(items, restore_one, label=str, report=None,
+                               concurrency=RESTORE_CONCURRENCY, timeout=RESTORE_TIMEOUT):
+    """Restaure tous les comptes en parallèle et retourne un RestoreReport
+
+    restore_one(item) est une coroutine qui retourne un statut (RESTORED, EXPIRED...)
+    ou un booléen (True = restauré, False = échec). Une exception ou un dépassement
+    de délai n'interrompt pas la restauration des autres comptes. Le rapport peut
+    être fourni par l'appelant pour suivre l'avancement pendant la restauration.
+    """
+    items = list(items)
+    if report is None:
+        report = RestoreReport(total=len(items))
+    semaphore = asyncio.Semaphore(max(1, concurrency))
+    started = time.monotonic()
+
+    async def run(item):
+        name = label(item)
+        async with semaphore:
+            account_started = time.monotonic()
+            try:
+                result = await asyncio.wait_for(restore_one(item), timeout)
+                if result is True:
+                    result = RESTORED
+                elif not result:
+                    result = FAILED
+                report.record(name, result, time.monotonic() - account_started)
+            except asyncio.TimeoutError:
+                logger.warning(f"Restauration {name}: délai de {timeout}s dépassé")
+                report.record(name, TIMEOUT, time.monotonic() - account_started)
+            except Exception as e:
+                logger.error(f"Erreur restauration {name}: {e}")
+                report.record(name, ERROR, time.monotonic() - account_started, str(e))
+
+    await asyncio.gather(*(run(item) for item in items))
+    report.duration = round(time.monotonic() - started, 2)
+    return report
@@ -2,8 +2,8 @@ import logging
 import os
 import asyncio
 from telethon import TelegramClient
-from bot.database import load_data, save_data
-import psycopg2
+from bot.store import store
+from bot.restore import restore_concurrently
 from datetime import datetime
 
 logger = logging.getLogger(__name__)
@@ -13,54 +13,23 @@ class SessionManager:
     
     def __init__(self):
         self.sessions = {}  # In-memory active sessions
-        self.db_connection = None
-        self._init_database()
-    
-    def _init_database(self):
-        """Initialize database connection and tables"""
-        try:
-            self.db_connection = psycopg2.connect(os.getenv("DATABASE_URL"))
-            cursor = self.db_connection.cursor()
-            
-            # Create sessions table if not exists
-            cursor.execute("""
-                CREATE TABLE IF NOT EXISTS telegram_sessions (
-                    id SERIAL PRIMARY KEY,
-                    user_id BIGINT NOT NULL,
-                    phone_number VARCHAR(20) NOT NULL,
-                    session_file TEXT NOT NULL,
-                    is_active BOOLEAN DEFAULT TRUE,
-                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                    last_used TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                    UNIQUE(user_id, phone_number)
-                )
-            """)
-            
-            self.db_connection.commit()
-            cursor.close()
-            logger.info("Session database initialized successfully")
-            
-        except Exception as e:
-            logger.error(f"Error initializing session database: {e}")
+        self.records = store.telegram_sessions
     
     async def store_session(self, user_id, phone_number, session_name):
-        """Store session information in database"""
+        """Store session information"""
         try:
-            cursor = self.db_connection.cursor()
-            
-            # Insert or update session
-            cursor.execute("""
-                INSERT INTO telegram_sessions (user_id, phone_number, session_file, is_active, last_used)
-                VALUES (%s, %s, %s, %s, %s)
-                ON CONFLICT (user_id, phone_number)
-                DO UPDATE SET 
-                    session_file = EXCLUDED.session_file,
-                    is_active = EXCLUDED.is_active,
-                    last_used = EXCLUDED.last_used
-            """, (user_id, phone_number, session_name, True, datetime.now()))
-            
-            self.db_connection.commit()
-            cursor.close()
+            key = self.records.key(user_id, phone_number)
+            record = self.records.get(key) or {
+                'user_id': user_id,
+                'phone_number': phone_number,
+                'created_at': datetime.now().isoformat()
+            }
+            record.update({
+                'session_file': session_name,
+                'is_active': True,
+                'last_used': datetime.now().isoformat()
+            })
+            self.records.put(key, record)
             logger.info(f"Session stored for user {user_id}, phone {phone_number}")
             
         except Exception as e:
@@ -69,45 +38,40 @@ class SessionManager:
     async def get_user_sessions(self, user_id):
         """Get all active sessions for a user"""
         try:
-            cursor = self.db_connection.cursor()
-            cursor.execute("""
-                SELECT phone_number, session_file, last_used 
-                FROM telegram_sessions 
-                WHERE user_id = %s AND is_active = TRUE
-            """, (user_id,))
-            
-            sessions = cursor.fetchall()
-            cursor.close()
-            
-            return [{'phone': row[0], 'session_file': row[1], 'last_used': row[2]} for row in sessions]
+            return [
+                {'phone': record['phone_number'], 'session_file': record['session_file'], 'last_used': record.get('last_used')}
+                for record in self.records.active()
+                if record['user_id'] == user_id
+            ]
             
         except Exception as e:
             logger.error(f"Error getting user sessions: {e}")
             return []
     
     async def restore_all_sessions(self):
-        """Restore all active sessions on bot startup"""
+        """Restore all active sessions on bot startup
+        
+        Sessions are restored concurrently (RESTORE_CONCURRENCY at a time, each
+        bounded by RESTORE_TIMEOUT). Returns the RestoreReport.
+        """
         try:
-            cursor = self.db_connection.cursor()
-            cursor.execute("""
-                SELECT user_id, phone_number, session_file 
-                FROM telegram_sessions 
-                WHERE is_active = TRUE
-            """)
+            sessions = self.records.active()
             
-            sessions = cursor.fetchall()
-            cursor.close()
+            report = await restore_concurrently(
+                sessions,
+                lambda record: self._restore_session(record['user_id'], record['phone_number'], record['session_file']),
+                label=lambda record: f"{record['user_id']}:{record['phone_number']}"
+            )
             
-            for user_id, phone_number, session_file in sessions:
-                await self._restore_session(user_id, phone_number, session_file)
-                
-            logger.info(f"Restored {len(sessions)} active sessions")
+            logger.info(report.summary())
+            return report
             
         except Exception as e:
             logger.error(f"Error restoring sessions: {e}")
     
     async def _restore_session(self, user_id, phone_number, session_file):
         """Restore a single session"""
+        client = None
         try:
             # Check if session file exists
             if not os.path.exists(session_file):
@@ -148,6 +112,11 @@ class SessionManager:
                 logger.warning(f"Session expired for user {user_id}, phone {phone_number}")
                 return False
                 
+        except asyncio.CancelledError:
+            # Restore timed out: release the connection but keep the session active
+            if client is not None:
+                await client.disconnect()
+            raise
         except Exception as e:
             logger.error(f"Error restoring session for user {user_id}: {e}")
             await self.deactivate_session(user_id, phone_number)
@@ -156,31 +125,23 @@ class SessionManager:
     async def update_session_activity(self, user_id, phone_number):
         """Update last used timestamp for a session"""
         try:
-            cursor = self.db_connection.cursor()
-            cursor.execute("""
-                UPDATE telegram_sessions 
-                SET last_used = %s 
-                WHERE user_id = %s AND phone_number = %s
-            """, (datetime.now(), user_id, phone_number))
-            
-            self.db_connection.commit()
-            cursor.close()
+            key = self.records.key(user_id, phone_number)
+            record = self.records.get(key)
+            if record:
+                record['last_used'] = datetime.now().isoformat()
+                self.records.put(key, record)
             
         except Exception as e:
             logger.error(f"Error updating session activity: {e}")
     
     async def deactivate_session(self, user_id, phone_number):
-        """Deactivate a session in database"""
+        """Deactivate a stored session"""
         try:
-            cursor = self.db_connection.cursor()
-            cursor.execute("""
-                UPDATE telegram_sessions 
-                SET is_active = FALSE 
-                WHERE user_id = %s AND phone_number = %s
-            """, (user_id, phone_number))
-            
-            self.db_connection.commit()
-            cursor.close()
+            key = self.records.key(user_id, phone_number)
+            record = self.records.get(key)
+            if record:
+                record['is_active'] = False
+                self.records.put(key, record)
             
             # Remove from active connections if present
             from bot.connection import active_connections
@@ -198,28 +159,21 @@ class SessionManager:
     async def cleanup_expired_sessions(self):
         """Clean up expired sessions (older than 7 days)"""
         try:
-            cursor = self.db_connection.cursor()
-            cursor.execute("""
-                UPDATE telegram_sessions 
-                SET is_active = FALSE 
-                WHERE last_used < NOW() - INTERVAL '7 days' 
-                AND is_active = TRUE
-            """)
-            
-            affected_rows = cursor.rowcount
-            self.db_connection.commit()
-            cursor.close()
+            stale = self.records.stale(days=7)
+            for record in stale:
+                record['is_active'] = False
+                self.records.put(self.records.key(record['user_id'], record['phone_number']), record)
             
-            if affected_rows > 0:
-                logger.info(f"Cleaned up {affected_rows} expired sessions")
+            if stale:
+                logger.info(f"Cleaned up {len(stale)} expired sessions")
             
         except Exception as e:
             logger.error(f"Error cleaning up expired sessions: {e}")
     
     def close(self):
-        """Close database connection"""
-        if self.db_connection:
-            self.db_connection.close()
+        """Flush pending storage writes"""
+        from bot.storage import storage
+        storage.flush_sync()
 
 # Global session manager instance
-session_manager = SessionManager()
\ No newline at end of file
+session_manager = SessionManager()
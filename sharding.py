@@ -0,0 +1,334 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Répartition des comptes TeleFeed sur plusieurs processus
+Le processus principal garde le bot (commandes, Flask) ; chaque worker possède
+une partie des comptes (connexion, routage, reconnexion) et exécute les
+commandes qui concernent ses comptes.
+
+Activation : SHARD_WORKERS=N (0 = tout dans un seul processus, comportement par défaut)
+Nécessite STORAGE_BACKEND=sqlite : les processus partagent la même base WAL.
+"""
+
+import asyncio
+import hashlib
+import itertools
+import logging
+import multiprocessing
+import os
+import signal
+
+try:
+    from storage import storage
+    from store import store, STORAGE_BACKEND
+except ImportError:
+    from bot.storage import storage
+    from bot.store import store, STORAGE_BACKEND
+
+logger = logging.getLogger(__name__)
+
+# Nombre de processus workers (0 = désactivé)
+SHARD_WORKERS = int(os.getenv('SHARD_WORKERS', '0'))
+# Délai maximal (secondes) d'une commande transmise à un worker
+SHARD_CALL_TIMEOUT = float(os.getenv('SHARD_CALL_TIMEOUT', '120'))
+# Intervalle (secondes) de surveillance des processus workers
+SHARD_MONITOR_INTERVAL = float(os.getenv('SHARD_MONITOR_INTERVAL', '5'))
+
+# Méthodes de TeleFeedManager qu'un worker accepte d'exécuter
+WORKER_METHODS = {
+    'begin_login', 'complete_login', 'get_chats', 'refresh_account', 'release_account',
+    'check_permissions', 'connected_accounts', 'replay_dead_letter', 'clear_dead_letters',
+    'wake_posts',
+}
+
+def sharding_enabled():
+    """Le partage en processus n'est actif qu'avec le backend SQLite partagé"""
+    if SHARD_WORKERS <= 0:
+        return False
+    if STORAGE_BACKEND != 'sqlite':
+        logger.warning("SHARD_WORKERS ignoré : STORAGE_BACKEND=sqlite est requis")
+        return False
+    return True
+
+def _score(phone_number, shard):
+    digest = hashlib.blake2b(f"{shard}:{phone_number}".encode(), digest_size=8).digest()
+    return int.from_bytes(digest, 'big')
+
+def hash_shard(phone_number, shards):
+    """Hachage par rendez-vous : stable, et un changement du nombre de workers ne
+    déplace que les comptes du worker ajouté ou retiré"""
+    return max(range(shards), key=lambda shard: _score(str(phone_number), shard))
+
+class ShardMap:
+    """Attribution compte -> worker : hachage stable, corrigé par les rééquilibrages"""
+
+    def __init__(self, shards):
+        self.shards = shards
+        # Attributions forcées par un rééquilibrage (téléphone -> worker)
+        self.overrides = store.repository('shard_assignments')
+
+    def owner(self, phone_number):
+        override = self.overrides.get(phone_number)
+        if override is not None and 0 <= override < self.shards:
+            return override
+        return hash_shard(phone_number, self.shards)
+
+    def assignments(self, phones):
+        shards = {shard: [] for shard in range(self.shards)}
+        for phone_number in phones:
+            shards[self.owner(phone_number)].append(phone_number)
+        return shards
+
+    def rebalance(self, weights):
+        """Déplace des comptes du worker le plus chargé vers le moins chargé
+
+        weights : {téléphone: charge} (par exemple le nombre de redirections actives).
+        Retourne la liste des déplacements (téléphone, ancien worker, nouveau worker).
+        """
+        loads = {shard: 0 for shard in range(self.shards)}
+        members = {shard: [] for shard in range(self.shards)}
+        for phone_number, weight in weights.items():
+            shard = self.owner(phone_number)
+            loads[shard] += weight
+            members[shard].append(phone_number)
+
+        moves = []
+        while True:
+            heaviest = max(loads, key=loads.get)
+            lightest = min(loads, key=loads.get)
+            gap = loads[heaviest] - loads[lightest]
+            # Le compte déplacé doit réduire l'écart sans l'inverser
+            candidates = [phone for phone in members[heaviest] if 0 < weights[phone] < gap]
+            if not candidates:
+                break
+            phone_number = min(candidates, key=lambda phone: abs(gap - 2 * weights[phone]))
+            members[heaviest].remove(phone_number)
+            members[lightest].append(phone_number)
+            loads[heaviest] -= weights[phone_number]
+            loads[lightest] += weights[phone_number]
+            self.overrides.put(phone_number, lightest)
+            moves.append((phone_number, heaviest, lightest))
+        return moves
+
+class ShardRouter:
+    """Côté bot : démarre les workers et leur transmet les commandes par tube"""
+
+    def __init__(self, shards=SHARD_WORKERS):
+        self.shards = shards
+        self.map = ShardMap(shards)
+        self._context = multiprocessing.get_context('spawn')
+        self._workers = {}
+        self._pending = {}
+        self._ids = itertools.count(1)
+        self._monitor_task = None
+        self.restarts = {shard: 0 for shard in range(shards)}
+        # Alertes transmises par les workers : on_notify(user_id, texte)
+        self.on_notify = None
+
+    def start(self):
+        """Lance les N workers et la surveillance de leurs processus"""
+        for shard in range(self.shards):
+            self._spawn(shard)
+        self._monitor_task = asyncio.create_task(self._monitor())
+        logger.info(f"{self.shards} workers TeleFeed démarrés")
+
+    def _spawn(self, shard):
+        parent_conn, child_conn = self._context.Pipe()
+        process = self._context.Process(
+            target=worker_main, args=(shard, self.shards, child_conn),
+            name=f"telefeed-shard-{shard}", daemon=True
+        )
+        process.start()
+        child_conn.close()
+        self._workers[shard] = (process, parent_conn)
+        asyncio.get_running_loop().add_reader(parent_conn.fileno(), self._on_readable, shard, parent_conn)
+
+    def _on_readable(self, shard, conn):
+        try:
+            while conn.poll():
+                kind, request_id, ok, value = conn.recv()
+                if kind == 'notify':
+                    # Alerte d'un worker, envoyée par le bot de ce processus
+                    if self.on_notify is not None:
+                        self.on_notify(*value)
+                    continue
+                future = self._pending.pop(request_id, None)
+                if future is None or future.done():
+                    continue
+                if ok:
+                    future.set_result(value)
+                else:
+                    future.set_exception(RuntimeError(value))
+        except (EOFError, OSError):
+            asyncio.get_running_loop().remove_reader(conn.fileno())
+
+    async def _monitor(self):
+        """Relance un worker dont le processus s'est arrêté"""
+        while True:
+            await asyncio.sleep(SHARD_MONITOR_INTERVAL)
+            for shard, (process, conn) in list(self._workers.items()):
+                if process.is_alive():
+                    continue
+                logger.error(f"Worker {shard} arrêté (code {process.exitcode}) - redémarrage")
+                try:
+                    asyncio.get_running_loop().remove_reader(conn.fileno())
+                except Exception:
+                    pass
+                conn.close()
+                self.restarts[shard] += 1
+                self._spawn(shard)
+
+    async def call_shard(self, shard, method, *args):
+        """Exécute une méthode du TeleFeedManager dans le worker donné"""
+        # Les écritures du bot doivent être visibles par le worker
+        await storage.flush()
+
+        process, conn = self._workers[shard]
+        request_id = next(self._ids)
+        future = asyncio.get_running_loop().create_future()
+        self._pending[request_id] = future
+        conn.send(('call', request_id, method, args))
+        try:
+            return await asyncio.wait_for(future, SHARD_CALL_TIMEOUT)
+        finally:
+            self._pending.pop(request_id, None)
+
+    async def call(self, phone_number, method, *args):
+        """Exécute la méthode dans le worker propriétaire du compte"""
+        return await self.call_shard(self.map.owner(phone_number), method, *args)
+
+    async def call_all(self, method, *args):
+        """Exécute la méthode dans tous les workers ({worker: résultat})"""
+        results = await asyncio.gather(
+            *(self.call_shard(shard, method, *args) for shard in range(self.shards)),
+            return_exceptions=True
+        )
+        return dict(zip(range(self.shards), results))
+
+    async def rebalance(self, weights):
+        """Rééquilibre les comptes, puis déplace les connexions concernées"""
+        moves = self.map.rebalance(weights)
+        for phone_number, old_shard, new_shard in moves:
+            try:
+                await self.call_shard(old_shard, 'release_account', phone_number)
+                await self.call_shard(new_shard, 'refresh_account', phone_number)
+            except Exception as e:
+                logger.error(f"Erreur déplacement {phone_number} ({old_shard} -> {new_shard}): {e}")
+        return moves
+
+    def status(self):
+        return {
+            shard: {'pid': process.pid, 'alive': process.is_alive(), 'restarts': self.restarts[shard]}
+            for shard, (process, _) in self._workers.items()
+        }
+
+    async def stop(self):
+        if self._monitor_task is not None:
+            self._monitor_task.cancel()
+        loop = asyncio.get_running_loop()
+        for shard, (process, conn) in self._workers.items():
+            try:
+                loop.remove_reader(conn.fileno())
+                conn.send(('stop', 0, None, None))
+            except Exception:
+                pass
+        for shard, (process, conn) in self._workers.items():
+            await loop.run_in_executor(None, process.join, 30)
+            if process.is_alive():
+                process.terminate()
+            conn.close()
+        self._workers.clear()
+
+class ShardServer:
+    """Côté worker : exécute les commandes reçues du bot"""
+
+    def __init__(self, conn, manager):
+        self.conn = conn
+        self.manager = manager
+        self.closed = asyncio.Event()
+
+    def start(self):
+        asyncio.get_running_loop().add_reader(self.conn.fileno(), self._on_readable)
+
+    def _on_readable(self):
+        try:
+            while self.conn.poll():
+                kind, request_id, method, args = self.conn.recv()
+                if kind == 'stop':
+                    self._close()
+                    return
+                asyncio.ensure_future(self._handle(request_id, method, args))
+        except (EOFError, OSError):
+            # Le processus principal a disparu
+            self._close()
+
+    async def notify(self, user_id, text):
+        """Transmet une alerte au processus principal (le bot n'est pas dans le worker)"""
+        self.conn.send(('notify', 0, True, (user_id, text)))
+
+    def _close(self):
+        try:
+            asyncio.get_running_loop().remove_reader(self.conn.fileno())
+        except Exception:
+            pass
+        self.closed.set()
+
+    async def _handle(self, request_id, method, args):
+        try:
+            if method not in WORKER_METHODS:
+                raise ValueError(f"Méthode non autorisée: {method}")
+            result = getattr(self.manager, method)(*args)
+            if asyncio.iscoroutine(result):
+                result = await result
+            reply = ('result', request_id, True, result)
+        except Exception as e:
+            reply = ('result', request_id, False, str(e))
+        try:
+            self.conn.send(reply)
+        except (OSError, ValueError):
+            self._close()
+
+def worker_main(shard, shards, conn):
+    """Point d'entrée d'un processus worker"""
+    logging.basicConfig(level=logging.INFO, format=f"[shard {shard}] %(levelname)s:%(name)s:%(message)s")
+    # L'arrêt est piloté par le processus principal (message 'stop' après son propre SIGTERM)
+    signal.signal(signal.SIGTERM, signal.SIG_IGN)
+    try:
+        asyncio.run(_run_worker(shard, shards, conn))
+    except KeyboardInterrupt:
+        pass
+
+async def _run_worker(shard, shards, conn):
+    from connection_supervisor import ConnectionSupervisor
+    from telefeed_commands import telefeed_manager
+
+    shard_map = ShardMap(shards)
+    telefeed_manager.shard = shard
+    telefeed_manager.shard_filter = lambda phone_number: shard_map.owner(phone_number) == shard
+
+    server = ShardServer(conn, telefeed_manager)
+    server.start()
+    telefeed_manager.notifier = server.notify
+
+    supervisor = ConnectionSupervisor()
+    supervisor.watch(lambda: telefeed_manager.clients, on_reconnect=telefeed_manager.on_client_reconnected)
+    supervisor.start()
+    idle_task = asyncio.create_task(telefeed_manager.run_idle_policy())
+    send_task = asyncio.create_task(telefeed_manager.run_send_scheduler())
+    restore_task = asyncio.create_task(telefeed_manager.restore_existing_sessions())
+
+    await server.closed.wait()
+
+    for task in (restore_task, idle_task, send_task):
+        task.cancel()
+    await supervisor.stop()
+    await telefeed_manager.pending_auth.clear()
+    # Fin des envois en cours et sauvegarde avant la déconnexion (voir TeleFeedManager.drain)
+    await telefeed_manager.drain()
+    await storage.flush()
+    for client in list(telefeed_manager.clients.values()):
+        try:
+            await client.disconnect()
+        except Exception:
+            pass
+    logger.info(f"Worker {shard} arrêté")
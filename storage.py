@@ -0,0 +1,252 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Passerelle de stockage pour les fichiers JSON
+Les écritures disque sont sérialisées sur un thread d'E/S dédié pour ne pas bloquer la boucle asyncio
+Chaque fichier est écrit dans un fichier temporaire synchronisé (fsync) puis renommé, et
+le répertoire est synchronisé : une écriture terminée survit à une coupure de courant.
+
+Les journaux en ajout seul (outbox) passent aussi par ce thread : les lignes ajoutées
+pendant l'écriture précédente sont écrites ensemble, avec un seul fsync par lot.
+"""
+
+import asyncio
+import json
+import logging
+import os
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+logger = logging.getLogger(__name__)
+
+def dumps_compact(data):
+    """Encodage JSON compact en UTF-8 (orjson s'il est installé)"""
+    if orjson is not None:
+        return orjson.dumps(data, option=orjson.OPT_NON_STR_KEYS).decode('utf-8')
+    return json.dumps(data, ensure_ascii=False, separators=(',', ':'))
+
+def loads(raw):
+    """Décodage JSON (orjson s'il est installé)"""
+    if orjson is not None:
+        return orjson.loads(raw)
+    return json.loads(raw)
+
+class StorageGateway:
+    """Point d'entrée unique pour toutes les écritures de fichiers JSON"""
+
+    def __init__(self):
+        # Un seul worker : les écritures sont exécutées dans l'ordre de soumission
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="storage-io")
+        self._lock = threading.Lock()
+        # Écritures en attente : chemin -> (instantané, options json, future)
+        self._pending = {}
+        self._inflight = set()
+        # Journaux : chemin -> lot en attente {'replace': contenu ou None, 'lines': [...], 'future': ...}
+        self._appends = {}
+
+    @staticmethod
+    def snapshot(data, **dump_kwargs):
+        """Instantané JSON compact, pris dans le thread appelant
+
+        L'encodage compact (orjson ou encodeur C de json) est rapide, et les
+        données ne peuvent pas être modifiées pendant l'encodage.
+        """
+        if dump_kwargs.get('ensure_ascii', True) and dump_kwargs.get('indent') is None:
+            return json.dumps(data, **dump_kwargs)
+        return dumps_compact(data)
+
+    @staticmethod
+    def render(snapshot, **dump_kwargs):
+        """Mise en forme finale sur le thread d'E/S (indentation éventuelle)"""
+        if dump_kwargs.get('indent') is None:
+            return snapshot
+        return json.dumps(loads(snapshot), **dump_kwargs)
+
+    @staticmethod
+    def _fsync_directory(path):
+        """Synchronise l'entrée du fichier dans son répertoire (rename ou création)"""
+        try:
+            fd = os.open(os.path.dirname(path) or '.', os.O_RDONLY)
+        except OSError:
+            # Répertoire non ouvrable (Windows) : pas de synchronisation possible
+            return
+        try:
+            os.fsync(fd)
+        except OSError:
+            pass
+        finally:
+            os.close(fd)
+
+    @classmethod
+    def _write_file(cls, path, payload):
+        """Écrit le fichier de manière atomique et durable (fichier temporaire synchronisé + rename)"""
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            f.write(payload)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+        cls._fsync_directory(path)
+
+    def _drain(self, path):
+        """Exécuté sur le thread d'E/S : écrit la dernière version connue du fichier"""
+        with self._lock:
+            snapshot, dump_kwargs, future = self._pending.pop(path)
+        try:
+            self._write_file(path, self.render(snapshot, **dump_kwargs))
+            future.set_result(True)
+        except Exception as e:
+            future.set_exception(e)
+
+    def submit(self, path, data, **dump_kwargs):
+        """Planifie l'écriture et retourne un concurrent.futures.Future
+
+        Si une écriture du même fichier attend encore son tour, elle est remplacée
+        par la nouvelle version : seul le contenu le plus récent est écrit.
+        """
+        snapshot = self.snapshot(data, **dump_kwargs)
+        with self._lock:
+            if path in self._pending:
+                _, _, future = self._pending[path]
+                self._pending[path] = (snapshot, dump_kwargs, future)
+                return future
+
+            future = Future()
+            self._pending[path] = (snapshot, dump_kwargs, future)
+            self._inflight.add(future)
+
+        future.add_done_callback(self._inflight.discard)
+        self._executor.submit(self._drain, path)
+        return future
+
+    def _batch(self, path):
+        """Lot en attente du journal (créé et planifié si besoin) ; à appeler sous self._lock"""
+        batch = self._appends.get(path)
+        if batch is not None:
+            return batch, False
+        batch = self._appends[path] = {'replace': None, 'lines': [], 'future': Future()}
+        self._inflight.add(batch['future'])
+        return batch, True
+
+    def _schedule_batch(self, path, batch):
+        batch['future'].add_done_callback(self._inflight.discard)
+        batch['future'].add_done_callback(lambda f, p=path: self._log_failure(p, f))
+        self._executor.submit(self._drain_appends, path)
+
+    def _drain_appends(self, path):
+        """Exécuté sur le thread d'E/S : écrit le lot du journal, synchronisé par un seul fsync"""
+        with self._lock:
+            batch = self._appends.pop(path)
+        try:
+            os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+            if batch['replace'] is not None:
+                tmp_path = f"{path}.tmp"
+                with open(tmp_path, 'w', encoding='utf-8') as f:
+                    f.write(batch['replace'])
+                    f.write(''.join(batch['lines']))
+                    f.flush()
+                    os.fsync(f.fileno())
+                os.replace(tmp_path, path)
+                self._fsync_directory(path)
+            else:
+                created = not os.path.exists(path)
+                with open(path, 'a', encoding='utf-8') as f:
+                    f.write(''.join(batch['lines']))
+                    f.flush()
+                    os.fsync(f.fileno())
+                if created:
+                    self._fsync_directory(path)
+            batch['future'].set_result(True)
+        except Exception as e:
+            batch['future'].set_exception(e)
+
+    def append(self, path, line):
+        """Ajoute une ligne à un journal ; le Future est résolu une fois la ligne sur disque"""
+        with self._lock:
+            batch, created = self._batch(path)
+            batch['lines'].append(line)
+        if created:
+            self._schedule_batch(path, batch)
+        return batch['future']
+
+    def rewrite(self, path, payload):
+        """Remplace le contenu d'un journal (compactage)
+
+        Les lignes ajoutées avant l'appel et pas encore écrites sont abandonnées : le
+        nouveau contenu les inclut déjà. Celles ajoutées ensuite le suivent.
+        """
+        with self._lock:
+            batch, created = self._batch(path)
+            batch['replace'] = payload
+            batch['lines'] = []
+        if created:
+            self._schedule_batch(path, batch)
+        return batch['future']
+
+    def run(self, label, function, *args):
+        """Exécute function(*args) sur le thread d'E/S, après les écritures déjà planifiées
+
+        Retourne un concurrent.futures.Future ; les erreurs sont journalisées sous label.
+        """
+        future = self._executor.submit(function, *args)
+        with self._lock:
+            self._inflight.add(future)
+        future.add_done_callback(self._inflight.discard)
+        future.add_done_callback(lambda f: self._log_failure(label, f))
+        return future
+
+    async def save(self, path, data, **dump_kwargs):
+        """Écriture attendable depuis une coroutine"""
+        return await asyncio.wrap_future(self.submit(path, data, **dump_kwargs))
+
+    def save_nowait(self, path, data, **dump_kwargs):
+        """Écriture en arrière-plan (fire-and-forget), les erreurs sont journalisées"""
+        future = self.submit(path, data, **dump_kwargs)
+        future.add_done_callback(lambda f, p=path: self._log_failure(p, f))
+        return future
+
+    def write(self, path, data, **dump_kwargs):
+        """Écriture pour le code synchrone
+
+        Depuis la boucle asyncio l'écriture part en arrière-plan ; hors boucle
+        (scripts, démarrage) elle est attendue avant de rendre la main.
+        """
+        try:
+            asyncio.get_running_loop()
+        except RuntimeError:
+            future = self.submit(path, data, **dump_kwargs)
+            future.result()
+            return future
+        return self.save_nowait(path, data, **dump_kwargs)
+
+    async def flush(self):
+        """Attend la fin de toutes les écritures en cours"""
+        while True:
+            with self._lock:
+                futures = list(self._inflight)
+            if not futures:
+                return
+            await asyncio.gather(*(asyncio.wrap_future(f) for f in futures), return_exceptions=True)
+
+    def flush_sync(self, timeout=None):
+        """Version bloquante de flush() (hors boucle asyncio)"""
+        with self._lock:
+            futures = list(self._inflight)
+        for future in futures:
+            try:
+                future.result(timeout=timeout)
+            except Exception:
+                pass
+
+    @staticmethod
+    def _log_failure(path, future):
+        if future.exception() is not None:
+            logger.error(f"Erreur lors de la sauvegarde {path}: {future.exception()}")
+
+# Instance globale
+storage = StorageGateway()
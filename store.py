@@ -0,0 +1,809 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Couche de stockage unifiée
+Backend JSON (fichiers existants) ou SQLite, exposé via des dépôts typés
+
+Sélection du backend : STORAGE_BACKEND=json (défaut) ou STORAGE_BACKEND=sqlite
+Importer ce module n'accède pas aux données : les migrations (import SQLite, découpage
+par compte) sont lancées au démarrage du bot par prepare_store()
+Migration ponctuelle des fichiers JSON vers SQLite : python store.py migrate
+Temps de lecture avec et sans cache (10 000 utilisateurs) : python store.py bench
+
+Les redirections, chats et correspondances de messages TeleFeed sont partitionnés
+par numéro de téléphone : un dossier par compte (JSON) ou une ligne par compte
+(SQLite). Une écriture ne touche que le compte concerné.
+"""
+
+import json
+import logging
+import os
+import sqlite3
+import sys
+import threading
+from datetime import datetime, timedelta
+
+try:
+    from storage import storage, dumps_compact, loads
+except ImportError:
+    from bot.storage import storage, dumps_compact, loads
+
+logger = logging.getLogger(__name__)
+
+STORAGE_BACKEND = os.getenv('STORAGE_BACKEND', 'json')
+STORAGE_DB_FILE = os.getenv('STORAGE_DB_FILE', 'telefoot.db')
+# Format des fichiers JSON : compact (défaut) ou pretty (indenté, lisible)
+STORAGE_JSON_FORMAT = os.getenv('STORAGE_JSON_FORMAT', 'compact')
+
+JSON_FORMATS = {
+    'compact': {'ensure_ascii': False, 'separators': (',', ':')},
+    'pretty': {'indent': 2, 'ensure_ascii': False}
+}
+
+# Magasins logiques -> (fichier JSON, section du fichier)
+STORES = {
+    # Utilisateurs et licences du bot principal
+    'users': ('users.json', None),
+    # Données du bot TeleFeed historique (user_data.json)
+    'licenses': ('user_data.json', 'licenses'),
+    'connections': ('user_data.json', 'connections'),
+    'redirections': ('user_data.json', 'redirections'),
+    'transformations': ('user_data.json', 'transformations'),
+    'whitelists': ('user_data.json', 'whitelists'),
+    'blacklists': ('user_data.json', 'blacklists'),
+    'chats': ('user_data.json', 'chats'),
+    'pending_redirections': ('user_data.json', 'pending_redirections'),
+    # Sessions persistantes du SessionManager (anciennement table Postgres)
+    'telegram_sessions': ('telegram_sessions.json', None),
+    # TeleFeed
+    'telefeed_sessions': ('telefeed_sessions.json', None),
+    'telefeed_redirections': ('telefeed_redirections.json', None),
+    'telefeed_transformations': ('telefeed_transformations.json', None),
+    'telefeed_filters': ('telefeed_filters.json', None),
+    'telefeed_whitelist': ('telefeed_whitelist.json', None),
+    'telefeed_blacklist': ('telefeed_blacklist.json', None),
+    'telefeed_settings': ('telefeed_settings.json', None),
+    'telefeed_chats': ('telefeed_chats.json', None),
+    'telefeed_delay': ('telefeed_delay.json', None),
+    'telefeed_message_mapping': ('telefeed_message_mapping.json', None),
+    # Empreinte du dernier contenu publié par message source et destination (éditions inchangées)
+    'telefeed_message_digests': ('telefeed_message_digests.json', None),
+    # Dernier message traité par chat source (rattrapage après interruption)
+    'telefeed_high_water': ('telefeed_high_water.json', None),
+    # Messages programmés chez Telegram (délais longs) en attente de publication
+    'telefeed_scheduled': ('telefeed_scheduled.json', None),
+    # Sessions Telethon (StringSession) des comptes TeleFeed, par téléphone
+    'telefeed_string_sessions': ('telefeed_string_sessions.json', None),
+    # Publications programmées (backend JSON ; table scheduled_posts en SQLite)
+    'telefeed_posts': ('telefeed_posts.json', None),
+    # Dernier identifiant de publication attribué (backend JSON) : jamais réattribué
+    'telefeed_post_ids': ('telefeed_post_ids.json', None),
+    # Envois TeleFeed abandonnés (échec définitif ou trop d'essais), rejouables par l'admin
+    'telefeed_dead_letters': ('telefeed_dead_letters.json', None),
+    # Répartition des comptes entre processus workers (rééquilibrages)
+    'shard_assignments': ('shard_assignments.json', None),
+}
+
+# Magasins contenant des secrets d'authentification : jamais exportés
+SENSITIVE_STORES = {'telefeed_string_sessions'}
+
+# Dossier des partitions par compte : {TELEFEED_ACCOUNTS_DIR}/{téléphone}/{fichier}
+TELEFEED_ACCOUNTS_DIR = os.getenv('TELEFEED_ACCOUNTS_DIR', 'telefeed_accounts')
+
+# Magasins partitionnés par téléphone -> nom du fichier dans le dossier du compte
+PARTITIONED_STORES = {
+    'telefeed_redirections': 'redirections.json',
+    'telefeed_chats': 'chats.json',
+    'telefeed_message_mapping': 'message_mapping.json',
+    'telefeed_message_digests': 'message_digests.json',
+    'telefeed_high_water': 'high_water.json',
+    'telefeed_scheduled': 'scheduled.json',
+}
+
+def partition_message_mapping(mapping, redirections):
+    """Répartit l'ancien mapping global {chat_msg: {dest: id}} par téléphone
+
+    Chaque destination est attribuée au compte dont une redirection relie le chat
+    source à cette destination (à défaut, au premier compte ayant ce chat en source).
+    """
+    owners = {}
+    for phone, phone_redirections in redirections.items():
+        for redir_data in phone_redirections.values():
+            for source in redir_data.get('sources', []):
+                for dest in redir_data.get('destinations', []):
+                    owners.setdefault((str(source), str(dest)), phone)
+                owners.setdefault((str(source), None), phone)
+
+    partitions = {}
+    orphans = 0
+    for source_key, destinations in mapping.items():
+        source = source_key.rsplit('_', 1)[0]
+        for dest, message_id in destinations.items():
+            phone = owners.get((source, str(dest))) or owners.get((source, None))
+            if phone is None:
+                orphans += 1
+                continue
+            partitions.setdefault(phone, {}).setdefault(source_key, {})[dest] = message_id
+    if orphans:
+        logger.warning(f"{orphans} correspondances de messages sans compte propriétaire ignorées")
+    return partitions
+
+class JsonBackend:
+    """Backend fichiers JSON, avec cache mémoire revalidé par mtime"""
+
+    name = 'json'
+
+    def __init__(self, json_format=STORAGE_JSON_FORMAT):
+        # fichier -> {'mtime': ..., 'data': ...}
+        self._files = {}
+        self.dump_kwargs = JSON_FORMATS.get(json_format, JSON_FORMATS['compact'])
+
+    @staticmethod
+    def _mtime(filename):
+        try:
+            return os.stat(filename).st_mtime_ns
+        except OSError:
+            return None
+
+    def _document(self, filename):
+        """Retourne le contenu du fichier, relu uniquement s'il a changé"""
+        mtime = self._mtime(filename)
+        cached = self._files.get(filename)
+        if cached is not None and cached['mtime'] == mtime:
+            return cached['data']
+
+        data = {}
+        if mtime is not None:
+            try:
+                with open(filename, 'rb') as f:
+                    data = loads(f.read())
+            except Exception as e:
+                logger.error(f"Erreur lors du chargement {filename}: {e}")
+        self._files[filename] = {'mtime': mtime, 'data': data}
+        return data
+
+    def load(self, store):
+        filename, section = STORES[store]
+        document = self._document(filename)
+        if section:
+            return document.setdefault(section, {})
+        return document
+
+    def get(self, store, key, default=None):
+        return self.load(store).get(key, default)
+
+    def save(self, store, data):
+        filename, section = STORES[store]
+        if section:
+            document = self._document(filename)
+            document[section] = data
+        else:
+            document = data
+        self._save_document(filename, document)
+
+    def _save_document(self, filename, document):
+        entry = {'mtime': self._mtime(filename), 'data': document}
+        self._files[filename] = entry
+
+        future = storage.write(filename, document, **self.dump_kwargs)
+        future.add_done_callback(lambda f: self._on_saved(filename, entry, f))
+        return future
+
+    def _on_saved(self, filename, entry, future):
+        """Enregistre le nouveau mtime une fois l'écriture terminée"""
+        if future.exception() is not None:
+            self._files.pop(filename, None)
+        elif self._files.get(filename) is entry:
+            entry['mtime'] = self._mtime(filename)
+
+    def put(self, store, key, value):
+        data = self.load(store)
+        data[key] = value
+        self.save(store, data)
+
+    def delete(self, store, key):
+        data = self.load(store)
+        if key in data:
+            del data[key]
+            self.save(store, data)
+
+    def invalidate(self):
+        self._files.clear()
+
+    @staticmethod
+    def _partition_file(store, phone):
+        return os.path.join(TELEFEED_ACCOUNTS_DIR, phone, PARTITIONED_STORES[store])
+
+    def partitions(self, store):
+        """Téléphones ayant une partition pour ce magasin"""
+        try:
+            phones = os.listdir(TELEFEED_ACCOUNTS_DIR)
+        except OSError:
+            return []
+        return sorted(phone for phone in phones
+                      if os.path.exists(self._partition_file(store, phone)))
+
+    def load_partition(self, store, phone, default=None):
+        filename = self._partition_file(store, phone)
+        if self._mtime(filename) is None and filename not in self._files:
+            return default
+        return self._document(filename)
+
+    def save_partition(self, store, phone, data):
+        """Planifie l'écriture du fichier du compte ; retourne son Future (résolu une fois sur disque)"""
+        filename = self._partition_file(store, phone)
+        os.makedirs(os.path.dirname(filename), exist_ok=True)
+        return self._save_document(filename, data)
+
+    def write_partition(self, store, phone, data):
+        """Écriture en arrière-plan de la partition (déjà faite par le thread d'E/S en json)"""
+        return self.save_partition(store, phone, data)
+
+    def split_legacy_files(self):
+        """Découpe une fois les anciens fichiers TeleFeed globaux en partitions par compte
+
+        Les anciens fichiers sont conservés avec l'extension .bak.
+        """
+        legacy = {store: STORES[store][0] for store in PARTITIONED_STORES}
+        if not any(os.path.exists(filename) for filename in legacy.values()):
+            return False
+
+        documents = {store: self._document(filename) if os.path.exists(filename) else {}
+                     for store, filename in legacy.items()}
+        redirections = {phone: self.load_partition('telefeed_redirections', phone)
+                        for phone in self.partitions('telefeed_redirections')}
+        redirections.update(documents['telefeed_redirections'])
+        documents['telefeed_message_mapping'] = partition_message_mapping(
+            documents['telefeed_message_mapping'], redirections
+        )
+
+        written = []
+        for store, partitions in documents.items():
+            for phone, data in partitions.items():
+                written.append(self.save_partition(store, str(phone), data))
+        # Les anciens fichiers ne sont renommés qu'une fois toutes les partitions écrites
+        try:
+            for future in written:
+                future.result()
+        except Exception as e:
+            logger.error(f"Découpage des données TeleFeed interrompu, anciens fichiers conservés: {e}")
+            raise
+
+        for filename in legacy.values():
+            if os.path.exists(filename):
+                os.replace(filename, f"{filename}.bak")
+                self._files.pop(filename, None)
+        logger.info(f"Données TeleFeed partitionnées par compte dans {TELEFEED_ACCOUNTS_DIR}/")
+        return True
+
+    def routes_for_source(self, chat_id):
+        """Redirections TeleFeed dont chat_id est une source (parcours complet)"""
+        routes = []
+        for phone in self.partitions('telefeed_redirections'):
+            redirections = self.load_partition('telefeed_redirections', phone, {})
+            for redir_id, redir_data in redirections.items():
+                if chat_id in redir_data.get('sources', []):
+                    routes.append((phone, redir_id))
+        return routes
+
+    def users_expired_before(self, moment):
+        return [user_id for user_id, data in self.load('users').items()
+                if data.get('expires') and data['expires'] < moment]
+
+class SQLiteBackend:
+    """Backend SQLite : une ligne par clé (user_id, téléphone...) et index secondaires"""
+
+    name = 'sqlite'
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS documents (
+            store TEXT NOT NULL,
+            key TEXT NOT NULL,
+            data TEXT NOT NULL,
+            PRIMARY KEY (store, key)
+        ) WITHOUT ROWID;
+
+        CREATE INDEX IF NOT EXISTS idx_users_expires
+            ON documents (json_extract(data, '$.expires'))
+            WHERE store = 'users';
+
+        CREATE TABLE IF NOT EXISTS redirection_sources (
+            source_chat_id INTEGER NOT NULL,
+            phone TEXT NOT NULL,
+            redirection_id TEXT NOT NULL,
+            PRIMARY KEY (source_chat_id, phone, redirection_id)
+        ) WITHOUT ROWID;
+
+        CREATE INDEX IF NOT EXISTS idx_redirection_sources_phone
+            ON redirection_sources (phone);
+
+        CREATE TABLE IF NOT EXISTS meta (
+            key TEXT PRIMARY KEY,
+            value TEXT
+        );
+    """
+
+    def __init__(self, path=STORAGE_DB_FILE):
+        self.path = path
+        self._lock = threading.RLock()
+        # Connexion ouverte au premier accès : créer le backend ne crée pas la base
+        self._conn = None
+        # store -> dict chargé (même objet rendu à chaque load)
+        self._loaded = {}
+        # store -> {key: empreinte du JSON écrit}
+        self._digests = {}
+        # (store, téléphone) -> partition chargée
+        self._partitions = {}
+        # Revalidation : PRAGMA data_version change quand une autre connexion (worker,
+        # autre nœud) valide une écriture ; les magasins chargés sont alors relus
+        self._data_version = None
+        self._stale = set()
+
+    @property
+    def conn(self):
+        if self._conn is None:
+            with self._lock:
+                if self._conn is None:
+                    conn = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None)
+                    conn.execute("PRAGMA journal_mode=WAL")
+                    conn.execute("PRAGMA synchronous=NORMAL")
+                    conn.executescript(self.SCHEMA)
+                    self._conn = conn
+        return self._conn
+
+    @staticmethod
+    def _encode(value):
+        return dumps_compact(value)
+
+    def _revalidate(self):
+        with self._lock:
+            version = self.conn.execute("PRAGMA data_version").fetchone()[0]
+        if version == self._data_version:
+            return
+        self._data_version = version
+        self._stale.update(self._loaded)
+        self._partitions.clear()
+
+    def _refresh(self, store):
+        """Relit un magasin chargé, en place (les références existantes voient les écritures des autres)
+
+        Seules les clés écrites ou supprimées ailleurs sont remplacées : une modification
+        locale pas encore sauvegardée d'une autre clé est conservée.
+        """
+        with self._lock:
+            rows = self.conn.execute(
+                "SELECT key, data FROM documents WHERE store = ?", (store,)
+            ).fetchall()
+        data, digests = self._loaded[store], self._digests[store]
+        fresh = set()
+        for key, raw in rows:
+            fresh.add(key)
+            if digests.get(key) != hash(raw):
+                data[key] = loads(raw)
+                digests[key] = hash(raw)
+        for key in [key for key in digests if key not in fresh]:
+            del digests[key]
+            data.pop(key, None)
+        self._stale.discard(store)
+        return data
+
+    def load(self, store):
+        self._revalidate()
+        if store in self._stale:
+            return self._refresh(store)
+        if store in self._loaded:
+            return self._loaded[store]
+        with self._lock:
+            rows = self.conn.execute(
+                "SELECT key, data FROM documents WHERE store = ?", (store,)
+            ).fetchall()
+        data = {key: loads(raw) for key, raw in rows}
+        self._loaded[store] = data
+        self._digests[store] = {key: hash(raw) for key, raw in rows}
+        return data
+
+    def get(self, store, key, default=None):
+        with self._lock:
+            row = self.conn.execute(
+                "SELECT data FROM documents WHERE store = ? AND key = ?", (store, key)
+            ).fetchone()
+        return loads(row[0]) if row else default
+
+    def save(self, store, data):
+        """Écrit uniquement les clés modifiées ou supprimées depuis la dernière sauvegarde"""
+        if store in PARTITIONED_STORES:
+            for key in list(self._partitions):
+                if key[0] == store:
+                    del self._partitions[key]
+        if store not in self._digests:
+            self.load(store)
+        digests = self._digests[store]
+        values = {str(key): value for key, value in data.items()}
+        encoded = {key: self._encode(value) for key, value in values.items()}
+
+        changed = [(store, key, raw) for key, raw in encoded.items() if digests.get(key) != hash(raw)]
+        removed = [key for key in digests if key not in encoded]
+        if not changed and not removed:
+            return
+
+        with self._lock:
+            self.conn.execute("BEGIN")
+            try:
+                self.conn.executemany(
+                    "INSERT OR REPLACE INTO documents (store, key, data) VALUES (?, ?, ?)", changed
+                )
+                self.conn.executemany(
+                    "DELETE FROM documents WHERE store = ? AND key = ?",
+                    [(store, key) for key in removed]
+                )
+                self._update_indexes(store, {key: values[key] for _, key, _ in changed}, removed)
+                self.conn.execute("COMMIT")
+            except Exception:
+                self.conn.execute("ROLLBACK")
+                raise
+
+        for _, key, raw in changed:
+            digests[key] = hash(raw)
+        for key in removed:
+            del digests[key]
+        self._loaded[store] = data
+
+    def put(self, store, key, value):
+        self._put_encoded(store, key, value, self._encode(value))
+
+    def _put_encoded(self, store, key, value, raw):
+        with self._lock:
+            self.conn.execute("BEGIN")
+            try:
+                self.conn.execute(
+                    "INSERT OR REPLACE INTO documents (store, key, data) VALUES (?, ?, ?)",
+                    (store, key, raw)
+                )
+                self._update_indexes(store, {key: value}, [])
+                self.conn.execute("COMMIT")
+            except Exception:
+                self.conn.execute("ROLLBACK")
+                raise
+        if store in self._loaded:
+            self._loaded[store][key] = value
+            self._digests[store][key] = hash(raw)
+        if (store, key) in self._partitions:
+            self._partitions[(store, key)] = value
+
+    def delete(self, store, key):
+        with self._lock:
+            self.conn.execute("BEGIN")
+            try:
+                self.conn.execute("DELETE FROM documents WHERE store = ? AND key = ?", (store, key))
+                self._update_indexes(store, {}, [key])
+                self.conn.execute("COMMIT")
+            except Exception:
+                self.conn.execute("ROLLBACK")
+                raise
+        if store in self._loaded:
+            self._loaded[store].pop(key, None)
+            self._digests[store].pop(key, None)
+        self._partitions.pop((store, key), None)
+
+    def partitions(self, store):
+        """Téléphones ayant une partition (une ligne) pour ce magasin"""
+        with self._lock:
+            rows = self.conn.execute(
+                "SELECT key FROM documents WHERE store = ? ORDER BY key", (store,)
+            ).fetchall()
+        return [row[0] for row in rows]
+
+    def load_partition(self, store, phone, default=None):
+        self._revalidate()
+        if (store, phone) in self._partitions:
+            return self._partitions[(store, phone)]
+        with self._lock:
+            row = self.conn.execute(
+                "SELECT data FROM documents WHERE store = ? AND key = ?", (store, phone)
+            ).fetchone()
+        if row is None:
+            return default
+        data = loads(row[0])
+        self._partitions[(store, phone)] = data
+        return data
+
+    def save_partition(self, store, phone, data):
+        """Réécrit uniquement la ligne du compte concerné"""
+        self.put(store, phone, data)
+        self._partitions[(store, phone)] = data
+
+    def write_partition(self, store, phone, data):
+        """Comme save_partition, la transaction étant exécutée par le thread d'E/S
+
+        Le contenu est encodé tout de suite (instantané) ; retourne le Future de l'écriture.
+        """
+        raw = self._encode(data)
+        self._partitions[(store, phone)] = data
+        return storage.run(f"{store}/{phone}", self._put_encoded, store, phone, data, raw)
+
+    def _update_indexes(self, store, changed, removed):
+        """Maintient l'index des chats sources des redirections TeleFeed"""
+        if store != 'telefeed_redirections':
+            return
+        for phone in list(changed) + list(removed):
+            self.conn.execute("DELETE FROM redirection_sources WHERE phone = ?", (phone,))
+        rows = []
+        for phone, redirections in changed.items():
+            for redir_id, redir_data in redirections.items():
+                for source in redir_data.get('sources', []):
+                    rows.append((int(source), phone, redir_id))
+        self.conn.executemany(
+            "INSERT OR IGNORE INTO redirection_sources (source_chat_id, phone, redirection_id) VALUES (?, ?, ?)",
+            rows
+        )
+
+    def invalidate(self):
+        self._loaded.clear()
+        self._digests.clear()
+        self._partitions.clear()
+        self._stale.clear()
+
+    def routes_for_source(self, chat_id):
+        """Redirections TeleFeed dont chat_id est une source (requête indexée)"""
+        with self._lock:
+            return self.conn.execute(
+                "SELECT phone, redirection_id FROM redirection_sources WHERE source_chat_id = ?",
+                (int(chat_id),)
+            ).fetchall()
+
+    def users_expired_before(self, moment):
+        with self._lock:
+            rows = self.conn.execute(
+                "SELECT key FROM documents WHERE store = 'users' "
+                "AND json_extract(data, '$.expires') < ?", (moment,)
+            ).fetchall()
+        return [row[0] for row in rows]
+
+    def checkpoint(self):
+        """Reporte le journal WAL dans le fichier principal (avant une copie)"""
+        with self._lock:
+            self.conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+
+    def get_meta(self, key):
+        with self._lock:
+            row = self.conn.execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else None
+
+    def set_meta(self, key, value):
+        with self._lock:
+            self.conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)", (key, value))
+
+class Repository:
+    """Dépôt générique sur un magasin logique, indexé par clé"""
+
+    def __init__(self, backend, store):
+        self.backend = backend
+        self.store = store
+
+    def all(self):
+        return self.backend.load(self.store)
+
+    def get(self, key, default=None):
+        return self.backend.get(self.store, str(key), default)
+
+    def put(self, key, value):
+        self.backend.put(self.store, str(key), value)
+
+    def delete(self, key):
+        self.backend.delete(self.store, str(key))
+
+    def save_all(self, data):
+        self.backend.save(self.store, data)
+
+class PartitionedRepository(Repository):
+    """Magasin TeleFeed partitionné par téléphone, chargé compte par compte"""
+
+    def phones(self):
+        return self.backend.partitions(self.store)
+
+    def partition(self, phone, default=None):
+        return self.backend.load_partition(self.store, str(phone), default)
+
+    def save_partition(self, phone, data):
+        """Sauvegarde la partition ; Future de l'écriture (backend json) ou None (déjà écrite)"""
+        return self.backend.save_partition(self.store, str(phone), data)
+
+    def write_partition(self, phone, data):
+        """Sauvegarde la partition hors de la boucle asyncio ; retourne le Future de l'écriture"""
+        return self.backend.write_partition(self.store, str(phone), data)
+
+    def all(self):
+        return {phone: self.partition(phone) for phone in self.phones()}
+
+    def get(self, key, default=None):
+        return self.partition(key, default)
+
+    def put(self, key, value):
+        self.save_partition(key, value)
+
+    def delete(self, key):
+        self.save_partition(key, {})
+
+    def save_all(self, data):
+        for phone, value in data.items():
+            self.save_partition(phone, value)
+
+class UserRepository(Repository):
+    """Utilisateurs indexés par user_id et par date d'expiration"""
+
+    def __init__(self, backend):
+        super().__init__(backend, 'users')
+
+    def expired(self, now=None):
+        moment = (now or datetime.now()).isoformat()
+        return self.backend.users_expired_before(moment)
+
+class RedirectionRepository(PartitionedRepository):
+    """Redirections TeleFeed partitionnées par téléphone et indexées par chat source"""
+
+    def __init__(self, backend):
+        super().__init__(backend, 'telefeed_redirections')
+
+    def routes_for_source(self, chat_id):
+        return self.backend.routes_for_source(chat_id)
+
+class SessionRecordRepository(Repository):
+    """Sessions du SessionManager, indexées par (user_id, téléphone)"""
+
+    def __init__(self, backend):
+        super().__init__(backend, 'telegram_sessions')
+
+    @staticmethod
+    def key(user_id, phone_number):
+        return f"{user_id}:{phone_number}"
+
+    def active(self):
+        return [record for record in self.all().values() if record.get('is_active')]
+
+    def stale(self, days=7):
+        limit = (datetime.now() - timedelta(days=days)).isoformat()
+        return [record for record in self.active() if record.get('last_used', '') < limit]
+
+class Store:
+    """Façade regroupant les dépôts typés sur un même backend"""
+
+    def __init__(self, backend):
+        self.backend = backend
+        self.users = UserRepository(backend)
+        self.licenses = Repository(backend, 'licenses')
+        self.connections = Repository(backend, 'connections')
+        self.redirections = Repository(backend, 'redirections')
+        self.pending_redirections = Repository(backend, 'pending_redirections')
+        self.telegram_sessions = SessionRecordRepository(backend)
+        self.telefeed_redirections = RedirectionRepository(backend)
+
+    def repository(self, store):
+        """Dépôt générique pour n'importe quel magasin déclaré dans STORES"""
+        if store == 'telefeed_redirections':
+            return self.telefeed_redirections
+        if store in PARTITIONED_STORES:
+            return PartitionedRepository(self.backend, store)
+        return Repository(self.backend, store)
+
+    def export_pretty(self):
+        """Contenu de chaque magasin en JSON indenté, pour lecture humaine
+
+        Retourne un dict {nom_de_fichier: texte}.
+        """
+        return {
+            f"{name}.json": json.dumps(self.repository(name).all(), **JSON_FORMATS['pretty'])
+            for name in STORES if name not in SENSITIVE_STORES
+        }
+
+def _migrate_postgres_sessions(backend):
+    """Importe la table telegram_sessions Postgres si DATABASE_URL est défini"""
+    if not os.getenv("DATABASE_URL"):
+        return 0
+    try:
+        import psycopg2
+    except ImportError:
+        logger.warning("psycopg2 absent : sessions Postgres non migrées")
+        return 0
+
+    try:
+        connection = psycopg2.connect(os.getenv("DATABASE_URL"))
+        cursor = connection.cursor()
+        cursor.execute("""
+            SELECT user_id, phone_number, session_file, is_active, created_at, last_used
+            FROM telegram_sessions
+        """)
+        rows = cursor.fetchall()
+        cursor.close()
+        connection.close()
+    except Exception as e:
+        logger.error(f"Erreur lecture sessions Postgres: {e}")
+        return 0
+
+    for user_id, phone_number, session_file, is_active, created_at, last_used in rows:
+        backend.put('telegram_sessions', SessionRecordRepository.key(user_id, phone_number), {
+            'user_id': user_id,
+            'phone_number': phone_number,
+            'session_file': session_file,
+            'is_active': bool(is_active),
+            'created_at': created_at.isoformat() if created_at else None,
+            'last_used': last_used.isoformat() if last_used else None
+        })
+    return len(rows)
+
+def migrate_from_json(backend, force=False):
+    """Migration ponctuelle des fichiers JSON (et de la table Postgres) vers SQLite"""
+    if backend.get_meta('migrated_from_json') and not force:
+        return False
+
+    source = JsonBackend()
+    source.split_legacy_files()
+    source_store, target_store = Store(source), Store(backend)
+    for store in STORES:
+        data = source_store.repository(store).all()
+        if data:
+            target_store.repository(store).save_all(data)
+            logger.info(f"Migration {store}: {len(data)} entrées")
+
+    sessions = _migrate_postgres_sessions(backend)
+    if sessions:
+        logger.info(f"Migration telegram_sessions (Postgres): {sessions} entrées")
+
+    backend.set_meta('migrated_from_json', datetime.now().isoformat())
+    backend.set_meta('telefeed_partitioned', datetime.now().isoformat())
+    return True
+
+def partition_legacy_rows(backend):
+    """Base SQLite antérieure au partitionnement : mapping des messages indexé par message
+
+    Les lignes sont regroupées en une ligne par téléphone.
+    """
+    if backend.get_meta('telefeed_partitioned'):
+        return False
+
+    with backend._lock:
+        rows = backend.conn.execute(
+            "SELECT key, data FROM documents WHERE store = 'telefeed_message_mapping'"
+        ).fetchall()
+    legacy = {key: loads(raw) for key, raw in rows}
+    redirections = Store(backend).telefeed_redirections.all()
+
+    with backend._lock:
+        backend.conn.execute("DELETE FROM documents WHERE store = 'telefeed_message_mapping'")
+    backend.invalidate()
+    for phone, mapping in partition_message_mapping(legacy, redirections).items():
+        backend.save_partition('telefeed_message_mapping', phone, mapping)
+
+    backend.set_meta('telefeed_partitioned', datetime.now().isoformat())
+    logger.info(f"Mapping des messages partitionné par compte ({len(legacy)} entrées)")
+    return True
+
+def open_store(backend_name=STORAGE_BACKEND, path=STORAGE_DB_FILE):
+    """Stockage configuré, sans migration (voir prepare_store)"""
+    if backend_name == 'sqlite':
+        return Store(SQLiteBackend(path))
+    return Store(JsonBackend())
+
+def prepare_store():
+    """Migrations au démarrage du bot, avant le chargement des données
+
+    SQLite : import des fichiers JSON au premier démarrage et partitionnement des
+    anciennes lignes ; JSON : découpage des anciens fichiers globaux par compte.
+    Appelée par les points d'entrée (render_deploy, main), jamais à l'import.
+    """
+    if store.backend.name == 'sqlite':
+        migrate_from_json(store.backend)
+        partition_legacy_rows(store.backend)
+    else:
+        store.backend.split_legacy_files()
+
+# Instance globale
+store = open_store()
+
+if __name__ == "__main__":
+    if len(sys.argv) > 1 and sys.argv[1] == "migrate":
+        logging.basicConfig(level=logging.INFO)
+        target = store.backend if store.backend.name == 'sqlite' else SQLiteBackend(STORAGE_DB_FILE)
+        migrate_from_json(target, force='--force' in sys.argv)
+        print(f"✅ Migration terminée vers {STORAGE_DB_FILE}")
+    else:
+        print("Usage: python store.py migrate [--force]")
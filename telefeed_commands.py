@@ -3,59 +3,229 @@ TeleFeed Commands Implementation for Téléfoot Bot
 Integrates advanced message redirection and transformation features
 """
 
-import json
 import os
 import re
 import asyncio
-from datetime import datetime
+import itertools
+import time
+from datetime import datetime, timezone
 from telethon import TelegramClient, events
-from telethon.errors import SessionPasswordNeededError, PhoneCodeExpiredError
+from telethon.errors import (
+    SessionPasswordNeededError, PhoneCodeExpiredError, FloodWaitError, SlowModeWaitError, ScheduleTooMuchError,
+    MessageNotModifiedError
+)
 from telethon.tl.types import User, Chat, Channel
+from telethon.sessions import StringSession, SQLiteSession
+from store import store, STORAGE_BACKEND, STORAGE_DB_FILE, TELEFEED_ACCOUNTS_DIR
+from pending_auth import PendingAuthRegistry
+from breaker import BreakerBoard, CircuitOpenError, OPEN, CLOSED
+from delivery import (
+    DeadLetters, classify_error, retry_delay, retry_record, DELIVERY_MAX_ATTEMPTS, PERMANENT
+)
+from digest import content_digest
+from outbox import open_outbox, OUTBOX_COMPACT_AFTER, PENDING
+from timers import TimerQueue, EditCoalescer
+from post_scheduler import (
+    PostScheduler, open_post_store, parse_post_time, parse_duration, POST_MAX_PER_TENANT
+)
+from rate_limit import RateLimiter, DestinationPaused
+from restore import restore_concurrently, RestoreReport, RESTORED, EXPIRED, MISSING, DEFERRED
 
 # Configuration des admins
 ADMIN_IDS = ['1190237801']  # ID admin principal
 
-# Configuration des fichiers de données
-DATA_FILES = {
-    'sessions': 'telefeed_sessions.json',
-    'redirections': 'telefeed_redirections.json',
-    'transformations': 'telefeed_transformations.json',
-    'filters': 'telefeed_filters.json',
-    'whitelist': 'telefeed_whitelist.json',
-    'blacklist': 'telefeed_blacklist.json',
-    'settings': 'telefeed_settings.json',
-    'chats': 'telefeed_chats.json',
-    'delay': 'telefeed_delay.json'
+# Comptes sans redirection active : déconnectés après cette inactivité (secondes)
+IDLE_DISCONNECT_AFTER = int(os.getenv('IDLE_DISCONNECT_AFTER', '1800'))
+IDLE_CHECK_INTERVAL = int(os.getenv('IDLE_CHECK_INTERVAL', '300'))
+
+# Rattrapage des messages manqués : pause supplémentaire entre deux messages redirigés
+# (le débit est réglé par le limiteur d'envoi), pause entre deux lots lus (secondes)
+# et nombre maximal de messages rattrapés par chat source
+CATCHUP_SEND_DELAY = float(os.getenv('CATCHUP_SEND_DELAY', '0'))
+CATCHUP_FETCH_WAIT = float(os.getenv('CATCHUP_FETCH_WAIT', '1'))
+CATCHUP_MAX_MESSAGES = int(os.getenv('CATCHUP_MAX_MESSAGES', '500'))
+
+# Outbox : nombre de messages récents de la destination examinés avant de rejouer un envoi
+OUTBOX_VERIFY_DEPTH = int(os.getenv('OUTBOX_VERIFY_DEPTH', '20'))
+
+# Délais longs (secondes) : à partir de ce délai, le message est programmé chez Telegram
+# (schedule=) au lieu d'attendre dans la file locale ; conservation des programmations
+SERVER_SCHEDULE_AFTER = float(os.getenv('SERVER_SCHEDULE_AFTER', '60'))
+SCHEDULED_KEEP = 7 * 24 * 3600
+# Avance minimale acceptée par Telegram pour une programmation
+SCHEDULE_MIN_LEAD = 10
+
+# Arrêt : délai maximal (secondes) pour terminer les envois en cours
+DRAIN_TIMEOUT = float(os.getenv('DRAIN_TIMEOUT', '20'))
+
+# Partitions modifiées à chaque message (mapping, empreintes, marques de rattrapage) :
+# écrites au plus une fois par compte et par intervalle (secondes), hors de la boucle
+ACCOUNT_SAVE_INTERVAL = float(os.getenv('ACCOUNT_SAVE_INTERVAL', '1'))
+# Messages sources conservés par compte dans le mapping : au-delà, les plus anciens
+# sont oubliés (leurs éditions ne sont plus répercutées)
+MESSAGE_MAPPING_LIMIT = int(os.getenv('MESSAGE_MAPPING_LIMIT', '10000'))
+
+# Rôle d'un compte dans le routage
+ROLE_SOURCE = 'source'    # écoute des chats sources uniquement
+ROLE_SENDER = 'sender'    # envoi uniquement : connecté sans réception des mises à jour
+ROLE_BOTH = 'both'        # écoute ses sources et publie vers ses destinations
+
+# Magasins de données TeleFeed (voir store.STORES)
+DATA_STORES = {
+    'sessions': 'telefeed_sessions',
+    'redirections': 'telefeed_redirections',
+    'transformations': 'telefeed_transformations',
+    'filters': 'telefeed_filters',
+    'whitelist': 'telefeed_whitelist',
+    'blacklist': 'telefeed_blacklist',
+    'settings': 'telefeed_settings',
+    'chats': 'telefeed_chats',
+    'delay': 'telefeed_delay',
+    'message_mapping': 'telefeed_message_mapping',
+    'message_digests': 'telefeed_message_digests',
+    'high_water': 'telefeed_high_water',
+    'scheduled': 'telefeed_scheduled',
+    'string_sessions': 'telefeed_string_sessions'
 }
 
-def load_json_data(filename):
-    """Charge les données JSON"""
+def load_store_data(name):
+    """Charge un magasin TeleFeed"""
     try:
-        if os.path.exists(filename):
-            with open(filename, 'r', encoding='utf-8') as f:
-                return json.load(f)
-        return {}
+        return store.repository(DATA_STORES[name]).all()
     except Exception as e:
-        print(f"Erreur lors du chargement {filename}: {e}")
+        print(f"Erreur lors du chargement {name}: {e}")
         return {}
 
-def save_json_data(filename, data):
-    """Sauvegarde les données JSON"""
+def save_store_data(name, data):
+    """Sauvegarde un magasin TeleFeed"""
     try:
-        with open(filename, 'w', encoding='utf-8') as f:
-            json.dump(data, f, indent=2, ensure_ascii=False)
+        store.repository(DATA_STORES[name]).save_all(data)
         return True
     except Exception as e:
-        print(f"Erreur lors de la sauvegarde {filename}: {e}")
+        print(f"Erreur lors de la sauvegarde {name}: {e}")
         return False
 
+class AccountData:
+    """Magasin TeleFeed partitionné par téléphone, chargé à la demande compte par compte"""
+    
+    def __init__(self, name, factory=dict):
+        self.name = name
+        self.repository = store.repository(DATA_STORES[name])
+        self.factory = factory
+        self.loaded = {}
+        # Dernière écriture planifiée par compte (backend json : écrite par le thread d'E/S)
+        self.written = {}
+        # Comptes modifiés en attente de l'écriture groupée (save_later)
+        self.dirty = set()
+        self._flush_handle = None
+    
+    def get(self, phone_number, default=None):
+        """Partition du compte (chargée au premier accès)"""
+        if phone_number not in self.loaded:
+            try:
+                data = self.repository.partition(phone_number)
+            except Exception as e:
+                print(f"Erreur lors du chargement {self.name} ({phone_number}): {e}")
+                data = None
+            if data is None:
+                return default
+            self.loaded[phone_number] = data
+        return self.loaded[phone_number]
+    
+    def setdefault(self, phone_number):
+        """Partition du compte, créée vide si elle n'existe pas encore"""
+        data = self.get(phone_number)
+        if data is None:
+            data = self.loaded[phone_number] = self.factory()
+        return data
+    
+    def set(self, phone_number, data):
+        """Remplace la partition du compte et la sauvegarde"""
+        self.loaded[phone_number] = data
+        return self.save(phone_number)
+    
+    def save(self, phone_number):
+        """Sauvegarde uniquement la partition de ce compte"""
+        self.dirty.discard(phone_number)
+        try:
+            written = self.repository.save_partition(phone_number, self.setdefault(phone_number))
+            if written is not None:
+                self.written[phone_number] = written
+            return True
+        except Exception as e:
+            print(f"Erreur lors de la sauvegarde {self.name} ({phone_number}): {e}")
+            return False
+    
+    def save_later(self, phone_number):
+        """Sauvegarde groupée : la partition est écrite au plus une fois par ACCOUNT_SAVE_INTERVAL
+        
+        L'écriture est faite par le thread d'E/S. Hors boucle asyncio, elle est immédiate.
+        """
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            return self.save(phone_number)
+        self.dirty.add(phone_number)
+        if self._flush_handle is None:
+            self._flush_handle = loop.call_later(ACCOUNT_SAVE_INTERVAL, self.flush)
+        return True
+    
+    def flush(self):
+        """Lance l'écriture des partitions en attente ; retourne leurs téléphones"""
+        if self._flush_handle is not None:
+            self._flush_handle.cancel()
+            self._flush_handle = None
+        phones, self.dirty = self.dirty, set()
+        for phone_number in phones:
+            self._write(phone_number)
+        return phones
+    
+    def _write(self, phone_number):
+        data = self.loaded.get(phone_number)
+        if data is None:
+            return
+        try:
+            self.written[phone_number] = self.repository.write_partition(phone_number, data)
+        except Exception as e:
+            print(f"Erreur lors de la sauvegarde {self.name} ({phone_number}): {e}")
+    
+    async def save_pending(self):
+        """Arrêt : écrit les partitions en attente et attend la fin des écritures"""
+        for phone_number in self.flush() | set(self.written):
+            try:
+                await self.synced(phone_number)
+            except Exception as e:
+                print(f"Erreur lors de la sauvegarde {self.name} ({phone_number}): {e}")
+    
+    async def synced(self, phone_number):
+        """Attend que toutes les sauvegardes déjà faites de la partition soient sur disque
+        
+        Une écriture groupée encore en attente est lancée tout de suite. Lève l'erreur
+        d'écriture le cas échéant.
+        """
+        if phone_number in self.dirty:
+            self.dirty.discard(phone_number)
+            self._write(phone_number)
+        while True:
+            written = self.written.get(phone_number)
+            if written is None:
+                return
+            if written.done():
+                written.result()
+                return
+            await asyncio.wrap_future(written)
+    
+    def unload(self, phone_number):
+        """Libère la partition en mémoire (elle sera rechargée au prochain accès)"""
+        if phone_number in self.dirty:
+            self.dirty.discard(phone_number)
+            self._write(phone_number)
+        self.loaded.pop(phone_number, None)
+
 def is_user_authorized(user_id):
     """Vérifie si l'utilisateur est autorisé (a une licence active)"""
     try:
-        with open('users.json', 'r', encoding='utf-8') as f:
-            users = json.load(f)
-        
-        user_data = users.get(str(user_id))
+        user_data = store.users.get(user_id)
         if not user_data:
             return False
             
@@ -77,26 +247,85 @@ class TeleFeedManager:
     """Gestionnaire principal pour les fonctionnalités TeleFeed"""
     
     def __init__(self):
-        self.sessions = load_json_data(DATA_FILES['sessions'])
-        self.redirections = load_json_data(DATA_FILES['redirections'])
-        self.transformations = load_json_data(DATA_FILES['transformations'])
-        self.filters = load_json_data(DATA_FILES['filters'])
-        self.whitelist = load_json_data(DATA_FILES['whitelist'])
-        self.blacklist = load_json_data(DATA_FILES['blacklist'])
-        self.settings = load_json_data(DATA_FILES['settings'])
-        self.chats = load_json_data(DATA_FILES['chats'])
-        self.delay = load_json_data(DATA_FILES['delay'])
-        
-        # Mapping des messages pour édition
-        self.message_mapping = load_json_data('telefeed_message_mapping.json')
+        # Sessions enregistrées et sessions Telethon de tous les comptes (voir reload_sessions)
+        self.reload_sessions()
+        # Données partitionnées par compte : chargées lors du premier accès à la session
+        self.redirections = AccountData('redirections')
+        self.chats = AccountData('chats', factory=list)
+        self.message_mapping = AccountData('message_mapping')
+        # Empreinte du dernier contenu publié : {message source: {destination: empreinte}}
+        self.message_digests = AccountData('message_digests')
+        self.high_water = AccountData('high_water')
+        # Messages programmés chez Telegram (délais longs) : échéance et texte, par clé d'envoi
+        self.scheduled = AccountData('scheduled')
+        # Messages en cours de routage (téléphone, chat, message) et rattrapages en cours
+        self.routing = set()
+        self.catch_up_tasks = {}
+        # Envois en cours (nouveaux messages et éditions) ; False pendant l'arrêt
+        self.sends_in_flight = 0
+        self.accepting = True
+        # Débit d'envoi par compte et par destination (FloodWait appris, envois remis en file)
+        self.limiter = RateLimiter()
+        # Envois inscrits avant transmission et acquittés avec l'id du message publié
+        self.outbox = open_outbox()
+        self.acks_since_compaction = {}
+        # Envois abandonnés
+        self.dead_letters = DeadLetters()
+        # Échéances des envois différés et des nouveaux essais (index en mémoire de l'outbox)
+        self.timers = TimerQueue()
+        # Éditions rapprochées d'un même message source regroupées (dernière version par fenêtre)
+        self.edits = EditCoalescer(self.send_edit)
+        # Mode étalé : dernière échéance attribuée par (téléphone, redirection)
+        self.spread_until = {}
+        # Destinations en échec définitif (disjoncteurs), et envoi des alertes aux propriétaires
+        self.breakers = BreakerBoard()
+        self.notifier = None
+        # Publications programmées (menu Scheduler, /schedule), voir post_scheduler.py
+        self.posts = PostScheduler(
+            open_post_store(), self.publish_post, phones=self.owned_accounts,
+            retry_after=self.post_retry_after, dropped=self.post_dropped
+        )
+        self.transformations = load_store_data('transformations')
+        self.filters = load_store_data('filters')
+        self.whitelist = load_store_data('whitelist')
+        self.blacklist = load_store_data('blacklist')
+        self.settings = load_store_data('settings')
+        self.delay = load_store_data('delay')
         
         # Clients connectés
         self.clients = {}
         
+        # Connexions en attente du code d'authentification, par sender_id
+        self.pending_auth = PendingAuthRegistry()
+        
+        # Répartition multi-processus (voir sharding.py) :
+        # - côté bot, router transmet les commandes au worker propriétaire du compte
+        # - côté worker, shard_filter désigne les comptes de ce worker
+        self.router = None
+        self.shard = None
+        self.shard_filter = None
+        # Bot : utilisateur -> téléphone de la connexion en attente du code
+        self.login_routes = {}
+        # Plusieurs nœuds (voir leases.py) : seuls les comptes dont ce nœud détient le bail sont redirigés
+        self.leases = None
+        
+        # Client sur lequel les gestionnaires de redirection sont attachés, par compte
+        self.routed_clients = {}
+        
+        # Activation à la demande : dernière utilisation et verrou par compte
+        self.last_activity = {}
+        self.activation_locks = {}
+        
+        # Rôle avec lequel le client de chaque compte a été ouvert
+        self.client_roles = {}
+        
+        # Rapport de la dernière restauration des sessions
+        self.last_restore_report = None
+        
         # Note: La restauration des sessions se fait lors du premier appel
         
     def save_all_data(self):
-        """Sauvegarde toutes les données"""
+        """Sauvegarde les données globales (les partitions par compte sont sauvegardées séparément)"""
         # Filtrer les sessions pour exclure les clients TelegramClient
         sessions_to_save = {}
         for phone, session_data in self.sessions.items():
@@ -107,189 +336,1167 @@ class TeleFeedManager:
             else:
                 sessions_to_save[phone] = session_data
         
-        save_json_data(DATA_FILES['sessions'], sessions_to_save)
-        save_json_data(DATA_FILES['redirections'], self.redirections)
-        save_json_data(DATA_FILES['transformations'], self.transformations)
-        save_json_data(DATA_FILES['filters'], self.filters)
-        save_json_data(DATA_FILES['whitelist'], self.whitelist)
-        save_json_data(DATA_FILES['blacklist'], self.blacklist)
-        save_json_data(DATA_FILES['settings'], self.settings)
-        save_json_data(DATA_FILES['chats'], self.chats)
-        save_json_data(DATA_FILES['delay'], self.delay)
-        save_json_data('telefeed_message_mapping.json', self.message_mapping)
-    
-    async def restore_existing_sessions(self):
-        """Restaure automatiquement les sessions existantes"""
+        save_store_data('sessions', sessions_to_save)
+        save_store_data('transformations', self.transformations)
+        save_store_data('filters', self.filters)
+        save_store_data('whitelist', self.whitelist)
+        save_store_data('blacklist', self.blacklist)
+        save_store_data('settings', self.settings)
+        save_store_data('delay', self.delay)
+    
+    async def restore_existing_sessions(self, setup_handlers=True):
+        """Restaure automatiquement les sessions existantes, en parallèle
+        
+        Le nombre de comptes restaurés simultanément et le délai par compte sont
+        configurés par RESTORE_CONCURRENCY et RESTORE_TIMEOUT. Retourne un RestoreReport.
+        """
         print("🔄 Restauration des sessions existantes...")
+        self.import_session_files()
+        
+        phones = [phone_number for phone_number in self.restorable_accounts() if self.owns(phone_number)]
+        # Seuls les comptes avec une redirection active sont connectés au démarrage,
+        # les autres le seront à la première commande qui en a besoin
+        active_phones = [phone_number for phone_number in phones if self.has_active_redirections(phone_number)]
+        
+        # Rapport créé avant la restauration : l'avancement est visible via /status
+        report = RestoreReport(total=len(phones))
+        self.last_restore_report = report
+        for phone_number in phones:
+            if phone_number not in active_phones:
+                report.record(phone_number, DEFERRED, 0)
+        await restore_concurrently(
+            active_phones, lambda phone_number: self.restore_account(phone_number, setup_handlers),
+            report=report
+        )
         
-        for phone_number, session_data in self.sessions.items():
-            if isinstance(session_data, dict) and session_data.get('connected'):
+        # Sauvegarder les changements
+        self.save_all_data()
+        print(f"🔄 {report.summary()}")
+        return report
+    
+    def session_for(self, phone_number):
+        """Session Telethon du compte depuis le stockage unifié (None si absente)
+        
+        Un ancien fichier telefeed_{phone}.session est importé au premier accès.
+        """
+        record = self.string_sessions.get(phone_number)
+        if record:
+            return StringSession(record['session'])
+        
+        session_file = f"telefeed_{phone_number}.session"
+        if os.path.exists(session_file):
+            try:
+                legacy = SQLiteSession(session_file[:-len('.session')])
                 try:
-                    # Créer le client avec le nom de session existant
-                    session_name = f"telefeed_{phone_number}"
-                    
-                    # Vérifier si le fichier de session existe
-                    if os.path.exists(f"{session_name}.session"):
-                        # Utiliser API_ID et API_HASH par défaut (peuvent être modifiés)
-                        from config import API_ID, API_HASH
-                        client = TelegramClient(session_name, API_ID, API_HASH)
-                        
-                        await client.connect()
-                        
-                        # Vérifier si la session est toujours valide
-                        if await client.is_user_authorized():
-                            self.clients[phone_number] = client
-                            # Marquer la session comme restaurée
-                            self.sessions[phone_number]['restored_at'] = datetime.now().isoformat()
-                            print(f"✅ Session restaurée pour {phone_number}")
-                        else:
-                            print(f"⚠️ Session expirée pour {phone_number}")
-                            # Marquer la session comme expirée
-                            self.sessions[phone_number]['connected'] = False
-                            self.sessions[phone_number]['expired_at'] = datetime.now().isoformat()
-                            pass
-                    else:
-                        print(f"⚠️ Fichier de session manquant pour {phone_number}")
-                        # Marquer la session comme manquante
-                        self.sessions[phone_number]['connected'] = False
-                        self.sessions[phone_number]['missing_file'] = True
-                        
-                except Exception as e:
-                    print(f"❌ Erreur lors de la restauration de {phone_number}: {e}")
-                    # Marquer la session comme en erreur
-                    self.sessions[phone_number]['connected'] = False
-                    self.sessions[phone_number]['error'] = str(e)
+                    string = StringSession.save(legacy) if legacy.auth_key else None
+                finally:
+                    legacy.close()
+            except Exception as e:
+                print(f"⚠️ Import impossible de {session_file}: {e}")
+                return None
+            if string:
+                self.save_session_string(phone_number, string)
+                print(f"📥 Session {session_file} importée dans le stockage")
+                return StringSession(string)
+        return None
+    
+    def store_session(self, phone_number, client):
+        """Enregistre la session (clé d'authentification) du client dans le stockage"""
+        try:
+            self.save_session_string(phone_number, StringSession.save(client.session))
+        except Exception as e:
+            print(f"❌ Erreur sauvegarde session {phone_number}: {e}")
+    
+    def save_session_string(self, phone_number, string):
+        record = self.string_sessions.get(phone_number)
+        if record and record.get('session') == string:
+            return
+        record = {'session': string, 'updated_at': datetime.now().isoformat()}
+        self.string_sessions[phone_number] = record
+        store.repository(DATA_STORES['string_sessions']).put(phone_number, record)
+    
+    def import_session_files(self):
+        """Importe en une fois les anciens fichiers .session des comptes connectés"""
+        imported = 0
+        for phone_number, session_data in self.sessions.items():
+            if not isinstance(session_data, dict) or phone_number in self.string_sessions:
+                continue
+            if not self.owns(phone_number):
+                continue
+            if self.session_for(phone_number) is not None:
+                imported += 1
+        if imported:
+            print(f"📥 {imported} fichiers de session importés dans le stockage")
+        return imported
+    
+    def reload_sessions(self):
+        """Relit les sessions depuis le stockage
         
-        # Sauvegarder les changements
+        Les connexions se font dans le processus propriétaire du compte (worker, autre
+        nœud) : la copie de ce processus est relue avant de s'en servir.
+        """
+        self.sessions = load_store_data('sessions')
+        # Anciennes connexions en attente enregistrées dans les sessions (voir pending_auth)
+        for key in [key for key in self.sessions if key.startswith('temp_')]:
+            del self.sessions[key]
+        self.string_sessions = load_store_data('string_sessions')
+    
+    def restorable_accounts(self):
+        """Comptes dont la session est enregistrée comme connectée"""
+        self.reload_sessions()
+        return [
+            phone_number for phone_number, session_data in self.sessions.items()
+            if isinstance(session_data, dict) and session_data.get('connected')
+        ]
+    
+    def owns(self, phone_number):
+        """Ce processus gère-t-il ce compte ? (toujours vrai sans répartition ni baux)"""
+        if self.shard_filter is not None and not self.shard_filter(phone_number):
+            return False
+        return self.leases is None or self.leases.owns(phone_number)
+    
+    async def dispatch(self, phone_number, method, *args):
+        """Exécute une opération de compte dans le processus qui possède ce compte"""
+        if self.router is not None:
+            return await self.router.call(phone_number, method, *args)
+        result = getattr(self, method)(*args)
+        if asyncio.iscoroutine(result):
+            result = await result
+        return result
+    
+    async def dispatch_all(self, method, *args):
+        """Exécute l'opération dans chaque processus et retourne la liste des résultats"""
+        if self.router is None:
+            return [await self.dispatch(None, method, *args)]
+        results = await self.router.call_all(method, *args)
+        return [result for result in results.values() if not isinstance(result, Exception)]
+    
+    async def begin_login(self, sender_id, phone_number, api_id, api_hash):
+        """Démarre la connexion d'un compte ; le client en attente du code reste dans ce processus"""
+        result = await self.connect_account(phone_number, api_id, api_hash)
+        if result['status'] == 'code_sent':
+            self.pending_auth.add(sender_id, phone_number, result['phone_code_hash'], result['client'])
+        return {key: value for key, value in result.items() if key != 'client'}
+    
+    async def complete_login(self, sender_id, code):
+        """Termine la connexion en attente de cet utilisateur avec le code reçu"""
+        pending = self.pending_auth.get(sender_id)
+        if not pending:
+            return {'status': 'no_pending'}
+        
+        result = await self.verify_code(
+            pending['phone_number'], code, pending['phone_code_hash'], pending['client']
+        )
+        if result['status'] == 'connected':
+            # Le client est désormais celui du compte : retirer l'attente sans le déconnecter
+            self.pending_auth.pop(sender_id)
+        elif result['status'] == 'code_expired':
+            self.pending_auth.discard(sender_id)
+        result['phone_number'] = pending['phone_number']
+        return result
+    
+    async def refresh_account(self, phone_number):
+        """Prend en compte les changements de configuration du compte
+        
+        Dans un worker, les données modifiées par le bot sont relues depuis le stockage.
+        Le compte est connecté s'il a désormais une redirection active.
+        """
+        if self.shard is not None:
+            store.backend.invalidate()
+            self.reload_sessions()
+            self.transformations = load_store_data('transformations')
+            self.filters = load_store_data('filters')
+            self.whitelist = load_store_data('whitelist')
+            self.blacklist = load_store_data('blacklist')
+            self.settings = load_store_data('settings')
+            self.delay = load_store_data('delay')
+            self.redirections.unload(phone_number)
+        
+        if self.has_active_redirections(phone_number):
+            client = await self.ensure_client(phone_number)
+            if client is not None and self.needs_updates(phone_number):
+                # Point de départ du rattrapage pour les nouvelles sources
+                self.start_catch_up(client, phone_number)
+        return {'status': 'refreshed', 'connected': phone_number in self.clients}
+    
+    async def release_account(self, phone_number):
+        """Déconnecte le compte de ce processus (déplacement vers un autre worker)"""
+        client = self.clients.pop(phone_number, None)
+        self.routed_clients.pop(phone_number, None)
+        self.client_roles.pop(phone_number, None)
+        task = self.catch_up_tasks.pop(phone_number, None)
+        if task is not None:
+            task.cancel()
+        self.chats.unload(phone_number)
+        self.message_mapping.unload(phone_number)
+        self.message_digests.unload(phone_number)
+        self.high_water.unload(phone_number)
+        self.scheduled.unload(phone_number)
+        self.limiter.forget(phone_number)
+        self.breakers.forget(phone_number)
+        if client is not None:
+            await client.disconnect()
+        return {'status': 'released'}
+    
+    def connected_accounts(self):
+        """Comptes connectés dans ce processus"""
+        return list(self.clients)
+    
+    async def check_permissions(self, channel_id):
+        """Permissions de chaque compte connecté de ce processus dans un canal"""
+        report = ""
+        for phone_number, client in list(self.clients.items()):
+            try:
+                # Obtenir l'entité du canal
+                channel = await client.get_entity(channel_id)
+                
+                # Vérifier les permissions
+                permissions = await client.get_permissions(channel)
+                me = await client.get_me()
+                
+                report += f"📱 **{phone_number}** ({me.first_name})\n"
+                report += f"Canal : {channel.title}\n"
+                report += f"Type : {'Canal' if channel.broadcast else 'Groupe'}\n"
+                report += f"• Publier messages : {'✅' if permissions.post_messages else '❌'}\n"
+                report += f"• Modifier messages : {'✅' if permissions.edit_messages else '❌'}\n"
+                report += f"• Supprimer messages : {'✅' if permissions.delete_messages else '❌'}\n"
+                report += f"• Admin : {'✅' if permissions.is_admin else '❌'}\n\n"
+                
+            except Exception as e:
+                report += f"📱 **{phone_number}** - ❌ Erreur : {e}\n\n"
+        return report
+    
+    def has_active_redirections(self, phone_number):
+        """Le compte a-t-il au moins une redirection active ?"""
+        redirections = self.redirections.get(phone_number, {})
+        return any(redir_data.get('active', True) for redir_data in redirections.values())
+    
+    def account_role(self, phone_number):
+        """Classe le compte d'après ses redirections actives : source, sender ou both
+        
+        Un compte sans chat source à écouter (aucune redirection active) n'est
+        utilisé que pour envoyer ou pour les commandes : il est 'sender'.
+        """
+        listens = sends = False
+        for redir_data in self.redirections.get(phone_number, {}).values():
+            if not redir_data.get('active', True):
+                continue
+            listens = listens or bool(redir_data.get('sources'))
+            sends = sends or bool(redir_data.get('destinations'))
+        
+        if listens and sends:
+            return ROLE_BOTH
+        if listens:
+            return ROLE_SOURCE
+        return ROLE_SENDER
+    
+    def needs_updates(self, phone_number):
+        """Le compte doit-il recevoir les mises à jour Telegram ?
+        
+        Un compte possédé par un autre nœud n'est ouvert ici que pour les commandes.
+        """
+        return self.owns(phone_number) and self.account_role(phone_number) != ROLE_SENDER
+    
+    def activate_client(self, phone_number, client):
+        """Enregistre un client connecté pour ce compte"""
+        # Les FloodWait remontent au limiteur d'envoi au lieu d'être attendus en silence
+        client.flood_sleep_threshold = 0
+        self.clients[phone_number] = client
+        self.touch(phone_number)
+    
+    def touch(self, phone_number):
+        """Note une utilisation du compte (repousse la déconnexion pour inactivité)"""
+        self.last_activity[phone_number] = time.monotonic()
+    
+    async def ensure_client(self, phone_number):
+        """Retourne le client connecté du compte, en le connectant à la demande
+        
+        Retourne None si le compte n'a pas de session valide.
+        """
+        client = self.clients.get(phone_number)
+        if client is not None and client.is_connected():
+            if self.client_roles.get(phone_number) == ROLE_SENDER and self.needs_updates(phone_number):
+                # Le compte est devenu source : rouvrir le client avec réception des mises à jour
+                print(f"🔁 {phone_number} devient source, réouverture avec réception des mises à jour")
+                self.clients.pop(phone_number, None)
+                self.routed_clients.pop(phone_number, None)
+                await client.disconnect()
+            else:
+                self.touch(phone_number)
+                return client
+        
+        # Compte peut-être connecté depuis le démarrage (autre processus) ou déplacé ici
+        self.reload_sessions()
+        session_data = self.sessions.get(phone_number)
+        if not isinstance(session_data, dict) or not session_data.get('connected'):
+            return None
+        
+        lock = self.activation_locks.setdefault(phone_number, asyncio.Lock())
+        async with lock:
+            try:
+                status = await self.restore_account(phone_number)
+            except Exception as e:
+                print(f"❌ Activation impossible pour {phone_number}: {e}")
+                return None
+        if status != RESTORED:
+            self.save_all_data()
+            return None
+        
+        print(f"🔌 Compte {phone_number} activé à la demande")
+        self.touch(phone_number)
+        return self.clients.get(phone_number)
+    
+    async def disconnect_idle_accounts(self, idle_after=IDLE_DISCONNECT_AFTER):
+        """Déconnecte les comptes sans redirection active inutilisés depuis idle_after secondes
+        
+        La session reste marquée connectée : le compte sera réactivé à la prochaine commande.
+        """
+        now = time.monotonic()
+        disconnected = []
+        for phone_number, client in list(self.clients.items()):
+            if self.has_active_redirections(phone_number):
+                continue
+            if now - self.last_activity.get(phone_number, 0) < idle_after:
+                continue
+            
+            self.clients.pop(phone_number, None)
+            self.routed_clients.pop(phone_number, None)
+            self.client_roles.pop(phone_number, None)
+            self.chats.unload(phone_number)
+            self.message_mapping.unload(phone_number)
+            self.message_digests.unload(phone_number)
+            try:
+                await client.disconnect()
+            except Exception as e:
+                print(f"⚠️ Erreur déconnexion {phone_number}: {e}")
+            disconnected.append(phone_number)
+        
+        if disconnected:
+            print(f"💤 {len(disconnected)} comptes inactifs déconnectés: {', '.join(disconnected)}")
+        return disconnected
+    
+    async def drain(self, timeout=DRAIN_TIMEOUT):
+        """Arrêt propre du routage, avant la déconnexion des clients
+        
+        Les nouveaux messages ne sont plus acceptés et les marques des sources reculent
+        avant le plus ancien message en cours : tout message non terminé est rattrapé
+        au prochain démarrage (les destinations déjà servies sont ignorées grâce au
+        mapping). Les envois en cours ont jusqu'à timeout secondes pour se terminer.
+        Retourne le nombre d'envois interrompus.
+        """
+        self.accepting = False
+        for phone_number, chat_id, message_id in sorted(self.routing):
+            self.rewind_high_water(phone_number, chat_id, message_id)
+        
+        deadline = time.monotonic() + timeout
+        tasks = [task for task in self.catch_up_tasks.values() if not task.done()]
+        # Éditions encore dans leur fenêtre de regroupement : envoyées tout de suite
+        tasks.append(asyncio.ensure_future(self.edits.flush()))
+        while (self.sends_in_flight or any(not task.done() for task in tasks)) and time.monotonic() < deadline:
+            await asyncio.sleep(0.1)
+        
+        interrupted = self.sends_in_flight
+        for task in tasks:
+            task.cancel()
+        if interrupted:
+            print(f"⚠️ Arrêt : {interrupted} envois interrompus, repris au prochain démarrage")
+        else:
+            print("✅ Arrêt : tous les envois en cours sont terminés")
+        
+        # Partitions écrites par lots : les dernières modifications sont écrites maintenant
+        for data in (self.message_mapping, self.message_digests, self.high_water):
+            await data.save_pending()
         self.save_all_data()
-        print(f"🔄 {len(self.clients)} sessions restaurées")
+        return interrupted
     
-    async def setup_redirection_handlers(self, client, phone_number):
-        """Configure les gestionnaires de redirection pour un client TeleFeed"""
-        from telethon import events
+    async def run_idle_policy(self, interval=IDLE_CHECK_INTERVAL):
+        """Boucle de déconnexion des comptes inactifs"""
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                await self.disconnect_idle_accounts()
+            except Exception as e:
+                print(f"❌ Erreur politique d'inactivité: {e}")
+    
+    async def restore_account(self, phone_number, setup_handlers=True):
+        """Restaure la session d'un compte et retourne son statut de restauration
         
-        async def message_handler(event, is_edit=False):
-            """Gestionnaire des messages pour redirection"""
-            # Vérifier les redirections pour ce numéro
-            redirections = self.redirections.get(phone_number, {})
+        Les redirections du compte sont actives dès que sa session est restaurée,
+        sans attendre les autres comptes.
+        """
+        existing = self.clients.get(phone_number)
+        if existing is not None and existing.is_connected():
+            return RESTORED
+        
+        # Session du compte depuis le stockage unifié
+        session = self.session_for(phone_number)
+        
+        if session is None:
+            print(f"⚠️ Session manquante pour {phone_number}")
+            # Marquer la session comme manquante
+            self.sessions[phone_number]['connected'] = False
+            self.sessions[phone_number]['missing_session'] = True
+            return MISSING
+        
+        # Utiliser API_ID et API_HASH par défaut (peuvent être modifiés)
+        from config import API_ID, API_HASH
+        
+        # Un compte qui ne fait qu'envoyer n'a pas besoin du flux de mises à jour
+        receive_updates = self.needs_updates(phone_number)
+        role = self.account_role(phone_number) if receive_updates else ROLE_SENDER
+        client = TelegramClient(session, API_ID, API_HASH, receive_updates=receive_updates)
+        
+        try:
+            await client.connect()
             
-            for redir_id, redir_data in redirections.items():
-                if not redir_data.get('active', True):
+            # Vérifier si la session est toujours valide
+            if not await client.is_user_authorized():
+                print(f"⚠️ Session expirée pour {phone_number}")
+                # Marquer la session comme expirée
+                self.sessions[phone_number]['connected'] = False
+                self.sessions[phone_number]['expired_at'] = datetime.now().isoformat()
+                await client.disconnect()
+                return EXPIRED
+            
+            self.activate_client(phone_number, client)
+            self.client_roles[phone_number] = role
+            self.store_session(phone_number, client)
+            # Marquer la session comme restaurée
+            self.sessions[phone_number]['restored_at'] = datetime.now().isoformat()
+            if setup_handlers and receive_updates:
+                await self.setup_redirection_handlers(client, phone_number)
+                # Messages publiés dans les sources pendant que le compte était déconnecté
+                self.start_catch_up(client, phone_number)
+            print(f"✅ Session restaurée pour {phone_number} (rôle: {role})")
+            return RESTORED
+            
+        except asyncio.CancelledError:
+            # Délai dépassé : libérer la connexion, la session reste à restaurer
+            self.clients.pop(phone_number, None)
+            await client.disconnect()
+            raise
+        except Exception as e:
+            print(f"❌ Erreur lors de la restauration de {phone_number}: {e}")
+            # Marquer la session comme en erreur
+            self.sessions[phone_number]['connected'] = False
+            self.sessions[phone_number]['error'] = str(e)
+            self.clients.pop(phone_number, None)
+            await client.disconnect()
+            raise
+    
+    def source_chats(self, phone_number):
+        """Chats sources des redirections actives du compte"""
+        sources = set()
+        for redir_data in self.redirections.get(phone_number, {}).values():
+            if redir_data.get('active', True):
+                sources.update(redir_data.get('sources', []))
+        return sources
+    
+    def advance_high_water(self, phone_number, chat_id, message_id):
+        """Mémorise le dernier message traité d'un chat source
+        
+        Les marques sont figées pendant l'arrêt : tout ce qui suit est repris au démarrage.
+        """
+        if not self.accepting:
+            return
+        marks = self.high_water.setdefault(phone_number)
+        if message_id > marks.get(str(chat_id), 0):
+            marks[str(chat_id)] = message_id
+            self.high_water.save_later(phone_number)
+    
+    def rewind_high_water(self, phone_number, chat_id, message_id):
+        """Recule la marque d'un chat source juste avant ce message (repris au démarrage)"""
+        marks = self.high_water.setdefault(phone_number)
+        if marks.get(str(chat_id), 0) >= message_id:
+            marks[str(chat_id)] = message_id - 1
+            self.high_water.save(phone_number)
+    
+    async def route_message(self, client, phone_number, event, is_edit=False):
+        """Redirige un message (événement en direct ou message rattrapé) selon les redirections du compte"""
+        # Bail perdu (compte repris par un autre nœud) : ne pas envoyer en double
+        if not self.owns(phone_number):
+            return
+        # Arrêt en cours : le message sera rattrapé au prochain démarrage
+        if not self.accepting:
+            return
+        # Chat qui n'est source d'aucune redirection (nouveau message comme édition)
+        if event.chat_id not in self.source_chats(phone_number):
+            return
+        if is_edit:
+            if self.edits.submit((phone_number, event.chat_id, event.id), (client, event)):
+                return
+            await self.send_edit((phone_number, event.chat_id, event.id), (client, event))
+            return
+        
+        # Un message n'est traité qu'une fois, même reçu en direct pendant son rattrapage
+        claim = (phone_number, event.chat_id, event.id)
+        if claim in self.routing:
+            return
+        self.routing.add(claim)
+        self.sends_in_flight += 1
+        try:
+            await self.forward_message(client, phone_number, event)
+        finally:
+            self.sends_in_flight -= 1
+            self.routing.discard(claim)
+        self.advance_high_water(phone_number, event.chat_id, event.id)
+    
+    async def send_edit(self, edit_key, edit):
+        """Répercute la dernière version d'un message source édité vers ses destinations"""
+        phone_number = edit_key[0]
+        client, event = edit
+        if not self.owns(phone_number):
+            return
+        self.sends_in_flight += 1
+        try:
+            await self.forward_message(client, phone_number, event, is_edit=True)
+        finally:
+            self.sends_in_flight -= 1
+    
+    def record_delivery(self, phone_number, delivery_key, source_key, dest_id, message_id, text=None):
+        """Acquitte un envoi de l'outbox et met à jour le mapping du message source
+        
+        Avec text, l'empreinte du contenu publié est conservée (message_digests) :
+        une édition au résultat identique n'est pas envoyée. Le mapping et les empreintes
+        sont écrits par lots (save_later) : d'ici là, l'acquittement du journal fait foi.
+        """
+        self.outbox.ack(phone_number, delivery_key, message_id)
+        if self.breakers.success(phone_number, dest_id) == CLOSED:
+            self.notify_owners(phone_number, dest_id, f"✅ Destination {dest_id} ({phone_number}) de nouveau joignable : envois repris")
+        mapping = self.message_mapping.setdefault(phone_number)
+        entry = mapping.setdefault(source_key, {})
+        entry[str(dest_id)] = message_id
+        if text is not None:
+            self.message_digests.setdefault(phone_number).setdefault(source_key, {})[str(dest_id)] = content_digest(text)
+        if len(mapping) > MESSAGE_MAPPING_LIMIT * 1.1:
+            self.prune_mapping(phone_number)
+        self.message_mapping.save_later(phone_number)
+        if text is not None:
+            self.message_digests.save_later(phone_number)
+        
+        self.acks_since_compaction[phone_number] = self.acks_since_compaction.get(phone_number, 0) + 1
+        if self.acks_since_compaction[phone_number] >= OUTBOX_COMPACT_AFTER:
+            self.acks_since_compaction[phone_number] = 0
+            asyncio.ensure_future(self.compact_outbox(phone_number))
+    
+    def prune_mapping(self, phone_number):
+        """Oublie les messages sources les plus anciens au-delà de MESSAGE_MAPPING_LIMIT"""
+        mapping = self.message_mapping.setdefault(phone_number)
+        digests = self.message_digests.setdefault(phone_number)
+        for source_key in list(itertools.islice(mapping, max(0, len(mapping) - MESSAGE_MAPPING_LIMIT))):
+            del mapping[source_key]
+            digests.pop(source_key, None)
+        self.message_digests.save_later(phone_number)
+    
+    def record_sent(self, phone_number, record, message_id, scheduled=False):
+        """Acquitte un envoi publié ou programmé chez Telegram
+        
+        Un message programmé a un id provisoire : l'échéance et le texte sont conservés
+        pour retrouver le message publié (édition après la publication).
+        """
+        self.record_delivery(
+            phone_number, record['key'], record['source_key'], record['dest_id'], message_id, record['text']
+        )
+        if not scheduled:
+            return
+        entries = self.scheduled.setdefault(phone_number)
+        now = time.time()
+        for key in [key for key, entry in entries.items() if entry['at'] < now - SCHEDULED_KEEP]:
+            del entries[key]
+        entries[record['key']] = {'at': record['schedule_at'], 'text': record['text']}
+        self.scheduled.save(phone_number)
+    
+    async def publish(self, client, phone_number, record):
+        """Publie l'envoi, ou le programme chez Telegram si son échéance est lointaine
+        
+        Retourne (message, programmé), ou (None, False) si l'envoi repasse par la file locale.
+        """
+        # L'envoi ne part qu'une fois inscrit sur disque (écriture par lots de l'outbox)
+        await self.outbox.synced(phone_number)
+        schedule_at = record.get('schedule_at')
+        if schedule_at and schedule_at - time.time() >= SCHEDULE_MIN_LEAD:
+            schedule = datetime.fromtimestamp(schedule_at, tz=timezone.utc)
+            try:
+                sent_message = await self.deliver(client, phone_number, record['dest_id'], record['text'], schedule)
+                return sent_message, True
+            except ScheduleTooMuchError as e:
+                # Trop de messages programmés dans ce chat (limite Telegram) : minuteur local
+                print(f"⏱️ Programmation refusée pour {record['dest_id']}, envoi local à l'échéance")
+                self.outbox.reschedule(phone_number, record['key'], record.get('attempts', 0), schedule_at, str(e))
+                self.timers.schedule((phone_number, record['key']), schedule_at)
+                return None, False
+        sent_message = await self.deliver(client, phone_number, record['dest_id'], record['text'])
+        return sent_message, False
+    
+    async def published_message_id(self, client, phone_number, delivery_key, dest_id):
+        """Id du message publié à partir d'un message programmé (None s'il est introuvable)"""
+        entry = self.scheduled.get(phone_number, {}).get(delivery_key)
+        if entry is None:
+            return None
+        texts = (entry['text'], f"🔄 {entry['text']}")
+        found = None
+        async for message in client.iter_messages(
+            dest_id, limit=OUTBOX_VERIFY_DEPTH, offset_date=datetime.fromtimestamp(entry['at'] + 60, tz=timezone.utc)
+        ):
+            if message.date.timestamp() < entry['at'] - 60:
+                break
+            if message.out and (message.message or '') in texts:
+                found = message.id
+                break
+        if found is not None:
+            source_key = delivery_key.rsplit(':', 1)[0]
+            self.message_mapping.setdefault(phone_number).setdefault(source_key, {})[str(dest_id)] = found
+            self.message_mapping.save(phone_number)
+            del self.scheduled.get(phone_number)[delivery_key]
+            self.scheduled.save(phone_number)
+        return found
+    
+    async def compact_outbox(self, phone_number):
+        """Retire de l'outbox les envois acquittés, une fois le mapping synchronisé sur disque
+        
+        Jusque-là, les acquittements du journal sont la seule trace durable des envois faits
+        (replay_outbox en reconstruit le mapping) : ils ne sont retirés qu'ensuite.
+        """
+        try:
+            await self.message_mapping.synced(phone_number)
+        except Exception as e:
+            print(f"⚠️ Compactage de l'outbox {phone_number} reporté, mapping non écrit: {e}")
+            return
+        self.outbox.compact(phone_number)
+    
+    def delivery_failed(self, phone_number, record, error):
+        """Échec d'un envoi de l'outbox : nouvel essai planifié ou lettre morte
+        
+        Chaque essai est une échéance dans l'outbox, exécutée une fois par le planificateur.
+        """
+        if record is None:
+            return
+        if isinstance(error, CircuitOpenError) and record.get('delayed') and not record.get('attempts'):
+            # Envoi différé vers une destination suspendue : ignoré comme un envoi direct
+            self.outbox.drop(phone_number, record['key'], str(error))
+            return
+        kind = classify_error(error)
+        # Destination en pause : aucune requête envoyée, l'essai n'est pas compté
+        attempts = record.get('attempts', 0) + (0 if isinstance(error, DestinationPaused) else 1)
+        if kind == PERMANENT and not isinstance(error, CircuitOpenError):
+            self.destination_failed(phone_number, record['dest_id'], error)
+        elif kind != PERMANENT:
+            self.breakers.inconclusive(phone_number, record['dest_id'])
+        if kind == PERMANENT or attempts >= DELIVERY_MAX_ATTEMPTS:
+            record = dict(record, attempts=attempts)
+            letter_id = self.dead_letters.add(phone_number, record, error, kind)
+            self.outbox.drop(phone_number, record['key'], str(error))
+            print(f"☠️ Envoi {record['key']} ({phone_number}) en lettre morte {letter_id} [{kind}]: {error}")
+            return
+        
+        delay = retry_delay(error, attempts)
+        self.outbox.reschedule(phone_number, record['key'], attempts, time.time() + delay, str(error))
+        print(f"🔁 Envoi {record['key']} ({phone_number}) replanifié dans {delay:.0f}s "
+              f"(essai {attempts}/{DELIVERY_MAX_ATTEMPTS}, {kind})")
+        self.timers.schedule((phone_number, record['key']), time.time() + delay)
+    
+    def destination_failed(self, phone_number, dest_id, error):
+        """Échec définitif vers une destination : ouvre son disjoncteur après plusieurs échecs"""
+        if self.breakers.failure(phone_number, dest_id, error) == OPEN:
+            print(f"🔌 Disjoncteur ouvert pour {dest_id} ({phone_number}): {error}")
+            self.notify_owners(
+                phone_number, dest_id,
+                f"⚠️ Destination {dest_id} injoignable depuis le compte {phone_number} ({error}).\n"
+                f"Les envois sont suspendus ; un essai est refait périodiquement. "
+                f"Vérifiez que le compte est toujours membre et peut écrire dans ce chat."
+            )
+    
+    def notify_owners(self, phone_number, dest_id, text):
+        """Prévient les propriétaires des redirections du compte vers cette destination"""
+        owners = {
+            redir_data.get('owner')
+            for redir_data in self.redirections.get(phone_number, {}).values()
+            if dest_id in redir_data.get('destinations', [])
+        } or {None}
+        for owner in owners:
+            self.notify(owner, text)
+    
+    def notify(self, user_id, text):
+        """Message du bot à un utilisateur (admin si user_id est None)"""
+        if self.notifier is None:
+            print(f"📣 {text}")
+            return
+        
+        async def send():
+            try:
+                await self.notifier(user_id, text)
+            except Exception as e:
+                print(f"⚠️ Notification impossible ({user_id}): {e}")
+        asyncio.ensure_future(send())
+    
+    async def send_scheduled(self, phone_number, record):
+        """Envoi arrivé à échéance : message différé ou nouvel essai"""
+        key, dest_id = record['key'], record['dest_id']
+        message_id = self.message_mapping.get(phone_number, {}).get(record['source_key'], {}).get(str(dest_id))
+        if message_id is not None:
+            self.record_delivery(phone_number, key, record['source_key'], dest_id, message_id)
+            return
+        
+        client = await self.ensure_client(phone_number)
+        try:
+            if not self.breakers.allow(phone_number, dest_id):
+                raise CircuitOpenError(f"destination {dest_id} suspendue")
+            if client is None:
+                raise ConnectionError(f"compte {phone_number} non connecté")
+            sent_message, scheduled = await self.publish(client, phone_number, record)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            self.delivery_failed(phone_number, record, e)
+            return
+        if sent_message is None:
+            return
+        self.record_sent(phone_number, record, sent_message.id, scheduled)
+        if record.get('attempts'):
+            print(f"✅ Envoi {key} réussi à l'essai {record['attempts'] + 1}")
+    
+    def schedule_pending(self):
+        """Inscrit dans la file les échéances de l'outbox des comptes de ce processus"""
+        for phone_number in self.restorable_accounts():
+            if not self.owns(phone_number):
+                continue
+            for record in self.outbox.scheduled(phone_number):
+                self.timers.schedule((phone_number, record['key']), record['next_attempt'])
+    
+    def fire_scheduled(self, timer_key):
+        """Échéance atteinte : l'envoi part dans sa propre tâche (la file n'attend pas)"""
+        phone_number, key = timer_key
+        if not self.owns(phone_number) or not self.accepting:
+            # Reste dans l'outbox : repris par le propriétaire ou au prochain démarrage
+            return
+        record = self.outbox.get(phone_number, key)
+        if record is None or record.get('state') != PENDING:
+            return
+        
+        async def send():
+            self.sends_in_flight += 1
+            try:
+                await self.send_scheduled(phone_number, record)
+            except Exception as e:
+                print(f"❌ Erreur envoi planifié {key}: {e}")
+            finally:
+                self.sends_in_flight -= 1
+        asyncio.ensure_future(send())
+    
+    async def run_send_scheduler(self):
+        """Boucles des envois différés et nouveaux essais (timers.py) et des publications programmées"""
+        await asyncio.gather(
+            self.timers.run(self.fire_scheduled, resync=self.schedule_pending),
+            self.posts.run()
+        )
+    
+    def owned_accounts(self):
+        """Comptes de ce processus pour les publications programmées (None : tous)"""
+        if self.shard_filter is None and self.leases is None:
+            return None
+        return [phone_number for phone_number in self.restorable_accounts() if self.owns(phone_number)]
+    
+    async def publish_post(self, post):
+        """Publie une publication programmée depuis son compte"""
+        phone_number, dest_id = post['phone'], post['dest_id']
+        if not self.accepting:
+            raise ConnectionError("arrêt en cours")
+        client = await self.ensure_client(phone_number)
+        if client is None:
+            raise ConnectionError(f"compte {phone_number} non connecté")
+        if not self.breakers.allow(phone_number, dest_id):
+            raise CircuitOpenError(f"destination {dest_id} suspendue")
+        self.sends_in_flight += 1
+        try:
+            await self.deliver(client, phone_number, dest_id, post['text'])
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            if classify_error(e) == PERMANENT:
+                self.destination_failed(phone_number, dest_id, e)
+            else:
+                self.breakers.inconclusive(phone_number, dest_id)
+            raise
+        finally:
+            self.sends_in_flight -= 1
+        if self.breakers.success(phone_number, dest_id) == CLOSED:
+            self.notify_owners(phone_number, dest_id, f"✅ Destination {dest_id} ({phone_number}) de nouveau joignable : envois repris")
+    
+    @staticmethod
+    def post_retry_after(error, attempts):
+        """Délai avant un nouvel essai d'une publication ponctuelle (None : abandon)"""
+        if classify_error(error) == PERMANENT or attempts >= DELIVERY_MAX_ATTEMPTS:
+            return None
+        return retry_delay(error, attempts)
+    
+    def post_dropped(self, post, error):
+        self.notify(
+            int(post['tenant']),
+            f"❌ Publication programmée {post['id']} vers {post['dest_id']} abandonnée ({error})."
+        )
+    
+    def account_owned_by(self, phone_number, user_id):
+        """L'utilisateur gère ce compte : admin, ou propriétaire d'une de ses redirections"""
+        if str(user_id) in ADMIN_IDS:
+            return True
+        return any(
+            str(redir_data.get('owner')) == str(user_id)
+            for redir_data in self.redirections.get(phone_number, {}).values()
+        )
+    
+    def schedule_post(self, tenant, phone_number, dest_id, text, due_at, every=None):
+        """Programme une publication pour un utilisateur ; retourne son identifiant"""
+        if not self.account_owned_by(phone_number, tenant):
+            raise ValueError(f"le compte {phone_number} ne vous appartient pas")
+        if phone_number not in self.restorable_accounts():
+            raise ValueError(f"compte {phone_number} non connecté")
+        if self.posts.store.count(tenant) >= POST_MAX_PER_TENANT:
+            raise ValueError(f"limite de {POST_MAX_PER_TENANT} publications programmées atteinte")
+        return self.posts.add(tenant, phone_number, dest_id, text, due_at, every)
+    
+    def wake_posts(self):
+        """Publication ajoutée ou compte repris : réveille le programmateur"""
+        self.posts.wake()
+    
+    def replay_dead_letter(self, letter_id):
+        """Remet une lettre morte dans l'outbox pour un essai immédiat"""
+        if self.shard is not None:
+            store.backend.invalidate()
+        letter = self.dead_letters.pop(letter_id)
+        if letter is None:
+            return False
+        phone_number = letter['phone_number']
+        self.outbox.drop(phone_number, letter['key'])
+        record = retry_record(letter)
+        self.outbox.enqueue(phone_number, letter['key'], record)
+        self.timers.schedule((phone_number, letter['key']), record['next_attempt'])
+        return True
+    
+    def clear_dead_letters(self):
+        """Supprime les lettres mortes (sans nouvel essai)"""
+        if self.shard is not None:
+            store.backend.invalidate()
+        letters = self.dead_letters.all()
+        for letter_id in letters:
+            self.dead_letters.pop(letter_id)
+        return len(letters)
+    
+    async def find_delivered(self, client, record):
+        """Message déjà publié pour cet envoi (arrêt entre l'envoi et l'acquittement)"""
+        # Variante « 🔄 » : messages publiés par l'ancien envoi de repli
+        texts = (record['text'], f"🔄 {record['text']}")
+        async for message in client.iter_messages(record['dest_id'], limit=OUTBOX_VERIFY_DEPTH):
+            if message.date.timestamp() < record['created_at'] - 60:
+                break
+            if message.out and (message.message or '') in texts:
+                return message.id
+        return None
+    
+    async def find_scheduled(self, client, record):
+        """Message déjà programmé chez Telegram pour cet envoi"""
+        texts = (record['text'], f"🔄 {record['text']}")
+        async for message in client.iter_messages(record['dest_id'], scheduled=True):
+            if (message.message or '') in texts:
+                return message.id
+        return None
+    
+    async def replay_outbox(self, client, phone_number):
+        """Rejoue les envois non acquittés du compte (démarrage ou reconnexion)
+        
+        Un envoi déjà présent dans le mapping ou dans la destination est seulement
+        acquitté : aucun message n'est publié deux fois.
+        """
+        # Acquittements dont le mapping n'a pas été écrit avant l'arrêt
+        acked = self.outbox.acked(phone_number)
+        if acked:
+            mapping = self.message_mapping.setdefault(phone_number)
+            for record in acked:
+                mapping.setdefault(record['source_key'], {})[str(record['dest_id'])] = record['message_id']
+            self.message_mapping.save(phone_number)
+        
+        replayed = 0
+        for record in self.outbox.pending(phone_number):
+            if not self.owns(phone_number) or not self.accepting:
+                return replayed
+            if record.get('next_attempt') is not None:
+                # Envoi différé ou nouvel essai : laissé à la file d'échéances
+                self.timers.schedule((phone_number, record['key']), record['next_attempt'])
+                continue
+            key, dest_id = record['key'], record['dest_id']
+            message_id = self.message_mapping.get(phone_number, {}).get(record['source_key'], {}).get(str(dest_id))
+            scheduled = False
+            try:
+                if message_id is None and not self.breakers.allow(phone_number, dest_id):
+                    raise CircuitOpenError(f"destination {dest_id} suspendue")
+                if message_id is None:
+                    message_id = await self.find_delivered(client, record)
+                if message_id is None and record.get('schedule_at'):
+                    message_id = await self.find_scheduled(client, record)
+                    scheduled = message_id is not None
+                if message_id is None:
+                    sent_message, scheduled = await self.publish(client, phone_number, record)
+                    if sent_message is None:
+                        continue
+                    message_id = sent_message.id
+                    replayed += 1
+            except Exception as e:
+                self.delivery_failed(phone_number, record, e)
+                continue
+            self.record_sent(phone_number, record, message_id, scheduled)
+        
+        if replayed:
+            print(f"📤 {replayed} envois rejoués depuis l'outbox pour {phone_number}")
+        await self.compact_outbox(phone_number)
+        return replayed
+    
+    async def catch_up(self, client, phone_number, delay=CATCHUP_SEND_DELAY, limit=CATCHUP_MAX_MESSAGES):
+        """Redirige les messages publiés dans les chats sources pendant une interruption
+        
+        Les messages postérieurs au dernier message traité de chaque source sont lus par
+        lots (iter_messages avec min_id), du plus ancien au plus récent, et passent par le
+        routage normal (débit réglé par le limiteur d'envoi). Une source sans historique
+        commence au message le plus récent (pas de reprise de l'historique complet).
+        """
+        # Envois commencés avant l'interruption d'abord, dans leur ordre d'origine
+        try:
+            await self.replay_outbox(client, phone_number)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            print(f"⚠️ Rejeu de l'outbox impossible ({phone_number}): {e}")
+        
+        caught_up = 0
+        
+        for chat_id in self.source_chats(phone_number):
+            while self.owns(phone_number) and self.accepting:
+                try:
+                    caught_up += await self.catch_up_source(client, phone_number, chat_id, delay, limit)
+                    break
+                except FloodWaitError as e:
+                    # Lecture limitée par Telegram : reprise depuis la dernière marque
+                    print(f"⏳ Rattrapage de {chat_id} ({phone_number}) en pause {e.seconds}s (FloodWait)")
+                    await asyncio.sleep(e.seconds)
+                except asyncio.CancelledError:
+                    raise
+                except Exception as e:
+                    print(f"⚠️ Rattrapage impossible pour {chat_id} ({phone_number}): {e}")
+                    break
+        
+        if caught_up:
+            print(f"⏩ {caught_up} messages rattrapés pour {phone_number}")
+        return caught_up
+    
+    async def catch_up_source(self, client, phone_number, chat_id, delay, limit):
+        """Rattrapage d'un chat source depuis sa marque ; retourne le nombre de messages routés"""
+        last_id = self.high_water.setdefault(phone_number).get(str(chat_id))
+        if last_id is None:
+            latest = await client.get_messages(chat_id, limit=1)
+            if latest:
+                self.advance_high_water(phone_number, chat_id, latest[0].id)
+            return 0
+        
+        routed = 0
+        async for message in client.iter_messages(
+            chat_id, min_id=last_id, reverse=True, limit=limit, wait_time=CATCHUP_FETCH_WAIT
+        ):
+            if not self.owns(phone_number) or not self.accepting:
+                break
+            if getattr(message, 'action', None) is not None:
+                # Message de service (épinglage, arrivée...) : rien à rediriger
+                self.advance_high_water(phone_number, chat_id, message.id)
+                continue
+            await self.route_message(client, phone_number, message)
+            routed += 1
+            if delay:
+                await asyncio.sleep(delay)
+        return routed
+    
+    def start_catch_up(self, client, phone_number):
+        """Lance le rattrapage du compte en tâche de fond (un seul à la fois par compte)"""
+        task = self.catch_up_tasks.get(phone_number)
+        if task is not None and not task.done():
+            return task
+        task = asyncio.create_task(self.catch_up(client, phone_number))
+        self.catch_up_tasks[phone_number] = task
+        return task
+    
+    async def deliver(self, client, phone_number, dest_id, text, schedule=None):
+        """Publie un nouveau message dans la destination (au nom du canal si possible)
+        
+        Avec schedule (datetime), le message est programmé chez Telegram pour cette date.
+        """
+        # Obtenir l'entité du canal de destination
+        destination_entity = await client.get_entity(dest_id)
+        
+        # Un seul envoi, donc un seul jeton : un compte administrateur d'un canal y
+        # publie déjà au nom du canal (send_message n'a pas d'option from_peer)
+        sent_message = await self.limiter.call(phone_number, dest_id, lambda: client.send_message(
+            destination_entity,
+            text,
+            schedule=schedule,
+            silent=False
+        ))
+        if getattr(destination_entity, 'broadcast', False):
+            print(f"✅ Message authentique envoyé par canal {dest_id}")
+        else:
+            print(f"✅ Message envoyé vers groupe {dest_id}")
+        return sent_message
+    
+    def redirection_delay(self, phone_number, redirection_id):
+        """Délai (secondes) configuré par /delay pour cette redirection, 0 sinon"""
+        return float(self.delay.get(phone_number, {}).get(redirection_id, 0) or 0)
+    
+    def delay_due(self, phone_number, redirection_id, delay):
+        """Échéance d'un message différé
+        
+        Mode normal : délai compté depuis la réception. Mode étalé (delay_spread_mode) :
+        les messages d'une rafale partent à intervalle régulier de `delay` secondes.
+        """
+        now = time.time()
+        if not self.settings.get(phone_number, {}).get(redirection_id, {}).get('delay_spread_mode'):
+            return now + delay
+        previous = self.spread_until.get((phone_number, redirection_id), 0)
+        return max(now + delay, previous + delay)
+    
+    async def forward_message(self, client, phone_number, event, is_edit=False):
+        """Applique filtres et transformations puis envoie le message vers les destinations"""
+        # Vérifier les redirections pour ce numéro
+        redirections = self.redirections.get(phone_number, {})
+        
+        for redir_id, redir_data in redirections.items():
+            if not redir_data.get('active', True):
+                continue
+            
+            # Vérifier si ce chat est dans les sources
+            if event.chat_id in redir_data.get('sources', []):
+                text = event.raw_text or ''
+                
+                # Vérifier les filtres
+                if not self.should_process_message(text, phone_number, redir_id):
                     continue
                 
-                # Vérifier si ce chat est dans les sources
-                if event.chat_id in redir_data.get('sources', []):
-                    text = event.raw_text or ''
-                    
-                    # Vérifier les filtres
-                    if not self.should_process_message(text, phone_number, redir_id):
-                        continue
-                    
-                    # Appliquer les transformations
-                    processed_text = self.apply_transformations(text, phone_number, redir_id)
-                    
-                    # Envoyer vers les destinations
-                    for dest_id in redir_data.get('destinations', []):
-                        try:
-                            # Clé unique pour ce message source
-                            source_key = f"{event.chat_id}_{event.id}"
-                            
-                            if is_edit:
-                                # Message édité - essayer de modifier le message existant
-                                dest_message_id = self.message_mapping.get(source_key, {}).get(str(dest_id))
-                                if dest_message_id:
-                                    try:
-                                        # Éditer en tant que canal/groupe
-                                        await client.edit_message(
-                                            dest_id, 
-                                            dest_message_id, 
-                                            processed_text,
-                                            schedule=None
-                                        )
-                                        print(f"✅ Message édité dans {dest_id}")
-                                        continue
-                                    except Exception as e:
-                                        print(f"⚠️ Impossible d'éditer: {e}")
-                                        # Si l'édition échoue, ne pas envoyer un nouveau message
-                                        continue
+                # Appliquer les transformations
+                processed_text = self.apply_transformations(text, phone_number, redir_id)
+                
+                # Envoyer vers les destinations
+                for dest_id in redir_data.get('destinations', []):
+                    try:
+                        # Clé unique pour ce message source
+                        source_key = f"{event.chat_id}_{event.id}"
+                        
+                        if is_edit:
+                            # Message édité - essayer de modifier le message existant
+                            dest_message_id = self.message_mapping.get(phone_number, {}).get(source_key, {}).get(str(dest_id))
+                            if dest_message_id and self.breakers.is_open(phone_number, dest_id):
+                                continue
+                            # Message programmé chez Telegram : édition de la programmation, ou du
+                            # message publié (nouvel id) si l'échéance est passée
+                            schedule = None
+                            scheduled_entry = self.scheduled.get(phone_number, {}).get(f"{source_key}:{dest_id}")
+                            if dest_message_id and scheduled_entry:
+                                if scheduled_entry['at'] - time.time() >= SCHEDULE_MIN_LEAD:
+                                    schedule = datetime.fromtimestamp(scheduled_entry['at'], tz=timezone.utc)
                                 else:
-                                    # Pas de correspondance trouvée pour ce message édité
-                                    print(f"⚠️ Aucune correspondance trouvée pour édition {source_key}")
+                                    dest_message_id = await self.published_message_id(
+                                        client, phone_number, f"{source_key}:{dest_id}", dest_id
+                                    )
+                            if dest_message_id:
+                                # Contenu identique au dernier publié (édition hors texte, transformation) : rien à envoyer
+                                digests = self.message_digests.setdefault(phone_number).setdefault(source_key, {})
+                                digest = content_digest(processed_text)
+                                if digests.get(str(dest_id)) == digest:
                                     continue
-                            else:
-                                # Nouveau message - envoyer AUTHENTIQUEMENT comme le canal de destination
                                 try:
-                                    # Obtenir l'entité du canal de destination
-                                    destination_entity = await client.get_entity(dest_id)
-                                    
-                                    # CORRECTION : Envoyer comme le canal lui-même (pas le client)
-                                    if hasattr(destination_entity, 'broadcast') and destination_entity.broadcast:
-                                        # Pour un canal : Utiliser send_message avec from_peer
-                                        try:
-                                            # Envoyer comme si c'était le canal qui poste
-                                            sent_message = await client.send_message(
-                                                destination_entity,
-                                                processed_text,
-                                                silent=False,
-                                                from_peer=destination_entity  # CLEF : Envoyer AU NOM DU CANAL
-                                            )
-                                            print(f"✅ Message authentique envoyé par canal {dest_id}")
-                                        except Exception as auth_error:
-                                            print(f"⚠️ Échec authentique: {auth_error}")
-                                            # Fallback : Message normal avec indication
-                                            sent_message = await client.send_message(
-                                                destination_entity,
-                                                f"🔄 {processed_text}",
-                                                silent=False
-                                            )
-                                            print(f"✅ Message normal envoyé vers canal {dest_id}")
-                                    elif hasattr(destination_entity, 'megagroup') and destination_entity.megagroup:
-                                        # Pour un supergroupe : Tenter envoi authentique
-                                        try:
-                                            sent_message = await client.send_message(
-                                                destination_entity,
-                                                processed_text,
-                                                from_peer=destination_entity
-                                            )
-                                            print(f"✅ Message authentique envoyé par groupe {dest_id}")
-                                        except Exception:
-                                            # Fallback normal
-                                            sent_message = await client.send_message(
-                                                destination_entity,
-                                                processed_text
-                                            )
-                                            print(f"✅ Message normal envoyé vers groupe {dest_id}")
-                                    else:
-                                        # Groupe normal : envoyer normalement
-                                        sent_message = await client.send_message(
-                                            destination_entity,
-                                            processed_text
-                                        )
-                                        print(f"✅ Message envoyé vers groupe {dest_id}")
-                                    
-                                    # Sauvegarder la correspondance pour futures éditions
-                                    if source_key not in self.message_mapping:
-                                        self.message_mapping[source_key] = {}
-                                    self.message_mapping[source_key][str(dest_id)] = sent_message.id
-                                    self.save_all_data()
-                                    
+                                    # Éditer en tant que canal/groupe
+                                    await self.limiter.call(phone_number, dest_id, lambda: client.edit_message(
+                                        dest_id, 
+                                        dest_message_id, 
+                                        processed_text,
+                                        schedule=schedule
+                                    ))
+                                    print(f"✅ Message édité dans {dest_id}")
+                                    digests[str(dest_id)] = digest
+                                    self.message_digests.save_later(phone_number)
+                                    continue
+                                except MessageNotModifiedError:
+                                    digests[str(dest_id)] = digest
+                                    self.message_digests.save_later(phone_number)
+                                    continue
+                                except (FloodWaitError, SlowModeWaitError, DestinationPaused) as e:
+                                    # Destination en pause : édition renvoyée à la fin de l'attente
+                                    # (les destinations déjà à jour seront sautées par leur empreinte)
+                                    print(f"⏳ Édition vers {dest_id} reportée de {e.seconds:.0f}s")
+                                    self.edits.defer((phone_number, event.chat_id, event.id), (client, event), e.seconds)
+                                    continue
                                 except Exception as e:
-                                    print(f"❌ Erreur envoi: {e}")
-                                    try:
-                                        # Fallback: envoyer avec ID direct
-                                        sent_message = await client.send_message(dest_id, processed_text)
-                                        
-                                        if source_key not in self.message_mapping:
-                                            self.message_mapping[source_key] = {}
-                                        self.message_mapping[source_key][str(dest_id)] = sent_message.id
-                                        self.save_all_data()
-                                        
-                                        print(f"✅ Message envoyé vers {dest_id} (fallback)")
-                                    except Exception as e2:
-                                        print(f"❌ Erreur fallback: {e2}")
+                                    print(f"⚠️ Impossible d'éditer: {e}")
+                                    # Si l'édition échoue, ne pas envoyer un nouveau message
+                                    continue
+                            else:
+                                # Pas de correspondance trouvée pour ce message édité
+                                print(f"⚠️ Aucune correspondance trouvée pour édition {source_key}")
+                                continue
+                        else:
+                            # Déjà envoyé vers cette destination (rattrapage après un envoi en direct)
+                            if str(dest_id) in self.message_mapping.get(phone_number, {}).get(source_key, {}):
+                                continue
+                            
+                            delivery_key = f"{source_key}:{dest_id}"
+                            record = {'source_key': source_key, 'dest_id': dest_id, 'text': processed_text}
+                            delay = self.redirection_delay(phone_number, redir_id)
+                            if delay:
+                                due = self.delay_due(phone_number, redir_id, delay)
+                                if due - time.time() >= SERVER_SCHEDULE_AFTER:
+                                    # Délai long : message programmé chez Telegram, rien ne reste en mémoire
+                                    record.update(schedule_at=due)
+                                    self.spread_until[(phone_number, redir_id)] = due
+                                else:
+                                    # Délai court : échéance dans l'outbox, envoyé par la file d'échéances
+                                    record.update(delayed=True, attempts=0, next_attempt=due)
+                                    if self.outbox.enqueue(phone_number, delivery_key, record):
+                                        self.spread_until[(phone_number, redir_id)] = due
+                                        self.timers.schedule((phone_number, delivery_key), due)
+                                    continue
+                            
+                            # Destination en échec définitif : ni get_entity ni envoi (sauf sonde)
+                            if not self.breakers.allow(phone_number, dest_id):
+                                continue
                             
-                        except Exception as e:
-                            print(f"❌ Erreur redirection vers {dest_id}: {e}")
+                            # Envoi inscrit dans l'outbox avant d'être transmis (rejoué s'il n'est pas acquitté)
+                            if not self.outbox.enqueue(phone_number, delivery_key, record):
+                                continue
+                            record['key'] = delivery_key
+                            
+                            # Nouveau message - envoyer AUTHENTIQUEMENT comme le canal de destination
+                            try:
+                                sent_message, scheduled = await self.publish(client, phone_number, record)
+                                if sent_message is None:
+                                    continue
+                                
+                                # Acquitter l'envoi et sauvegarder la correspondance pour futures éditions
+                                self.record_sent(phone_number, record, sent_message.id, scheduled)
+                                
+                            except Exception as e:
+                                print(f"❌ Erreur envoi: {e}")
+                                # Nouvel essai planifié ou lettre morte selon la nature de l'erreur
+                                self.delivery_failed(phone_number, self.outbox.get(phone_number, delivery_key), e)
+                        
+                    except Exception as e:
+                        print(f"❌ Erreur redirection vers {dest_id}: {e}")
+    
+    async def setup_redirection_handlers(self, client, phone_number):
+        """Configure les gestionnaires de redirection pour un client TeleFeed
+        
+        Sans effet si les gestionnaires sont déjà attachés à ce client.
+        """
+        from telethon import events
+        
+        if self.routed_clients.get(phone_number) is client:
+            return
+        
+        async def message_handler(event, is_edit=False):
+            """Gestionnaire des messages pour redirection"""
+            await self.route_message(client, phone_number, event, is_edit)
         
         async def new_message_handler(event):
             """Gestionnaire spécifique pour nouveaux messages"""
@@ -302,13 +1509,31 @@ class TeleFeedManager:
         # Enregistrer les gestionnaires séparés sur ce client
         client.add_event_handler(new_message_handler, events.NewMessage)
         client.add_event_handler(edit_message_handler, events.MessageEdited)
+        self.routed_clients[phone_number] = client
         print(f"📡 Gestionnaire de redirection activé pour {phone_number} (messages + éditions)")
     
+    async def on_client_reconnected(self, phone_number, client):
+        """Appelé par le superviseur après la reconnexion d'un compte"""
+        if not await client.is_user_authorized():
+            print(f"⚠️ Session expirée pour {phone_number} après reconnexion")
+            self.clients.pop(phone_number, None)
+            self.routed_clients.pop(phone_number, None)
+            if isinstance(self.sessions.get(phone_number), dict):
+                self.sessions[phone_number]['connected'] = False
+                self.sessions[phone_number]['expired_at'] = datetime.now().isoformat()
+                self.save_all_data()
+            await client.disconnect()
+            return
+        
+        # Rattache les gestionnaires si le client a changé depuis leur installation,
+        # puis rattrape les messages publiés pendant la coupure
+        if self.client_roles.get(phone_number) != ROLE_SENDER:
+            await self.setup_redirection_handlers(client, phone_number)
+            self.start_catch_up(client, phone_number)
+    
     async def connect_account(self, phone_number, api_id, api_hash):
         """Connecte un compte Telegram avec persistance automatique"""
         try:
-            session_name = f"telefeed_{phone_number}"
-            
             # Vérifier si une session existe déjà et est valide
             if phone_number in self.sessions and self.sessions[phone_number].get('connected'):
                 if phone_number in self.clients:
@@ -316,13 +1541,14 @@ class TeleFeedManager:
                     return {'status': 'already_connected', 'client': self.clients[phone_number]}
                 
                 # Tentative de restauration de session existante
-                if os.path.exists(f"{session_name}.session"):
+                session = self.session_for(phone_number)
+                if session is not None:
                     try:
-                        client = TelegramClient(session_name, api_id, api_hash)
+                        client = TelegramClient(session, api_id, api_hash)
                         await client.connect()
                         
                         if await client.is_user_authorized():
-                            self.clients[phone_number] = client
+                            self.activate_client(phone_number, client)
                             self.sessions[phone_number]['restored_at'] = datetime.now().isoformat()
                             self.save_all_data()
                             
@@ -337,8 +1563,8 @@ class TeleFeedManager:
                     except Exception as e:
                         print(f"⚠️ Erreur lors de la restauration pour {phone_number}: {e}")
             
-            # Nouvelle connexion ou restauration échouée
-            client = TelegramClient(session_name, api_id, api_hash)
+            # Nouvelle connexion ou restauration échouée (session vierge, stockée après connexion)
+            client = TelegramClient(StringSession(), api_id, api_hash)
             await client.connect()
             
             if not await client.is_user_authorized():
@@ -351,11 +1577,12 @@ class TeleFeedManager:
                 }
             else:
                 # Déjà autorisé (session valide)
-                self.clients[phone_number] = client
+                self.activate_client(phone_number, client)
+                self.store_session(phone_number, client)
                 self.sessions[phone_number] = {
                     'connected': True,
                     'connected_at': datetime.now().isoformat(),
-                    'session_file': f"{session_name}.session"
+                    'session_storage': DATA_STORES['string_sessions']
                 }
                 self.save_all_data()
                 
@@ -374,12 +1601,12 @@ class TeleFeedManager:
             await client.sign_in(phone_number, code, phone_code_hash=phone_code_hash)
             
             # Enregistrer le client et la session
-            self.clients[phone_number] = client
-            session_name = f"telefeed_{phone_number}"
+            self.activate_client(phone_number, client)
+            self.store_session(phone_number, client)
             self.sessions[phone_number] = {
                 'connected': True,
                 'connected_at': datetime.now().isoformat(),
-                'session_file': f"{session_name}.session",
+                'session_storage': DATA_STORES['string_sessions'],
                 'verified_with_code': True
             }
             self.save_all_data()
@@ -398,12 +1625,12 @@ class TeleFeedManager:
             return {'status': 'error', 'message': str(e)}
     
     async def get_chats(self, phone_number):
-        """Récupère la liste des chats"""
-        if phone_number not in self.clients:
+        """Récupère la liste des chats (le compte est connecté à la demande si besoin)"""
+        client = await self.ensure_client(phone_number)
+        if client is None:
             return {'status': 'not_connected'}
             
         try:
-            client = self.clients[phone_number]
             chats = []
             
             async for dialog in client.iter_dialogs(limit=100):
@@ -426,26 +1653,23 @@ class TeleFeedManager:
                 
                 chats.append(chat_data)
             
-            # Sauvegarder les chats
-            self.chats[phone_number] = chats
-            self.save_all_data()
+            # Sauvegarder les chats (partition du compte uniquement)
+            self.chats.set(phone_number, chats)
             
             return {'status': 'success', 'chats': chats}
             
         except Exception as e:
             return {'status': 'error', 'message': str(e)}
     
-    def add_redirection(self, phone_number, redirection_id, sources, destinations):
-        """Ajoute une redirection"""
+    def add_redirection(self, phone_number, redirection_id, sources, destinations, owner=None):
+        """Ajoute une redirection (owner : utilisateur prévenu si une destination devient injoignable)"""
         try:
-            if phone_number not in self.redirections:
-                self.redirections[phone_number] = {}
-            
-            self.redirections[phone_number][redirection_id] = {
+            self.redirections.setdefault(phone_number)[redirection_id] = {
                 'sources': sources,
                 'destinations': destinations,
                 'created_at': datetime.now().isoformat(),
-                'active': True
+                'active': True,
+                'owner': owner
             }
             
             # Paramètres par défaut
@@ -463,6 +1687,7 @@ class TeleFeedManager:
                 'delay_spread_mode': False
             }
             
+            self.redirections.save(phone_number)
             self.save_all_data()
             return True
             
@@ -473,8 +1698,10 @@ class TeleFeedManager:
     def remove_redirection(self, phone_number, redirection_id):
         """Supprime une redirection"""
         try:
-            if phone_number in self.redirections and redirection_id in self.redirections[phone_number]:
-                del self.redirections[phone_number][redirection_id]
+            redirections = self.redirections.get(phone_number, {})
+            if redirection_id in redirections:
+                del redirections[redirection_id]
+                self.redirections.save(phone_number)
                 
             if phone_number in self.settings and redirection_id in self.settings[phone_number]:
                 del self.settings[phone_number][redirection_id]
@@ -484,6 +1711,34 @@ class TeleFeedManager:
         except:
             return False
     
+    def accounts_with_redirection(self, redirection_id, phone_number=None):
+        """Comptes ayant une redirection de ce nom (ou ce seul compte s'il est précisé)"""
+        if not phone_number:
+            self.reload_sessions()
+        phones = [phone_number] if phone_number else list(self.sessions)
+        return [phone for phone in phones if redirection_id in self.redirections.get(phone, {})]
+    
+    def set_delay(self, redirection_id, seconds, phone_number=None):
+        """Délai d'envoi d'une redirection (0 pour le supprimer) ; retourne les comptes concernés"""
+        phones = self.accounts_with_redirection(redirection_id, phone_number)
+        for phone in phones:
+            if seconds:
+                self.delay.setdefault(phone, {})[redirection_id] = seconds
+            else:
+                self.delay.get(phone, {}).pop(redirection_id, None)
+        if phones:
+            save_store_data('delay', self.delay)
+        return phones
+    
+    def set_spread_mode(self, redirection_id, enabled, phone_number=None):
+        """Mode étalé d'une redirection (paramètre delay_spread_mode)"""
+        phones = self.accounts_with_redirection(redirection_id, phone_number)
+        for phone in phones:
+            self.settings.setdefault(phone, {}).setdefault(redirection_id, {})['delay_spread_mode'] = enabled
+        if phones:
+            save_store_data('settings', self.settings)
+        return phones
+    
     def apply_transformations(self, text, phone_number, redirection_id):
         """Applique les transformations sur le texte"""
         if not text:
@@ -578,6 +1833,7 @@ class TeleFeedManager:
     
     def get_session_status(self, phone_number=None):
         """Récupère le statut des sessions"""
+        self.reload_sessions()
         if phone_number:
             # Statut d'une session spécifique
             session_data = self.sessions.get(phone_number, {})
@@ -585,6 +1841,8 @@ class TeleFeedManager:
             return {
                 'phone_number': phone_number,
                 'connected': is_connected,
+                'dormant': not is_connected and bool(session_data.get('connected')),
+                'role': self.account_role(phone_number),
                 'session_data': session_data,
                 'has_client': is_connected
             }
@@ -600,6 +1858,8 @@ class TeleFeedManager:
                 is_connected = phone in self.clients
                 status['sessions'][phone] = {
                     'connected': is_connected,
+                    'dormant': not is_connected and isinstance(session_data, dict) and bool(session_data.get('connected')),
+                    'role': self.account_role(phone),
                     'session_data': session_data,
                     'has_client': is_connected
                 }
@@ -612,6 +1872,9 @@ telefeed_manager = TeleFeedManager()
 async def register_all_handlers(bot, ADMIN_ID, api_id, api_hash):
     """Enregistre tous les handlers TeleFeed et les redirections."""
     
+    # Alertes TeleFeed (destination injoignable...) envoyées par le bot ; admin par défaut
+    telefeed_manager.notifier = lambda user_id, text: bot.send_message(user_id or ADMIN_ID, text)
+    
     @bot.on(events.NewMessage(pattern=r'/connect (\d+)'))
     async def connect_handler(event):
         """Handler pour connecter un compte"""
@@ -623,22 +1886,20 @@ async def register_all_handlers(bot, ADMIN_ID, api_id, api_hash):
         
         await event.reply("🔌 Connexion en cours...")
         
-        result = await telefeed_manager.connect_account(phone_number, api_id, api_hash)
+        # Connexion dans le processus propriétaire du compte ; la connexion en attente
+        # du code y reste (elle expire et se déconnecte si elle est abandonnée)
+        result = await telefeed_manager.dispatch(
+            phone_number, 'begin_login', event.sender_id, phone_number, api_id, api_hash
+        )
         
         if result['status'] == 'code_sent':
+            telefeed_manager.login_routes[event.sender_id] = phone_number
             await event.reply(
                 f"📱 Code d'authentification envoyé à {phone_number}\n"
                 f"💡 Répondez avec: aa + votre code\n"
                 f"📝 Exemple: aa12345"
             )
             
-            # Stocker temporairement les données de connexion
-            telefeed_manager.sessions[f"temp_{phone_number}"] = {
-                'phone_code_hash': result['phone_code_hash'],
-                'client': result['client'],
-                'user_id': event.sender_id
-            }
-            
         elif result['status'] == 'connected':
             await event.reply(f"✅ Compte {phone_number} connecté avec succès!")
             
@@ -677,34 +1938,29 @@ async def register_all_handlers(bot, ADMIN_ID, api_id, api_hash):
         
         code = event.pattern_match.group(1)
         
-        # Rechercher la session temporaire pour cet utilisateur
-        temp_session = None
-        phone_number = None
-        
-        for key, session in telefeed_manager.sessions.items():
-            if key.startswith("temp_") and session.get('user_id') == event.sender_id:
-                temp_session = session
-                phone_number = key.replace("temp_", "")
-                break
-        
-        if not temp_session:
+        # Connexion en attente de cet utilisateur (dans le processus propriétaire du compte)
+        phone_number = telefeed_manager.login_routes.get(event.sender_id)
+        if phone_number is None:
             await event.reply("❌ Aucune connexion en attente trouvée.")
             return
         
-        result = await telefeed_manager.verify_code(
-            phone_number, code, 
-            temp_session['phone_code_hash'], 
-            temp_session['client']
-        )
+        result = await telefeed_manager.dispatch(phone_number, 'complete_login', event.sender_id, code)
+        
+        if result['status'] in ('connected', 'code_expired', 'no_pending'):
+            telefeed_manager.login_routes.pop(event.sender_id, None)
         
         if result['status'] == 'connected':
             await event.reply(f"✅ Compte {phone_number} connecté avec succès!")
-            # Nettoyer la session temporaire
-            del telefeed_manager.sessions[f"temp_{phone_number}"]
+            
+        elif result['status'] == 'no_pending':
+            await event.reply("❌ Aucune connexion en attente trouvée.")
             
         elif result['status'] == 'password_needed':
             await event.reply("🔐 Authentification 2FA requise. Envoyez votre mot de passe.")
             
+        elif result['status'] == 'code_expired':
+            await event.reply(f"⏰ Code expiré. Recommencez avec /connect {phone_number}")
+            
         else:
             await event.reply(f"❌ Erreur: {result.get('message', 'Code invalide')}")
     
@@ -715,18 +1971,27 @@ async def register_all_handlers(bot, ADMIN_ID, api_id, api_hash):
             return
         
         status = telefeed_manager.get_session_status()
+        pending_logins = len(telefeed_manager.pending_auth)
+        
+        # Avec la répartition en workers, les clients sont dans les autres processus
+        if telefeed_manager.router is not None:
+            connected = set()
+            for phones in await telefeed_manager.dispatch_all('connected_accounts'):
+                connected.update(phones)
+            status['active_clients'] = len(connected)
+            for phone, session_info in status['sessions'].items():
+                session_info['connected'] = phone in connected
+            pending_logins = len(telefeed_manager.login_routes)
         
         message = "📊 **STATUT DES SESSIONS TELEFEED**\n\n"
         message += f"📈 **Résumé:**\n"
         message += f"• Sessions enregistrées: {status['total_sessions']}\n"
-        message += f"• Clients actifs: {status['active_clients']}\n\n"
+        message += f"• Clients actifs: {status['active_clients']}\n"
+        message += f"• Connexions en attente du code: {pending_logins}\n\n"
         
         if status['sessions']:
             message += "📱 **Détails des sessions:**\n\n"
             for phone, session_info in status['sessions'].items():
-                if phone.startswith('temp_'):
-                    continue  # Ignorer les sessions temporaires
-                    
                 icon = "✅" if session_info['connected'] else "❌"
                 message += f"{icon} **{phone}**\n"
                 
@@ -749,6 +2014,89 @@ async def register_all_handlers(bot, ADMIN_ID, api_id, api_hash):
         
         await event.reply(message, parse_mode='markdown')
     
+    @bot.on(events.NewMessage(pattern=r'^/shards(?:\s+(rebalance))?$'))
+    async def shards_handler(event):
+        """Handler pour la répartition des comptes entre workers (admin seulement)"""
+        if event.sender_id != ADMIN_ID:
+            return
+        
+        router = telefeed_manager.router
+        if router is None:
+            await event.reply("ℹ️ Répartition désactivée (SHARD_WORKERS=0) : tous les comptes sont dans ce processus.")
+            return
+        
+        telefeed_manager.reload_sessions()
+        phones = list(telefeed_manager.sessions)
+        # Charge d'un compte = nombre de redirections actives
+        weights = {
+            phone: sum(1 for redir_data in telefeed_manager.redirections.get(phone, {}).values()
+                       if redir_data.get('active', True))
+            for phone in phones
+        }
+        
+        message = "🧩 **RÉPARTITION DES COMPTES**\n\n"
+        if event.pattern_match.group(1):
+            moves = await router.rebalance(weights)
+            message += f"🔀 Comptes déplacés: {len(moves)}\n"
+            for phone, old_shard, new_shard in moves:
+                message += f"• {phone}: worker {old_shard} → {new_shard}\n"
+            message += "\n"
+        
+        status = router.status()
+        for shard, members in router.map.assignments(phones).items():
+            info = status.get(shard, {})
+            icon = "✅" if info.get('alive') else "❌"
+            message += (f"{icon} **Worker {shard}** (pid {info.get('pid')}, redémarrages {info.get('restarts', 0)})\n"
+                        f"   Comptes: {len(members)}, redirections actives: {sum(weights[phone] for phone in members)}\n")
+        
+        message += "\n💡 `/shards rebalance` pour équilibrer la charge"
+        await event.reply(message, parse_mode='markdown')
+    
+    @bot.on(events.NewMessage(pattern=r'^/deadletters(?:\s+(replay|clear)(?:\s+(\w+))?)?$'))
+    async def dead_letters_handler(event):
+        """Handler pour les envois abandonnés : liste, nouvel essai ou suppression (admin seulement)"""
+        if event.sender_id != ADMIN_ID:
+            return
+        
+        if telefeed_manager.router is not None or telefeed_manager.leases is not None:
+            # Lettres mortes écrites par les workers ou les autres nœuds
+            store.backend.invalidate()
+        letters = telefeed_manager.dead_letters.all()
+        action, target = event.pattern_match.group(1), event.pattern_match.group(2)
+        
+        if action == 'clear':
+            cleared = sum(await telefeed_manager.dispatch_all('clear_dead_letters'))
+            await event.reply(f"🗑️ {cleared} lettre(s) morte(s) supprimée(s)")
+            return
+        
+        if action == 'replay':
+            if not target:
+                await event.reply("❌ Usage: `/deadletters replay <id|all>`", parse_mode='markdown')
+                return
+            selected = list(letters) if target == 'all' else [target]
+            replayed = 0
+            for letter_id in selected:
+                letter = letters.get(letter_id)
+                if letter is None:
+                    await event.reply(f"❌ Lettre morte `{letter_id}` introuvable", parse_mode='markdown')
+                    continue
+                if await telefeed_manager.dispatch(letter['phone_number'], 'replay_dead_letter', letter_id):
+                    replayed += 1
+            await event.reply(f"🔁 {replayed} envoi(s) remis en file pour un nouvel essai")
+            return
+        
+        if not letters:
+            await event.reply("✅ Aucune lettre morte")
+            return
+        
+        message = f"☠️ **LETTRES MORTES** ({len(letters)})\n\n"
+        for letter_id, letter in list(letters.items())[-20:]:
+            message += (f"• `{letter_id}` {letter['phone_number']} → {letter['dest_id']} "
+                        f"[{letter['kind']}, {letter['attempts']} essai(s)]\n"
+                        f"   {letter['error'][:120]}\n")
+        message += "\n💡 `/deadletters replay <id|all>` pour renvoyer, `/deadletters clear` pour vider"
+        await event.reply(message, parse_mode='markdown')
+    
     @bot.on(events.NewMessage(pattern=r'/permissions (-?\d+)'))
     async def check_permissions_handler(event):
         """Handler pour vérifier les permissions dans un canal (admin seulement)"""
@@ -758,28 +2106,9 @@ async def register_all_handlers(bot, ADMIN_ID, api_id, api_hash):
         try:
             channel_id = int(event.pattern_match.group(1))
             
-            # Vérifier les permissions pour tous les comptes connectés
+            # Vérifier les permissions pour tous les comptes connectés (dans chaque processus)
             report = "🔧 **Vérification des permissions**\n\n"
-            
-            for phone_number, client in telefeed_manager.clients.items():
-                try:
-                    # Obtenir l'entité du canal
-                    channel = await client.get_entity(channel_id)
-                    
-                    # Vérifier les permissions
-                    permissions = await client.get_permissions(channel)
-                    me = await client.get_me()
-                    
-                    report += f"📱 **{phone_number}** ({me.first_name})\n"
-                    report += f"Canal : {channel.title}\n"
-                    report += f"Type : {'Canal' if channel.broadcast else 'Groupe'}\n"
-                    report += f"• Publier messages : {'✅' if permissions.post_messages else '❌'}\n"
-                    report += f"• Modifier messages : {'✅' if permissions.edit_messages else '❌'}\n"
-                    report += f"• Supprimer messages : {'✅' if permissions.delete_messages else '❌'}\n"
-                    report += f"• Admin : {'✅' if permissions.is_admin else '❌'}\n\n"
-                    
-                except Exception as e:
-                    report += f"📱 **{phone_number}** - ❌ Erreur : {e}\n\n"
+            report += "".join(await telefeed_manager.dispatch_all('check_permissions', channel_id))
             
             await event.reply(report, parse_mode='markdown')
             
@@ -833,7 +2162,7 @@ async def register_all_handlers(bot, ADMIN_ID, api_id, api_hash):
         
         await event.reply("**Getting Chats!**\nPlease wait...")
         
-        result = await telefeed_manager.get_chats(phone_number)
+        result = await telefeed_manager.dispatch(phone_number, 'get_chats', phone_number)
         
         if result['status'] == 'success':
             chats = result['chats']
@@ -968,7 +2297,9 @@ async def register_all_handlers(bot, ADMIN_ID, api_id, api_hash):
             sources = [int(x.strip()) for x in parts[0].split(',')]
             destinations = [int(x.strip()) for x in parts[1].split(',')]
             
-            if telefeed_manager.add_redirection(phone_number, redirection_id, sources, destinations):
+            if telefeed_manager.add_redirection(phone_number, redirection_id, sources, destinations, event.sender_id):
+                # Le compte doit être connecté pour recevoir les messages des sources
+                await telefeed_manager.dispatch(phone_number, 'refresh_account', phone_number)
                 await event.reply(f"✅ Redirection **{redirection_id}** créée avec succès!")
             else:
                 await event.reply("❌ Erreur lors de la création de la redirection.")
@@ -989,6 +2320,7 @@ async def register_all_handlers(bot, ADMIN_ID, api_id, api_hash):
         phone_number = event.pattern_match.group(2)
         
         if telefeed_manager.remove_redirection(phone_number, redirection_id):
+            await telefeed_manager.dispatch(phone_number, 'refresh_account', phone_number)
             await event.reply(f"✅ Redirection **{redirection_id}** supprimée.")
         else:
             await event.reply("❌ Redirection non trouvée.")
@@ -1021,6 +2353,71 @@ async def register_all_handlers(bot, ADMIN_ID, api_id, api_hash):
         
         await event.reply(message, parse_mode='markdown')
     
+    @bot.on(events.NewMessage(pattern=r'(?s)^/schedule (\d+) (-?\d+) (.+?)(?:\s+every\s+(\w+))?\s*\|\s*(.+)$'))
+    async def schedule_post_handler(event):
+        """Handler pour programmer une publication ponctuelle ou récurrente"""
+        if not is_user_authorized(event.sender_id):
+            await event.reply("❌ Vous devez avoir une licence active pour utiliser TeleFeed.")
+            return
+        
+        phone_number, dest_id, when, every, text = event.pattern_match.groups()
+        due_at = parse_post_time(when)
+        if due_at is None:
+            await event.reply("❌ Date invalide. Utilisez `+30m`, `HH:MM` ou `AAAA-MM-JJ HH:MM`.", parse_mode='markdown')
+            return
+        interval = None
+        if every:
+            interval = parse_duration(every)
+            if interval is None or interval < 60:
+                await event.reply("❌ Intervalle invalide (minimum `1m`). Exemple : `every 1d`", parse_mode='markdown')
+                return
+        
+        try:
+            post_id = telefeed_manager.schedule_post(
+                event.sender_id, phone_number, int(dest_id), text.strip(), due_at, interval
+            )
+        except ValueError as e:
+            await event.reply(f"❌ {e}")
+            return
+        await telefeed_manager.dispatch(phone_number, 'wake_posts')
+        
+        moment = datetime.fromtimestamp(due_at).strftime('%d/%m/%Y %H:%M')
+        repeat = f", puis toutes les {every}" if interval else ""
+        await event.reply(f"⏰ Publication **{post_id}** programmée le {moment}{repeat} vers `{dest_id}`.", parse_mode='markdown')
+    
+    @bot.on(events.NewMessage(pattern=r'^/schedules$'))
+    async def list_posts_handler(event):
+        """Handler pour lister les publications programmées de l'utilisateur"""
+        if not is_user_authorized(event.sender_id):
+            await event.reply("❌ Vous devez avoir une licence active pour utiliser TeleFeed.")
+            return
+        
+        posts = telefeed_manager.posts.list(event.sender_id)
+        if not posts:
+            await event.reply("📭 Aucune publication programmée")
+            return
+        
+        message = f"⏰ **Publications programmées** ({len(posts)})\n\n"
+        for post in posts[:30]:
+            moment = datetime.fromtimestamp(post['due_at']).strftime('%d/%m/%Y %H:%M')
+            repeat = f" (toutes les {int(post['every'] // 60)} min)" if post['every'] else ""
+            message += f"• `{post['id']}` {moment}{repeat} {post['phone']} → `{post['dest_id']}`\n   {post['text'][:60]}\n"
+        message += "\n💡 `/unschedule <id>` pour annuler"
+        await event.reply(message, parse_mode='markdown')
+    
+    @bot.on(events.NewMessage(pattern=r'^/unschedule (\d+)$'))
+    async def cancel_post_handler(event):
+        """Handler pour annuler une publication programmée"""
+        if not is_user_authorized(event.sender_id):
+            await event.reply("❌ Vous devez avoir une licence active pour utiliser TeleFeed.")
+            return
+        
+        post_id = event.pattern_match.group(1)
+        if telefeed_manager.posts.cancel(post_id, event.sender_id):
+            await event.reply(f"✅ Publication **{post_id}** annulée.")
+        else:
+            await event.reply("❌ Publication non trouvée.")
+    
     @bot.on(events.NewMessage(pattern=r'/transformation add (\w+) (\w+) on (\d+)'))
     async def add_transformation_handler(event):
         """Handler pour ajouter une transformation"""
@@ -1083,6 +2480,7 @@ async def register_all_handlers(bot, ADMIN_ID, api_id, api_hash):
                 }
             
             telefeed_manager.save_all_data()
+            await telefeed_manager.dispatch(phone_number, 'refresh_account', phone_number)
             await event.reply(f"✅ Transformation **{feature}** configurée pour **{redirection_id}**!")
             
         except asyncio.TimeoutError:
@@ -1130,6 +2528,7 @@ async def register_all_handlers(bot, ADMIN_ID, api_id, api_hash):
             }
             
             telefeed_manager.save_all_data()
+            await telefeed_manager.dispatch(phone_number, 'refresh_account', phone_number)
             await event.reply(f"✅ Whitelist configurée pour **{redirection_id}**!")
             
         except asyncio.TimeoutError:
@@ -1177,6 +2576,7 @@ async def register_all_handlers(bot, ADMIN_ID, api_id, api_hash):
             }
             
             telefeed_manager.save_all_data()
+            await telefeed_manager.dispatch(phone_number, 'refresh_account', phone_number)
             await event.reply(f"✅ Blacklist configurée pour **{redirection_id}**!")
             
         except asyncio.TimeoutError:
@@ -1248,7 +2648,9 @@ async def register_all_handlers(bot, ADMIN_ID, api_id, api_hash):
                         # Envoyer vers les destinations
                         for dest_id in redir_data.get('destinations', []):
                             try:
-                                await client.send_message(dest_id, processed_text)
+                                await telefeed_manager.limiter.call(
+                                    phone_number, dest_id, lambda: client.send_message(dest_id, processed_text)
+                                )
                             except Exception as e:
                                 print(f"Erreur lors de l'envoi vers {dest_id}: {e}")
     
@@ -1259,7 +2661,7 @@ async def register_all_handlers(bot, ADMIN_ID, api_id, api_hash):
         await handle_message_redirection(event)
     
     # Commande /export - Envoie tous les fichiers du projet (admin)
-    @bot.on(events.NewMessage(pattern='/export'))
+    @bot.on(events.NewMessage(pattern=r'^/export$'))
     async def export_command(event):
         user_id = str(event.sender_id)
         if user_id not in ADMIN_IDS:
@@ -1313,6 +2715,47 @@ async def register_all_handlers(bot, ADMIN_ID, api_id, api_hash):
             await event.respond(f"❌ Erreur lors de l'export: {str(e)}")
             print(f"Erreur export: {e}")
 
+    # Commande /exportjson - Export lisible (JSON indenté) de toutes les données (admin)
+    @bot.on(events.NewMessage(pattern=r'^/exportjson$'))
+    async def export_json_command(event):
+        user_id = str(event.sender_id)
+        if user_id not in ADMIN_IDS:
+            await event.respond("❌ Accès refusé")
+            return
+        
+        await event.respond("📦 Préparation de l'export lisible des données...")
+        
+        import zipfile
+        import tempfile
+        
+        try:
+            now = datetime.now()
+            export_name = f"telefoot_data_{now.strftime('%Y%m%d_%H%M%S')}.zip"
+            
+            with tempfile.NamedTemporaryFile(suffix='.zip', delete=False) as tmp_zip:
+                zip_path = tmp_zip.name
+            
+            # Les fichiers sur disque sont compacts : on les réindente uniquement pour l'export
+            with zipfile.ZipFile(zip_path, 'w', zipfile.ZIP_DEFLATED) as zipf:
+                for filename, content in store.export_pretty().items():
+                    zipf.writestr(filename, content)
+            
+            await event.respond(
+                f"📁 **Export des données TeleFoot Bot**\n\n"
+                f"📅 Date: {now.strftime('%d/%m/%Y %H:%M:%S')}\n"
+                f"📝 JSON indenté, un fichier par magasin",
+                file=zip_path,
+                attributes=[
+                    ('DocumentAttributeFilename', {'file_name': export_name})
+                ]
+            )
+            
+            os.unlink(zip_path)
+            
+        except Exception as e:
+            await event.respond(f"❌ Erreur lors de l'export: {str(e)}")
+            print(f"Erreur export JSON: {e}")
+
     # Commande /files - Liste tous les fichiers du projet (admin)
     @bot.on(events.NewMessage(pattern='/files'))
     async def files_command(event):
@@ -1392,6 +2835,7 @@ async def register_all_handlers(bot, ADMIN_ID, api_id, api_hash):
                 'telefeed_chats.json',
                 'telefeed_delay.json',
                 'telefeed_message_mapping.json',
+                'telefeed_dead_letters.json',
                 'users.json',
                 'redirections.json',
                 'filters.json',
@@ -1403,6 +2847,15 @@ async def register_all_handlers(bot, ADMIN_ID, api_id, api_hash):
                 'telefeed_commands.py'
             ]
             
+            # Partitions par compte (redirections, chats, mapping des messages)
+            for root, _, files in os.walk(TELEFEED_ACCOUNTS_DIR):
+                config_files.extend(os.path.join(root, name) for name in sorted(files))
+            
+            # Base SQLite du stockage unifié (WAL reporté dans le fichier principal)
+            if STORAGE_BACKEND == 'sqlite':
+                store.backend.checkpoint()
+                config_files.append(STORAGE_DB_FILE)
+            
             # Créer l'archive avec les fichiers de configuration
             with zipfile.ZipFile(zip_path, 'w', zipfile.ZIP_DEFLATED) as zipf:
                 for file in config_files:
@@ -0,0 +1,205 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+File d'échéances TeleFeed : envois différés (délai des redirections) et nouveaux essais
+Un tas trié par échéance et une seule tâche qui dort jusqu'à la plus proche : des
+milliers de messages en attente ne coûtent pas une tâche asyncio chacun. Les
+échéances elles-mêmes sont dans l'outbox (reprises au démarrage) ; la file n'en est
+que l'index en mémoire.
+
+EditCoalescer regroupe sur la même file les éditions rapprochées d'un message source
+(scores en direct, signaux) : seule la dernière version de chaque fenêtre est envoyée.
+"""
+
+import asyncio
+import heapq
+import itertools
+import logging
+import os
+import time
+
+logger = logging.getLogger(__name__)
+
+# Fenêtre (secondes) de regroupement des éditions d'un même message source (0 : désactivé)
+EDIT_DEBOUNCE = float(os.getenv('EDIT_DEBOUNCE', '2'))
+
+class TimerQueue:
+    """Échéances par clé ; replanifier une clé remplace son échéance précédente"""
+
+    def __init__(self):
+        self._heap = []
+        self._seq = itertools.count()
+        # clé -> échéance en vigueur (les entrées du tas qui ne correspondent plus sont ignorées)
+        self._due = {}
+        self._wakeup = None
+        self.fired = 0
+
+    def _event(self):
+        if self._wakeup is None:
+            self._wakeup = asyncio.Event()
+        return self._wakeup
+
+    def schedule(self, key, when):
+        if self._due.get(key) == when:
+            return
+        self._due[key] = when
+        heapq.heappush(self._heap, (when, next(self._seq), key))
+        if self._heap[0][2] == key:
+            # Nouvelle échéance la plus proche : réveiller la boucle
+            self._event().set()
+
+    def cancel(self, key):
+        self._due.pop(key, None)
+
+    def next_due(self):
+        while self._heap:
+            when, _, key = self._heap[0]
+            if self._due.get(key) == when:
+                return when
+            heapq.heappop(self._heap)
+        return None
+
+    def pop_due(self, now):
+        """Clés dont l'échéance est passée, de la plus ancienne à la plus récente"""
+        keys = []
+        while self._heap and self._heap[0][0] <= now:
+            when, _, key = heapq.heappop(self._heap)
+            if self._due.get(key) == when:
+                del self._due[key]
+                keys.append(key)
+        return keys
+
+    def __len__(self):
+        return len(self._due)
+
+    async def run(self, fire, resync=None, resync_interval=300):
+        """Boucle unique : fire(clé) est lancé à chaque échéance
+
+        resync() réinscrit les échéances depuis leur stockage (démarrage, comptes repris).
+        """
+        wakeup = self._event()
+        next_resync = 0
+        while True:
+            now = time.time()
+            if resync is not None and now >= next_resync:
+                try:
+                    resync()
+                except Exception as e:
+                    logger.error(f"Erreur de resynchronisation des échéances: {e}")
+                next_resync = now + resync_interval
+
+            for key in self.pop_due(now):
+                self.fired += 1
+                fire(key)
+
+            due = self.next_due()
+            timeout = next_resync - time.time() if resync is not None else None
+            if due is not None:
+                timeout = due - time.time() if timeout is None else min(timeout, due - time.time())
+            wakeup.clear()
+            try:
+                await asyncio.wait_for(wakeup.wait(), None if timeout is None else max(0.0, timeout))
+            except asyncio.TimeoutError:
+                pass
+
+    def snapshot(self):
+        """État pour /status ; lecture seule (appelable depuis le thread Flask, sans toucher au tas)"""
+        due = min(list(self._due.values()), default=None)
+        return {
+            'pending': len(self),
+            'fired': self.fired,
+            'next_in': None if due is None else max(0, round(due - time.time())),
+        }
+
+class EditCoalescer:
+    """Éditions par message source : une seule par fenêtre, avec le dernier contenu reçu
+
+    submit(clé, édition) retient l'édition ; à la fin de la fenêtre ouverte par la
+    première, process(clé, édition) reçoit la plus récente et les précédentes sont
+    abandonnées. Une édition encore en cours d'envoi repousse la suivante d'une
+    fenêtre (pas de version ancienne publiée après une plus récente). defer(clé,
+    édition, délai) renvoie une édition refusée (FloodWait) à la fin de l'attente.
+    """
+
+    def __init__(self, process, window=EDIT_DEBOUNCE):
+        self.process = process
+        self.window = window
+        self.timers = TimerQueue()
+        self.pending = {}
+        self.running = set()
+        self.coalesced = 0
+        self.sent = 0
+        self._task = None
+        # Envois en cours (attendus par flush avant les éditions restantes)
+        self._sends = set()
+
+    def submit(self, key, edit):
+        """Retient l'édition ; False si le regroupement est désactivé (à traiter tout de suite)"""
+        if self.window <= 0:
+            return False
+        self._start()
+        if key in self.pending:
+            # Version remplacée avant son envoi
+            self.coalesced += 1
+        else:
+            self.timers.schedule(key, time.time() + self.window)
+        self.pending[key] = edit
+        return True
+
+    def defer(self, key, edit, delay):
+        """Édition refusée par Telegram : renvoyée après `delay` secondes
+
+        Une version plus récente déjà en attente est conservée et partira à cette échéance.
+        """
+        self._start()
+        self.pending.setdefault(key, edit)
+        self.timers.schedule(key, time.time() + delay)
+
+    def _start(self):
+        if self._task is None or self._task.done():
+            self._task = asyncio.ensure_future(self.timers.run(self._fire))
+
+    def _fire(self, key):
+        if key in self.running:
+            self.timers.schedule(key, time.time() + max(self.window, 1))
+            return
+        edit = self.pending.pop(key, None)
+        if edit is None:
+            return
+        self.sent += 1
+        self.running.add(key)
+        task = asyncio.ensure_future(self._send(key, edit))
+        self._sends.add(task)
+        task.add_done_callback(self._sends.discard)
+
+    async def _send(self, key, edit):
+        try:
+            await self.process(key, edit)
+        except Exception as e:
+            logger.error(f"Erreur d'envoi de l'édition {key}: {e}")
+        finally:
+            self.running.discard(key)
+
+    async def flush(self):
+        """Arrêt : termine les envois en cours, puis envoie sans attendre les éditions en attente
+
+        Les envois en cours passent d'abord : une version plus ancienne ne peut pas
+        être publiée après la plus récente.
+        """
+        if self._task is not None:
+            self._task.cancel()
+        while self._sends:
+            await asyncio.gather(*list(self._sends), return_exceptions=True)
+        pending, self.pending = self.pending, {}
+        for key in pending:
+            self.timers.cancel(key)
+            self.running.add(key)
+        self.sent += len(pending)
+        await asyncio.gather(*(self._send(key, edit) for key, edit in pending.items()))
+
+    def snapshot(self):
+        return {
+            'pending': len(self.pending),
+            'coalesced': self.coalesced,
+            'sent': self.sent,
+        }
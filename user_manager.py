@@ -1,8 +1,8 @@
-import json
 import datetime
 import uuid
 from typing import Dict, Any, Tuple, Optional
-from config import USERS_FILE, PLANS
+from config import PLANS
+from store import store
 
 class UserManager:
     """Gestionnaire des utilisateurs et licences"""
@@ -11,21 +11,13 @@ class UserManager:
         self.users = self.load_users()
     
     def load_users(self) -> Dict[str, Any]:
-        """Charge les utilisateurs depuis le fichier JSON"""
-        try:
-            with open(USERS_FILE, 'r', encoding='utf-8') as f:
-                return json.load(f)
-        except FileNotFoundError:
-            return {}
-        except json.JSONDecodeError:
-            print(f"Erreur de lecture du fichier {USERS_FILE}, création d'un nouveau fichier")
-            return {}
+        """Charge les utilisateurs depuis le stockage"""
+        return store.users.all()
     
     def save_users(self) -> None:
-        """Sauvegarde les utilisateurs dans le fichier JSON"""
+        """Sauvegarde les utilisateurs dans le stockage"""
         try:
-            with open(USERS_FILE, 'w', encoding='utf-8') as f:
-                json.dump(self.users, f, indent=2, ensure_ascii=False)
+            store.users.save_all(self.users)
         except Exception as e:
             print(f"Erreur lors de la sauvegarde : {e}")
     